@@ -8,8 +8,8 @@ from app.dependencies import DB_SESSION_DEPENDENCY
 from app.models.base_models import User
 from app.models.auth import UserCreate, UserOut, Token
 from app.core.security import (
-    get_password_hash,
-    verify_password,
+    hash_password_async,
+    verify_password_async,
     create_access_token,
 )
 
@@ -37,7 +37,7 @@ async def register_user(
     user = User(
         id=str(uuid.uuid4()),
         email=user_data.email,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=await hash_password_async(user_data.password),
         is_active=True,
     )
 
@@ -64,12 +64,21 @@ async def login_for_access_token(
     result = await db.execute(select(User).filter(User.email == form_data.username))
     user = result.scalars().first()
 
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await verify_password_async(form_data.password, user.hashed_password)
+
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Identifiants invalides",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    # Coût bcrypt modifié depuis le dernier hachage : ré-hachage transparent
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+
     token = create_access_token({"sub": user.id})
     return {"access_token": token, "token_type": "bearer"}
\ No newline at end of file
@@ -1,14 +1,70 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, status, Path
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, status, Path, Query, BackgroundTasks, Header, Request
+from fastapi.responses import Response, StreamingResponse
 from typing import Annotated, List, Optional
+from urllib.parse import quote
 from pydantic import Field
+from sqlalchemy import delete, update
 from sqlalchemy.future import select
 
 from app.services.ocr_service import process_ocr_and_ai
-from app.services.storage_service import create_presigned_url, delete_file_from_s3
-from app.core.security import get_current_user_from_token
+from app.services.storage_service import (
+    GZIP,
+    IDENTITY,
+    WEBP,
+    iter_file_chunks,
+)
+from app.services.deletion_service import purge_files, schedule_file_deletions
+from app.services.tiering_service import (
+    COLD,
+    open_document_file,
+    read_document_original,
+    record_access,
+    restore_document,
+)
+from app.services.analytics_service import get_upcoming_deadlines, get_amounts_by_type
+from app.services.export_service import export_response
+from app.services.change_service import (
+    CHANGES_PAGE_SIZE,
+    DELETE,
+    UPSERT,
+    ExpiredSyncToken,
+    decode_token,
+    encode_token,
+    list_changes,
+    record_changes,
+)
+from app.services.stats_service import (
+    StatsDelta,
+    UNKNOWN_TYPE,
+    apply_stats_delta,
+    document_stats,
+    sum_stats,
+    get_user_stats,
+)
+from app.core.security import get_current_user_from_token, get_optional_user
+from app.core.rate_limit import RateLimitExceeded, caller_key, check_scan_budgets, too_many_requests
+from app.core.serialization import ModelSerializer
+from app.core.compression import accepts_encoding
+from app.core.http_cache import (
+    RangeNotSatisfiable,
+    document_etag,
+    etag_matches,
+    file_etag,
+    parse_range,
+)
 from app.dependencies import DB_SESSION_DEPENDENCY
 
-from app.models.document_analysis import DocumentResponse, DocumentUpdate
+from app.models.document_analysis import (
+    DocumentResponse,
+    DocumentUpdate,
+    UpcomingDeadline,
+    AmountsByType,
+    DocumentSelection,
+    DocumentBulkUpdate,
+    BulkOperationResult,
+    DashboardStats,
+    DocumentChangesPage,
+)
 from app.models.base_models import Document
 
 router = APIRouter()
@@ -20,7 +76,26 @@ router = APIRouter()
 
 class DetailedDocumentResponse(DocumentResponse):
     raw_text: str = Field(..., description="Texte brut extrait par l'OCR")
-    download_url: Optional[str] = Field(None, description="URL pré-signée (1h)")
+    download_url: Optional[str] = Field(None, description="URL de téléchargement de l'original (Range accepté)")
+    storage_tier: Optional[str] = Field(
+        None, description="cold : original archivé, relu dans son paquet puis restauré après la consultation"
+    )
+
+
+# Champs de l'analyse corrigeables par l'utilisateur : une fois modifiés,
+# le document est exclu de la réanalyse (voir reanalysis_service)
+AI_EDITABLE_FIELDS = {"ai_type", "ai_resume"}
+
+
+def _edited_flag(data: dict) -> dict:
+    return {"ai_edited": True} if data.keys() & AI_EDITABLE_FIELDS else {}
+
+
+# Sérialiseurs compilés une fois (voir app/core/serialization.py)
+document_list_serializer = ModelSerializer(List[DocumentResponse])
+document_serializer = ModelSerializer(DocumentResponse)
+detailed_document_serializer = ModelSerializer(DetailedDocumentResponse)
+changes_serializer = ModelSerializer(DocumentChangesPage)
 
 
 # -------------------------------------------------------------
@@ -36,7 +111,7 @@ async def list_user_documents(
  #   current_user=Depends(get_current_user_from_token),
     db=DB_SESSION_DEPENDENCY,
 ):
-    user_id = 1  # Pour l'instant, on utilise un user_id fixe pour les tests
+    user_id = "1"  # Pour l'instant, on utilise un user_id fixe pour les tests (users.id est une chaîne)
 
     try:
         result = await db.execute(
@@ -51,7 +126,217 @@ async def list_user_documents(
             detail="Erreur lors de la récupération des documents",
         )
 
-    return documents
+    return document_list_serializer.response(documents)
+
+
+# -------------------------------------------------------------
+# GET /documents/changes (synchronisation par deltas)
+# -------------------------------------------------------------
+
+@router.get(
+    "/changes",
+    response_model=DocumentChangesPage,
+    summary="Documents créés, modifiés ou supprimés depuis un jeton",
+    responses={410: {"description": "Jeton trop ancien : resynchroniser sans `since`"}},
+)
+async def list_document_changes(
+    # Jeton next_token de l'appel précédent ; absent : synchronisation complète
+    since: Optional[str] = None,
+    limit: Annotated[int, Query(ge=1, le=1000)] = CHANGES_PAGE_SIZE,
+    current_user=Depends(get_current_user_from_token),
+    db=DB_SESSION_DEPENDENCY,
+):
+    try:
+        since_seq = decode_token(since) if since else 0
+    except ExpiredSyncToken:
+        raise HTTPException(status_code=410, detail="Jeton de synchronisation expiré : resynchroniser sans `since`")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Jeton de synchronisation invalide")
+
+    changes, last_seq, has_more = await list_changes(db, current_user.id, since_seq, limit)
+    return changes_serializer.response({
+        "changes": changes,
+        "next_token": encode_token(last_seq),
+        "has_more": has_more,
+    })
+
+
+# -------------------------------------------------------------
+# Opérations groupées (DELETE / PATCH /documents/)
+# -------------------------------------------------------------
+
+def _selection_clauses(owner_id: str, selection: DocumentSelection) -> list:
+    """Traduit une sélection en clauses WHERE, toujours restreintes au propriétaire."""
+    clauses = [Document.owner_id == owner_id]
+    if selection.ids:
+        clauses.append(Document.id.in_(selection.ids))
+    if selection.filter:
+        if selection.filter.ai_type is not None:
+            clauses.append(Document.ai_type == selection.filter.ai_type)
+        if selection.filter.created_before is not None:
+            clauses.append(Document.created_at < selection.filter.created_before)
+        if selection.filter.created_after is not None:
+            clauses.append(Document.created_at >= selection.filter.created_after)
+    return clauses
+
+
+@router.delete(
+    "/",
+    response_model=BulkOperationResult,
+    summary="Suppression groupée de documents",
+)
+async def bulk_delete_documents(
+    selection: DocumentSelection,
+    background_tasks: BackgroundTasks,
+    current_user=Depends(get_current_user_from_token),
+    db=DB_SESSION_DEPENDENCY,
+):
+    # Un seul DELETE ... RETURNING : le contrôle du propriétaire est dans le WHERE
+    try:
+        result = await db.execute(
+            delete(Document)
+            .where(*_selection_clauses(current_user.id, selection))
+            .returning(
+                Document.id, Document.file_url, Document.file_size,
+                Document.ai_type, Document.ai_actions, Document.ai_montants,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        rows = result.all()
+        # Fichiers notés dans la même transaction : repris par la purge si la tâche de fond se perd
+        pending_ids = await schedule_file_deletions(db, [row.file_url for row in rows])
+        await apply_stats_delta(db, current_user.id, -sum_stats(rows))
+        await record_changes(db, current_user.id, [row.id for row in rows], DELETE)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail="Erreur de suppression groupée")
+
+    # Les fichiers sont supprimés par lots, après la réponse
+    if pending_ids:
+        background_tasks.add_task(purge_files, pending_ids)
+
+    return {"matched": len(rows), "ids": [row.id for row in rows]}
+
+
+@router.patch(
+    "/",
+    response_model=BulkOperationResult,
+    summary="Mise à jour groupée de documents",
+)
+async def bulk_update_documents(
+    bulk_update: DocumentBulkUpdate,
+    current_user=Depends(get_current_user_from_token),
+    db=DB_SESSION_DEPENDENCY,
+):
+    data = bulk_update.update.model_dump(exclude_none=True)
+    if not data:
+        raise HTTPException(status_code=400, detail="Aucune modification fournie")
+
+    # Le type d'origine est relu (et verrouillé) dans le même UPDATE ... FROM,
+    # pour corriger les compteurs par type du tableau de bord.
+    previous = (
+        select(Document.id, Document.ai_type.label("old_type"))
+        .where(*_selection_clauses(current_user.id, bulk_update))
+        .with_for_update()
+        .subquery()
+    )
+    try:
+        result = await db.execute(
+            update(Document)
+            .where(Document.id == previous.c.id)
+            .values(**data, **_edited_flag(data), version=Document.version + 1)
+            .returning(Document.id, previous.c.old_type, Document.ai_type)
+            .execution_options(synchronize_session=False)
+        )
+        rows = result.all()
+        ids = [row.id for row in rows]
+        delta = StatsDelta()
+        for row in rows:
+            delta.types[row.old_type or UNKNOWN_TYPE] -= 1
+            delta.types[row.ai_type or UNKNOWN_TYPE] += 1
+        await apply_stats_delta(db, current_user.id, delta)
+        await record_changes(db, current_user.id, ids, UPSERT)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail="Erreur de mise à jour groupée")
+
+    return {"matched": len(ids), "ids": ids}
+
+
+# -------------------------------------------------------------
+# GET /documents/deadlines
+# -------------------------------------------------------------
+# NOTE : les routes à chemin fixe doivent être déclarées avant /{document_id}
+
+@router.get(
+    "/deadlines",
+    response_model=List[UpcomingDeadline],
+    summary="Échéances à venir (dates extraites par l'IA)",
+)
+async def list_upcoming_deadlines(
+    days: Annotated[int, Query(ge=1, le=366)] = 30,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    current_user=Depends(get_current_user_from_token),
+    db=DB_SESSION_DEPENDENCY,
+):
+    return await get_upcoming_deadlines(db, current_user.id, days=days, limit=limit)
+
+
+# -------------------------------------------------------------
+# GET /documents/amounts-by-type
+# -------------------------------------------------------------
+
+@router.get(
+    "/amounts-by-type",
+    response_model=List[AmountsByType],
+    summary="Total des montants par type de document",
+)
+async def list_amounts_by_type(
+    current_user=Depends(get_current_user_from_token),
+    db=DB_SESSION_DEPENDENCY,
+):
+    return await get_amounts_by_type(db, current_user.id)
+
+
+# -------------------------------------------------------------
+# GET /documents/stats
+# -------------------------------------------------------------
+
+@router.get(
+    "/stats",
+    response_model=DashboardStats,
+    summary="Statistiques du tableau de bord (agrégats maintenus)",
+)
+async def get_dashboard_stats(
+    current_user=Depends(get_current_user_from_token),
+    db=DB_SESSION_DEPENDENCY,
+):
+    return await get_user_stats(db, current_user.id)
+
+
+# -------------------------------------------------------------
+# GET /documents/export
+# -------------------------------------------------------------
+
+@router.get(
+    "/export",
+    summary="Export complet de l'archive (ZIP ou NDJSON, en flux)",
+    responses={503: {"description": "Trop d'exports simultanés"}},
+)
+async def export_documents(
+    format: Annotated[str, Query(pattern="^(zip|ndjson)$")] = "zip",
+    after_id: Annotated[int, Query(ge=0)] = 0,
+    include_files: bool = True,
+    current_user=Depends(get_current_user_from_token),
+):
+    """
+    Documents exportés par id croissant. Pour reprendre un export interrompu,
+    relancer avec after_id = id du dernier document reçu en entier.
+    Pas de session injectée : l'export ouvre la sienne pour la durée du flux.
+    """
+    return export_response(current_user.id, format, after_id, include_files)
 
 
 # -------------------------------------------------------------
@@ -62,12 +347,31 @@ async def list_user_documents(
     "/{document_id}",
     response_model=DetailedDocumentResponse,
     summary="Détails complets d'un document",
+    responses={304: {"description": "Document inchangé (If-None-Match)"}},
 )
 async def get_document_details(
     document_id: Annotated[int, Path(...)],
+    request: Request,
+    background_tasks: BackgroundTasks,
+    if_none_match: Annotated[Optional[str], Header()] = None,
     current_user=Depends(get_current_user_from_token),
     db=DB_SESSION_DEPENDENCY,
 ):
+    # Revalidation : seule la version est relue, sans le texte OCR
+    if if_none_match:
+        row = (
+            await db.execute(
+                select(
+                    Document.owner_id, Document.version, Document.storage_tier, Document.last_accessed_at,
+                ).filter(Document.id == document_id)
+            )
+        ).first()
+        if row and row.owner_id == current_user.id:
+            etag = document_etag(document_id, row.version)
+            if etag_matches(if_none_match, etag):
+                await _record_consultation(db, background_tasks, document_id, row)
+                return Response(status_code=304, headers=_detail_cache_headers(etag))
+
     result = await db.execute(select(Document).filter(Document.id == document_id))
     document = result.scalars().first()
 
@@ -77,14 +381,148 @@ async def get_document_details(
     if document.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Accès refusé")
 
-    download_url = None
+    response = detailed_document_serializer.validate(document)
     if document.file_url:
-        download_url = create_presigned_url(document.file_url)
+        response.download_url = request.url_for(
+            "download_document_file", document_id=document.id
+        ).path
+
+    etag = document_etag(document.id, document.version)
+    await _record_consultation(db, background_tasks, document.id, document)
+    return detailed_document_serializer.response(response, headers=_detail_cache_headers(etag))
+
+
+def _detail_cache_headers(etag: str) -> dict:
+    # no-cache : le client garde la fiche mais la revalide à chaque usage
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+async def _record_consultation(db, background_tasks: BackgroundTasks, document_id: int, row):
+    """Consultation notée (tiering) ; un original archivé est restauré après la réponse, avant son téléchargement."""
+    await record_access(db, document_id, row.last_accessed_at)
+    if row.storage_tier == COLD:
+        background_tasks.add_task(restore_document, document_id)
+
+
+# -------------------------------------------------------------
+# GET /documents/{document_id}/download
+# -------------------------------------------------------------
+
+@router.get(
+    "/{document_id}/download",
+    summary="Télécharger l'original (requêtes Range et If-None-Match)",
+    responses={
+        206: {"description": "Contenu partiel (Range)"},
+        304: {"description": "Fichier inchangé (If-None-Match)"},
+        416: {"description": "Plage hors du fichier"},
+    },
+)
+async def download_document_file(
+    document_id: Annotated[int, Path(...)],
+    background_tasks: BackgroundTasks,
+    format: Annotated[
+        str,
+        Query(
+            pattern="^(original|stored)$",
+            description="original : format d'envoi ; stored : objet tel que stocké (WebP, plus léger)",
+        ),
+    ] = "original",
+    range_header: Annotated[Optional[str], Header(alias="Range")] = None,
+    if_range: Annotated[Optional[str], Header()] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    accept_encoding: Annotated[Optional[str], Header()] = None,
+    current_user=Depends(get_current_user_from_token),
+    db=DB_SESSION_DEPENDENCY,
+):
+    row = (
+        await db.execute(
+            select(
+                Document.owner_id, Document.file_url, Document.file_size,
+                Document.file_name, Document.content_type,
+                Document.stored_format, Document.stored_size,
+                Document.storage_tier, Document.last_accessed_at,
+            ).filter(Document.id == document_id)
+        )
+    ).first()
 
-    response = DetailedDocumentResponse.model_validate(document)
-    response.download_url = download_url
+    if not row or not row.file_url:
+        await db.close()
+        raise HTTPException(status_code=404, detail="Document non trouvé")
+    if row.owner_id != current_user.id:
+        await db.close()
+        raise HTTPException(status_code=403, detail="Accès refusé")
+
+    await _record_consultation(db, background_tasks, document_id, row)
+    # La session n'est plus utile : la connexion est rendue avant le transfert
+    await db.close()
+
+    # Objet servi tel quel : stocké sans transformation, demandé tel quel, ou
+    # compressé en gzip pour un client qui l'accepte (transmis avec Content-Encoding)
+    stored_format = row.stored_format or IDENTITY
+    gzip_passthrough = stored_format == GZIP and not range_header and accepts_encoding(accept_encoding, "gzip")
+    as_stored = stored_format == IDENTITY or format == "stored" or gzip_passthrough
+    media_type = row.content_type or "application/octet-stream"
+    if as_stored and stored_format == WEBP:
+        media_type = "image/webp"
+
+    etag = file_etag(row.file_url) if stored_format == IDENTITY or not as_stored else file_etag(f"{row.file_url}#{stored_format}")
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        # L'original d'un document n'est jamais réécrit
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "Content-Disposition": f"inline; filename*=UTF-8''{quote(row.file_name or str(document_id))}",
+    }
+    if stored_format == GZIP:
+        headers["Vary"] = "Accept-Encoding"
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    # If-Range : la plage n'est servie que si le fichier n'a pas changé
+    if if_range and if_range.strip() != etag:
+        range_header = None
+
+    if not as_stored:
+        # Reconstitution au format d'origine (WebP -> JPEG/PNG/TIFF, gzip -> octets d'origine)
+        try:
+            data = await read_document_original(document_id, row.file_url, row.storage_tier, stored_format)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Fichier introuvable dans le stockage")
+        try:
+            byte_range = parse_range(range_header, len(data))
+        except RangeNotSatisfiable as e:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{e.size}"})
+        if byte_range is None:
+            return Response(data, media_type=media_type, headers=headers)
+        first, last = byte_range
+        headers["Content-Range"] = f"bytes {first}-{last}/{len(data)}"
+        return Response(data[first:last + 1], status_code=206, media_type=media_type, headers=headers)
+
+    size = row.file_size if stored_format == IDENTITY else row.stored_size
+    try:
+        byte_range = None if gzip_passthrough else parse_range(range_header, size)
+    except RangeNotSatisfiable as e:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{e.size}"})
 
-    return response
+    try:
+        stored = await open_document_file(document_id, row.file_url, row.storage_tier, byte_range)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Fichier introuvable dans le stockage")
+
+    headers["Content-Length"] = str(stored["ContentLength"])
+    if gzip_passthrough:
+        headers["Content-Encoding"] = "gzip"
+    status_code = 200
+    if byte_range is not None and stored.get("ContentRange"):
+        headers["Content-Range"] = stored["ContentRange"]
+        status_code = 206
+
+    return StreamingResponse(
+        iter_file_chunks(stored["Body"]),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers,
+    )
 
 
 # -------------------------------------------------------------
@@ -111,18 +549,27 @@ async def update_document(
     if document.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Accès refusé")
 
+    before = document_stats(document)
     data = update_data.model_dump(exclude_none=True)
+    data.update(_edited_flag(data))
     for key, value in data.items():
         setattr(document, key, value)
+    if data:
+        document.version = Document.version + 1
 
     try:
+        await apply_stats_delta(db, document.owner_id, document_stats(document) - before)
+        if data:
+            await record_changes(db, document.owner_id, [document.id], UPSERT)
         await db.commit()
         await db.refresh(document)
     except Exception:
         await db.rollback()
         raise HTTPException(status_code=500, detail="Erreur de mise à jour")
 
-    return document
+    return document_serializer.response(
+        document, headers={"ETag": document_etag(document.id, document.version)}
+    )
 
 
 # -------------------------------------------------------------
@@ -132,13 +579,25 @@ async def update_document(
 @router.post("/scan", summary="Upload + OCR + IA")
 async def scan_document_upload(
     file: Annotated[UploadFile, File(...)],
+    request: Request,
+    # Page déjà scannée : reprendre son analyse (reuse), la refaire en signalant le doublon (flag), ou ignorer (off)
+    on_duplicate: Annotated[Optional[str], Query(pattern="^(reuse|flag|off)$")] = None,
     # current_user=Depends(get_current_user_from_token),
-    db=DB_SESSION_DEPENDENCY,
+    # Pas de session BDD de requête : le scan ouvre des transactions courtes (app/services/ocr_service.py)
+    caller=Depends(get_optional_user),
 ):
-    user_id = 1  # Pour l'instant, on utilise un user_id fixe pour les tests
+    user_id = "1"  # Pour l'instant, on utilise un user_id fixe pour les tests (users.id est une chaîne)
     if not file.content_type:
         raise HTTPException(status_code=400, detail="Type de fichier invalide")
 
+    # Admission : budgets uploads / secondes d'OCR / appels LLM de l'appelant (jeton, sinon adresse),
+    # et non du propriétaire provisoire "1" : un client ne peut pas épuiser les budgets des autres
+    budget_key = caller_key(caller, request)
+    try:
+        await check_scan_budgets(budget_key)
+    except RateLimitExceeded as e:
+        raise too_many_requests(e)
+
     content = await file.read()
 
     result = await process_ocr_and_ai(
@@ -146,7 +605,8 @@ async def scan_document_upload(
         file_name=file.filename,
         content_type=file.content_type,
         user_id= user_id, # À remplacer par current_user.id quand l'auth sera en place
-        db_session=db,
+        on_duplicate=on_duplicate,
+        budget_key=budget_key,
     )
 
     return result
@@ -163,6 +623,7 @@ async def scan_document_upload(
 )
 async def delete_document(
     document_id: Annotated[int, Path(...)],
+    background_tasks: BackgroundTasks,
     current_user=Depends(get_current_user_from_token),
     db=DB_SESSION_DEPENDENCY,
 ):
@@ -175,8 +636,11 @@ async def delete_document(
     if document.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Accès refusé")
 
-    if document.file_url:
-        await delete_file_from_s3(document.file_url)
-
+    # L'original est supprimé après le commit (voir deletion_service)
+    pending_ids = await schedule_file_deletions(db, [document.file_url])
     await db.delete(document)
-    await db.commit()
\ No newline at end of file
+    await apply_stats_delta(db, document.owner_id, -document_stats(document))
+    await record_changes(db, document.owner_id, [document.id], DELETE)
+    await db.commit()
+    if pending_ids:
+        background_tasks.add_task(purge_files, pending_ids)
\ No newline at end of file
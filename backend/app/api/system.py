@@ -0,0 +1,129 @@
+import asyncio
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse
+
+from app.core import profiling
+from app.core.circuit_breaker import breaker_states
+from app.core.security import require_admin
+from app.core.user_cache import user_cache
+from app.dependencies import DB_SESSION_DEPENDENCY
+from app.services import ai_service, reanalysis_service, storage_service, tiering_service
+from app.services.stats_service import get_storage_usage
+from app.services.export_service import export_response
+
+# Routes d'exploitation : toutes protégées par le jeton administrateur
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+# -------------------------------------------------------------
+# GET /system/user-cache
+# -------------------------------------------------------------
+
+@router.get("/user-cache", summary="Statistiques du cache des utilisateurs")
+async def get_user_cache_stats():
+    return user_cache.stats()
+
+
+# -------------------------------------------------------------
+# Profils de requêtes (PROFILING_ENABLED, en-tête X-Profile: 1)
+# -------------------------------------------------------------
+
+@router.get("/profiles", summary="Liste des profils de requêtes enregistrés")
+async def get_profiles():
+    return await asyncio.to_thread(profiling.list_profiles)
+
+
+@router.get("/profiles/{profile_id}", summary="Télécharger un profil (folded stacks ou résumé)")
+async def download_profile(
+    profile_id: str,
+    kind: str = Query("wall", pattern="^(wall|cpu|summary)$"),
+):
+    """
+    kind=wall|cpu : piles au format "folded" (µs), à passer à flamegraph.pl ou speedscope.
+    kind=summary : métadonnées et fonctions les plus coûteuses (JSON).
+    """
+    path = profiling.profile_path(profile_id, kind)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profil introuvable")
+    if kind == "summary":
+        return FileResponse(path, media_type="application/json")
+    return FileResponse(path, media_type="text/plain", filename=os.path.basename(path))
+
+
+# -------------------------------------------------------------
+# GET /system/users/{user_id}/export
+# -------------------------------------------------------------
+
+@router.get("/users/{user_id}/export", summary="Export complet de l'archive d'un utilisateur")
+async def export_user_documents(
+    user_id: str,
+    format: str = Query("zip", pattern="^(zip|ndjson)$"),
+    after_id: int = Query(0, ge=0),
+    include_files: bool = True,
+):
+    """Même flux que GET /documents/export, pour n'importe quel utilisateur (support, portabilité)."""
+    return export_response(user_id, format, after_id, include_files)
+
+
+# -------------------------------------------------------------
+# GET /system/ai-routing
+# -------------------------------------------------------------
+
+@router.get("/ai-routing", summary="Appels, latence et taux d'escalade par modèle")
+async def get_ai_routing_stats():
+    return ai_service.routing_stats()
+
+
+# -------------------------------------------------------------
+# GET /system/circuit-breakers
+# -------------------------------------------------------------
+
+@router.get("/circuit-breakers", summary="État des disjoncteurs (Ollama, stockage)")
+async def get_circuit_breakers():
+    return breaker_states()
+
+
+# -------------------------------------------------------------
+# GET /system/storage
+# -------------------------------------------------------------
+
+@router.get("/storage", summary="Place occupée par les originaux, gain du transcodage et tiers chaud/froid")
+async def get_storage_usage_report(db=DB_SESSION_DEPENDENCY):
+    return {
+        "policy": {
+            "transcode_images": storage_service.STORAGE_TRANSCODE_IMAGES,
+            "webp_quality": storage_service.STORAGE_WEBP_QUALITY,
+            "compress_other": storage_service.STORAGE_COMPRESS_OTHER,
+        },
+        **await get_storage_usage(db),
+        "tiers": await tiering_service.get_tier_usage(db),
+    }
+
+
+# -------------------------------------------------------------
+# Réanalyse en tâche de fond (modèle ou prompt modifié, analyses en repli)
+# -------------------------------------------------------------
+
+@router.get("/reanalysis", summary="Avancement de la réanalyse des documents")
+async def get_reanalysis_status():
+    return await reanalysis_service.get_status()
+
+
+@router.post("/reanalysis/pause", summary="Suspendre la réanalyse")
+async def pause_reanalysis():
+    await reanalysis_service.set_paused(True)
+    return await reanalysis_service.get_status()
+
+
+@router.post("/reanalysis/resume", summary="Reprendre la réanalyse")
+async def resume_reanalysis():
+    await reanalysis_service.set_paused(False)
+    return await reanalysis_service.get_status()
+
+
+@router.post("/reanalysis/restart", summary="Relancer un passage complet de réanalyse")
+async def restart_reanalysis():
+    await reanalysis_service.restart_pass()
+    return await reanalysis_service.get_status()
@@ -0,0 +1,419 @@
+"""
+Ingestion hors ligne d'un lot de scans existants (reprise d'une organisation).
+
+Usage :
+    python -m app.commands.ingest /data/scans --user <id> --workers 8
+    python -m app.commands.ingest s3://bucket-partenaire/scans/2024 --user <id>
+
+Chaque fichier passe par les mêmes étapes que POST /documents/scan (upload,
+OCR, IA : ocr_service.run_scan_stages), sans débiter les quotas de
+l'utilisateur. Les documents sont insérés par lots (--batch-size), les
+statistiques du tableau de bord mises à jour une fois par lot.
+
+Reprise : un journal (--checkpoint, JSON lines) note les fichiers insérés et
+ceux écartés définitivement (OCR vide, type non supporté). Relancer la même
+commande reprend là où elle s'était arrêtée ; les fichiers en erreur
+transitoire (stockage, IA, BDD) sont retentés. Un lot interrompu entre son
+annonce et son commit est vérifié en base (par file_url) au redémarrage.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import mimetypes
+import os
+import sys
+import time
+import uuid
+from typing import Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.future import select
+
+from app.core import profiling
+from app.core.database import new_session
+from app.core.metrics import content_type_label, size_bucket_label
+from app.core.resources import resources
+from app.models.base_models import Document, User
+from app.services import dedup_service
+from app.services.ocr_service import run_scan_stages
+from app.services.stats_service import apply_stats_delta, sum_stats
+from app.services.change_service import UPSERT, record_changes
+from app.services.storage_service import check_bucket_existence, delete_files_from_s3
+
+# Marqueur de délai écoulé sans nouveau document (voir _writer)
+_IDLE = object()
+
+# Images seulement : l'OCR des PDF n'est pas implémenté (501), inutile de les envoyer au stockage
+SUPPORTED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".gif", ".webp"}
+
+
+# --------------------------------------------------
+# Sources : dossier local ou préfixe de bucket (s3://bucket/préfixe)
+# --------------------------------------------------
+
+class LocalSource:
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def list_keys(self) -> List[str]:
+        keys = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+                    keys.append(os.path.relpath(os.path.join(directory, name), self.root))
+        return sorted(keys)
+
+    def read(self, key: str) -> bytes:
+        with open(os.path.join(self.root, key), "rb") as handle:
+            return handle.read()
+
+
+class BucketSource:
+    def __init__(self, url: str):
+        self.bucket, _, self.prefix = url[len("s3://"):].partition("/")
+
+    def list_keys(self) -> List[str]:
+        keys = []
+        paginator = resources.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                if os.path.splitext(item["Key"])[1].lower() in SUPPORTED_EXTENSIONS:
+                    keys.append(item["Key"])
+        return sorted(keys)
+
+    def read(self, key: str) -> bytes:
+        return resources.s3_client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+
+def open_source(location: str):
+    return BucketSource(location) if location.startswith("s3://") else LocalSource(location)
+
+
+# --------------------------------------------------
+# Journal de reprise (append-only, une ligne JSON par événement)
+# --------------------------------------------------
+
+class Checkpoint:
+    """
+    Lignes écrites :
+    - {"skipped": clé, "reason": ...}            fichier écarté définitivement
+    - {"batch": id, "items": [[clé, file_url]]}  lot annoncé avant son commit
+    - {"committed": id}                          lot commité
+    Une dernière ligne tronquée (arrêt brutal) est ignorée.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[str] = set()
+        self.uncommitted: Dict[str, List[Tuple[str, str]]] = {}
+        self._handle = None
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        batches: Dict[str, List[Tuple[str, str]]] = {}
+        committed: Set[str] = set()
+        with open(self.path, encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if "skipped" in entry:
+                    self.done.add(entry["skipped"])
+                elif "batch" in entry:
+                    batches[entry["batch"]] = [tuple(item) for item in entry["items"]]
+                elif "committed" in entry:
+                    committed.add(entry["committed"])
+        for batch_id, items in batches.items():
+            if batch_id in committed:
+                self.done.update(key for key, _ in items)
+            else:
+                self.uncommitted[batch_id] = items
+
+    def _write(self, entry: dict):
+        if self._handle is None:
+            self._handle = open(self.path, "a", encoding="utf-8")
+        self._handle.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._handle.flush()
+        os.fsync(self._handle.fileno())
+
+    def record_skipped(self, key: str, reason: str):
+        self._write({"skipped": key, "reason": reason})
+        self.done.add(key)
+
+    def record_batch(self, batch_id: str, items: List[Tuple[str, str]]):
+        self._write({"batch": batch_id, "items": items})
+
+    def record_committed(self, batch_id: str, keys: List[str]):
+        self._write({"committed": batch_id})
+        self.done.update(keys)
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+
+
+async def reconcile_uncommitted(checkpoint: Checkpoint):
+    """
+    Lots annoncés sans commit connu : ceux présents en base sont marqués faits,
+    les originaux des autres (envoyés, jamais insérés) sont supprimés.
+    """
+    for batch_id, items in checkpoint.uncommitted.items():
+        urls = [file_url for _, file_url in items]
+        async with new_session() as session:
+            found = set((await session.execute(
+                select(Document.file_url).filter(Document.file_url.in_(urls))
+            )).scalars().all())
+        if found:
+            # Le lot est réécrit avec ses seuls documents présents (la dernière version prime)
+            items = [(key, file_url) for key, file_url in items if file_url in found]
+            checkpoint.record_batch(batch_id, items)
+            checkpoint.record_committed(batch_id, [key for key, _ in items])
+        orphans = [file_url for file_url in urls if file_url not in found]
+        if orphans:
+            await delete_files_from_s3(orphans)
+    checkpoint.uncommitted.clear()
+
+
+# --------------------------------------------------
+# Suivi du débit
+# --------------------------------------------------
+
+class Progress:
+    def __init__(self, total: int, already_done: int):
+        self.total = total
+        self.already_done = already_done
+        self.inserted = 0
+        self.skipped = 0
+        self.failed = 0
+        self.duplicates = 0  # quasi-doublons (inclus dans inserted)
+        self.bytes = 0
+        self.started = time.monotonic()
+        self._last = (self.started, 0)
+
+    @property
+    def processed(self) -> int:
+        return self.inserted + self.skipped + self.failed
+
+    def report(self) -> str:
+        now = time.monotonic()
+        elapsed = max(now - self.started, 1e-9)
+        last_time, last_processed = self._last
+        recent = (self.processed - last_processed) / max(now - last_time, 1e-9)
+        self._last = (now, self.processed)
+        remaining = self.total - self.already_done - self.processed
+        eta = f"{remaining / recent / 60:.1f} min" if recent > 0 else "?"
+        return (
+            f"[ingestion] {self.already_done + self.processed}/{self.total} "
+            f"(insérés {self.inserted}, écartés {self.skipped}, erreurs {self.failed}, quasi-doublons {self.duplicates}) | "
+            f"{self.processed / elapsed:.2f} doc/s (récent {recent:.2f}), "
+            f"{self.bytes / elapsed / 1e6:.2f} Mo/s | reste ~{eta}"
+        )
+
+    def summary(self) -> dict:
+        elapsed = time.monotonic() - self.started
+        return {
+            "total": self.total, "already_done": self.already_done,
+            "inserted": self.inserted, "skipped": self.skipped, "failed": self.failed,
+            "duplicates": self.duplicates, "seconds": round(elapsed, 1),
+            "docs_per_second": round(self.processed / elapsed, 2) if elapsed else 0,
+        }
+
+
+# --------------------------------------------------
+# Workers (étapes du scan) et écrivain (insertions par lots)
+# --------------------------------------------------
+
+async def _near_duplicate(content: bytes, content_type: str, owner_id: str, on_duplicate: str):
+    """pHash de la page et scan antérieur proche (déjà inséré) du même propriétaire."""
+    if on_duplicate == "off":
+        return None, None
+    phash = await dedup_service.page_hash(content, content_type)
+    if phash is None:
+        return None, None
+    async with new_session() as session:
+        return phash, await dedup_service.find_near_duplicate(session, owner_id, phash)
+
+
+async def _worker(source, owner_id: str, on_duplicate: str, keys: asyncio.Queue, documents: asyncio.Queue,
+                  checkpoint: Checkpoint, progress: Progress):
+    while True:
+        key = await keys.get()
+        if key is None:
+            return
+        try:
+            content = await profiling.to_thread(source.read, key)
+            content_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+            labels = {
+                "content_type": content_type_label(content_type),
+                "size_bucket": size_bucket_label(len(content)),
+            }
+            phash, duplicate = await _near_duplicate(content, content_type, owner_id, on_duplicate)
+            document = await run_scan_stages(
+                content, os.path.basename(key), content_type, owner_id, labels, charge_budgets=False,
+                duplicate=duplicate, reuse_duplicate=on_duplicate == "reuse",
+            )
+        except HTTPException as e:
+            # 4xx et 501 (PDF) : inutile de réessayer ; 5xx : erreur transitoire
+            if e.status_code < 500 or e.status_code == 501:
+                checkpoint.record_skipped(key, str(e.detail))
+                progress.skipped += 1
+            else:
+                print(f"Erreur sur {key} : {e.detail}")
+                progress.failed += 1
+            continue
+        except Exception as e:
+            print(f"Erreur sur {key} : {e}")
+            progress.failed += 1
+            continue
+
+        if document is None:
+            checkpoint.record_skipped(key, "OCR vide")
+            progress.skipped += 1
+            continue
+        if duplicate is not None:
+            progress.duplicates += 1
+        progress.bytes += len(content)
+        await documents.put((key, document, phash))
+
+
+async def _insert_batch(owner_id: str, batch: List[Tuple[str, Document, Optional[int]]], checkpoint: Checkpoint,
+                        progress: Progress):
+    batch_id = uuid.uuid4().hex
+    checkpoint.record_batch(batch_id, [(key, document.file_url) for key, document, _ in batch])
+    try:
+        async with new_session() as session:
+            session.add_all([document for _, document, _ in batch])
+            # INSERT groupé ; le flush précède l'upsert de user_stats (clé étrangère)
+            await session.flush()
+            session.add_all([
+                dedup_service.page_hash_row(document, phash)
+                for _, document, phash in batch if phash is not None
+            ])
+            await apply_stats_delta(session, owner_id, sum_stats(document for _, document, _ in batch))
+            await record_changes(session, owner_id, [document.id for _, document, _ in batch], UPSERT)
+            await session.commit()
+    except Exception:
+        # Lot non inséré : ses originaux ne doivent pas rester orphelins (fichiers repris au prochain lancement)
+        await delete_files_from_s3([document.file_url for _, document, _ in batch])
+        raise
+    checkpoint.record_committed(batch_id, [key for key, _, _ in batch])
+    progress.inserted += len(batch)
+
+
+async def _writer(owner_id: str, documents: asyncio.Queue, batch_size: int, flush_seconds: float,
+                  checkpoint: Checkpoint, progress: Progress):
+    """Insère par lots de batch_size, ou au bout de flush_seconds sans nouveau document."""
+    batch: List[Tuple[str, Document, Optional[int]]] = []
+    finished = False
+    while not finished:
+        try:
+            item = await asyncio.wait_for(documents.get(), timeout=flush_seconds)
+        except asyncio.TimeoutError:
+            item = _IDLE
+        finished = item is None
+        if isinstance(item, tuple):
+            batch.append(item)
+        if batch and (not isinstance(item, tuple) or len(batch) >= batch_size):
+            await _insert_batch(owner_id, batch, checkpoint, progress)
+            batch = []
+
+
+async def _feed(pending: List[str], keys: asyncio.Queue, workers: int):
+    for key in pending:
+        await keys.put(key)
+    for _ in range(workers):
+        await keys.put(None)
+
+
+async def _reporter(progress: Progress, every: float):
+    while True:
+        await asyncio.sleep(every)
+        print(progress.report())
+
+
+async def ingest(location: str, owner_id: str, workers: int, batch_size: int,
+                 checkpoint_path: str, report_every: float, flush_seconds: float = 5.0,
+                 on_duplicate: str = dedup_service.PHASH_DUPLICATE_POLICY) -> int:
+    async with new_session() as session:
+        if (await session.execute(select(User.id).filter(User.id == owner_id))).scalar() is None:
+            print(f"Utilisateur introuvable : {owner_id}")
+            return 2
+    await check_bucket_existence()
+
+    checkpoint = Checkpoint(checkpoint_path)
+    checkpoint.load()
+    await reconcile_uncommitted(checkpoint)
+
+    source = open_source(location)
+    all_keys = await profiling.to_thread(source.list_keys)
+    pending = [key for key in all_keys if key not in checkpoint.done]
+    progress = Progress(total=len(all_keys), already_done=len(all_keys) - len(pending))
+    print(f"{len(all_keys)} fichier(s), {len(pending)} à traiter ({workers} worker(s), lots de {batch_size}).")
+
+    # Files bornées : la mémoire ne dépend pas de la taille du lot à ingérer
+    keys: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+    documents: asyncio.Queue = asyncio.Queue(maxsize=batch_size * 2)
+    worker_tasks = [
+        asyncio.create_task(_worker(source, owner_id, on_duplicate, keys, documents, checkpoint, progress))
+        for _ in range(workers)
+    ]
+    writer_task = asyncio.create_task(
+        _writer(owner_id, documents, batch_size, flush_seconds, checkpoint, progress)
+    )
+    reporter_task = asyncio.create_task(_reporter(progress, report_every))
+
+    feeder_task = asyncio.create_task(_feed(pending, keys, workers))
+    producers = asyncio.gather(feeder_task, *worker_tasks)
+    tasks = [producers, writer_task, reporter_task]
+
+    try:
+        # Un échec de l'écrivain (BDD) arrête l'ingestion : la relance reprendra
+        await asyncio.wait({producers, writer_task}, return_when=asyncio.FIRST_COMPLETED)
+        if writer_task.done():
+            writer_task.result()
+        await producers
+        await documents.put(None)
+        await writer_task
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        checkpoint.close()
+
+    print(progress.report())
+    print(json.dumps(progress.summary()))
+    return 1 if progress.failed else 0
+
+
+async def main(args) -> int:
+    try:
+        return await ingest(
+            args.location, args.user_id, args.workers, args.batch_size,
+            args.checkpoint, args.report_every, on_duplicate=args.on_duplicate,
+        )
+    finally:
+        await resources.aclose()
+
+
+def _default_checkpoint(location: str, user_id: str) -> str:
+    digest = hashlib.sha1(f"{user_id}:{location}".encode()).hexdigest()[:10]
+    return f"ingest-{digest}.checkpoint.jsonl"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingestion hors ligne de scans existants.")
+    parser.add_argument("location", help="Dossier local ou s3://bucket/préfixe")
+    parser.add_argument("--user", dest="user_id", required=True, help="Propriétaire des documents")
+    parser.add_argument("--workers", type=int, default=4, help="Fichiers traités en parallèle")
+    parser.add_argument("--batch-size", type=int, default=50, help="Documents par INSERT")
+    parser.add_argument("--checkpoint", help="Journal de reprise (par défaut : dérivé de la source)")
+    parser.add_argument("--report-every", type=float, default=10, help="Intervalle du rapport de débit (s)")
+    parser.add_argument("--on-duplicate", choices=dedup_service.DUPLICATE_POLICIES,
+                        default=dedup_service.PHASH_DUPLICATE_POLICY,
+                        help="Quasi-doublons d'un scan déjà inséré : reprise de l'analyse, marquage seul ou aucune recherche")
+    args = parser.parse_args()
+    args.checkpoint = args.checkpoint or _default_checkpoint(args.location, args.user_id)
+    sys.exit(asyncio.run(main(args)))
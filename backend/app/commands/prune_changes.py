@@ -0,0 +1,31 @@
+"""
+Purge les suppressions (tombstones) du journal de synchronisation plus
+anciennes que CHANGES_TOMBSTONE_DAYS.
+
+Usage (par exemple chaque nuit, depuis cron) :
+    python -m app.commands.prune_changes
+
+Les jetons émis avant cette limite sont de toute façon refusés (410) par
+GET /documents/changes : aucun client ne peut manquer une suppression purgée.
+"""
+import asyncio
+import json
+import sys
+
+from app.core.database import new_session
+from app.core.resources import resources
+from app.services.change_service import CHANGES_TOMBSTONE_DAYS, prune_tombstones
+
+
+async def main() -> int:
+    try:
+        async with new_session() as session:
+            pruned = await prune_tombstones(session)
+        print(json.dumps({"tombstones_pruned": pruned, "older_than_days": CHANGES_TOMBSTONE_DAYS}))
+        return 0
+    finally:
+        await resources.aclose()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
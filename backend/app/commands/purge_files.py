@@ -0,0 +1,37 @@
+"""
+Supprime du stockage les originaux des documents supprimés restés en attente
+(table pending_file_deletions) : worker arrêté entre le commit et la
+suppression, ou stockage indisponible à ce moment.
+
+Usage (par exemple toutes les heures, depuis cron) :
+    python -m app.commands.purge_files
+
+Code de sortie 1 s'il reste des fichiers en attente (stockage en panne).
+"""
+import asyncio
+import json
+import sys
+
+from app.core.database import new_session
+from app.core.resources import resources
+from app.services.deletion_service import count_pending, purge_files
+
+
+async def main() -> int:
+    try:
+        purged = 0
+        while True:
+            batch = await purge_files()
+            purged += batch
+            if not batch:
+                break
+        async with new_session() as session:
+            pending = await count_pending(session)
+        print(json.dumps({"files_purged": purged, "files_pending": pending}))
+        return 1 if pending else 0
+    finally:
+        await resources.aclose()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,118 @@
+"""
+Recalcule la table user_stats à partir des documents et signale les écarts.
+
+Usage :
+    python -m app.commands.rebuild_stats            # recalcule et corrige
+    python -m app.commands.rebuild_stats --check    # signale seulement (code 1 si écart)
+    python -m app.commands.rebuild_stats --user <id>
+"""
+import argparse
+import asyncio
+import json
+import sys
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.future import select
+
+from app.core.database import new_session
+from app.core.resources import resources
+from app.models.base_models import Document, User, UserStats
+from app.services.stats_service import StatsDelta, document_stats
+
+
+def _describe_drift(stored: Optional[UserStats], expected: StatsDelta) -> List[str]:
+    """Liste lisible des écarts entre la ligne stockée et le recalcul."""
+    current = {
+        "documents_count": stored.documents_count if stored else 0,
+        "type_counts": dict(stored.type_counts or {}) if stored else {},
+        "total_amount": stored.total_amount if stored else 0,
+        "pending_actions": stored.pending_actions if stored else 0,
+        "storage_bytes": stored.storage_bytes if stored else 0,
+    }
+    target = {
+        "documents_count": expected.documents,
+        "type_counts": {key: count for key, count in expected.types.items() if count},
+        "total_amount": expected.amount,
+        "pending_actions": expected.actions,
+        "storage_bytes": expected.storage,
+    }
+    return [
+        f"{key}: {current[key]} -> {target[key]}"
+        for key in target
+        if current[key] != target[key]
+    ]
+
+
+async def rebuild_user(user_id: str, check_only: bool) -> List[str]:
+    """Recalcule les statistiques d'un utilisateur dans une seule transaction."""
+    async with new_session() as session:
+        # Crée la ligne si besoin puis la verrouille : les mises à jour incrémentales
+        # concurrentes attendent la fin du recalcul, aucun delta n'est perdu.
+        await session.execute(
+            text("INSERT INTO user_stats (user_id) VALUES (:user_id) ON CONFLICT DO NOTHING"),
+            {"user_id": user_id},
+        )
+        stored = (
+            await session.execute(
+                select(UserStats).filter(UserStats.user_id == user_id).with_for_update()
+            )
+        ).scalars().first()
+
+        expected = StatsDelta()
+        rows = await session.stream(
+            select(
+                Document.ai_type, Document.ai_actions,
+                Document.ai_montants, Document.file_size,
+            )
+            .filter(Document.owner_id == user_id)
+            .execution_options(yield_per=500)
+        )
+        async for row in rows:
+            expected = expected + document_stats(row)
+
+        drift = _describe_drift(stored, expected)
+        if drift and not check_only:
+            stored.documents_count = expected.documents
+            stored.type_counts = {key: count for key, count in expected.types.items() if count}
+            stored.total_amount = expected.amount
+            stored.pending_actions = expected.actions
+            stored.storage_bytes = expected.storage
+            await session.commit()
+        else:
+            await session.rollback()
+        return drift
+
+
+async def main(user_id: Optional[str], check_only: bool) -> int:
+    try:
+        return await _rebuild_all(user_id, check_only)
+    finally:
+        await resources.aclose()
+
+
+async def _rebuild_all(user_id: Optional[str], check_only: bool) -> int:
+    if user_id:
+        user_ids = [user_id]
+    else:
+        async with new_session() as session:
+            user_ids = (await session.execute(select(User.id))).scalars().all()
+
+    drifted = 0
+    for uid in user_ids:
+        drift = await rebuild_user(uid, check_only)
+        if drift:
+            drifted += 1
+            print(json.dumps({"user_id": uid, "drift": drift}, ensure_ascii=False, default=str))
+
+    action = "détecté(s)" if check_only else "corrigé(s)"
+    print(f"{len(user_ids)} utilisateur(s) vérifié(s), {drifted} écart(s) {action}.")
+    return 1 if (check_only and drifted) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalcule les statistiques du tableau de bord.")
+    parser.add_argument("--user", dest="user_id", help="Limiter à un utilisateur")
+    parser.add_argument("--check", action="store_true", help="Signaler les écarts sans corriger")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.user_id, args.check)))
@@ -0,0 +1,68 @@
+"""
+Archive les originaux froids dans le tier froid, puis compacte les paquets.
+
+Usage (par exemple chaque nuit, depuis cron) :
+    python -m app.commands.tier_storage                 # archivage puis compactage
+    python -m app.commands.tier_storage --dry-run       # compte les candidats sans rien déplacer
+    python -m app.commands.tier_storage --measure       # bucket chaud avant/après (objets, taille, listage)
+    python -m app.commands.tier_storage --compact-only
+    python -m app.commands.tier_storage --limit 10000
+
+Une seule exécution à la fois (verrou consultatif PostgreSQL) : une seconde
+commande lancée pendant la première s'arrête aussitôt (code 2).
+"""
+import argparse
+import asyncio
+import json
+import sys
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.core.database import new_session
+from app.core.resources import resources
+from app.services import tiering_service
+from app.services.storage_service import check_archive_bucket, measure_bucket
+
+_LOCK_SQL = "hashtext('aideo_storage_tiering')"
+
+
+async def run(dry_run: bool, compact_only: bool, measure: bool, limit: Optional[int]) -> int:
+    async with new_session() as lock_session:
+        locked = (await lock_session.execute(text(f"SELECT pg_try_advisory_lock({_LOCK_SQL})"))).scalar()
+        if not locked:
+            print("Tiering déjà en cours ailleurs, abandon.")
+            return 2
+        try:
+            report = {}
+            if measure:
+                report["hot_before"] = await measure_bucket()
+            if not dry_run:
+                await check_archive_bucket()
+            if not compact_only:
+                report["archive"] = await tiering_service.archive_cold_documents(max_documents=limit, dry_run=dry_run)
+            if not dry_run:
+                report["compact"] = await tiering_service.compact_bundles()
+            if measure and not dry_run:
+                report["hot_after"] = await measure_bucket()
+            print(json.dumps(report, ensure_ascii=False, indent=2, default=str))
+            return 0
+        finally:
+            await lock_session.execute(text(f"SELECT pg_advisory_unlock({_LOCK_SQL})"))
+
+
+async def main(*args) -> int:
+    try:
+        return await run(*args)
+    finally:
+        await resources.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive les originaux froids (tier froid) et compacte les paquets.")
+    parser.add_argument("--dry-run", action="store_true", help="Compter les candidats sans rien déplacer")
+    parser.add_argument("--compact-only", action="store_true", help="Compacter les paquets sans archiver")
+    parser.add_argument("--measure", action="store_true", help="Mesurer le bucket chaud avant et après")
+    parser.add_argument("--limit", type=int, default=None, help="Nombre maximal d'originaux archivés")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.dry_run, args.compact_only, args.measure, args.limit)))
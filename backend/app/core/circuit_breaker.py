@@ -0,0 +1,202 @@
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.core.metrics import CIRCUIT_REJECTED_TOTAL, CIRCUIT_TRANSITIONS_TOTAL
+
+# --------------------------------------------------
+# Disjoncteurs autour des dépendances externes (Ollama, MinIO)
+# --------------------------------------------------
+# Sans disjoncteur, une panne d'Ollama coûte à chaque scan le timeout complet
+# (AI_TIMEOUT) avant la structure de repli, et une panne de MinIO les
+# tentatives de boto3. Le disjoncteur observe le taux d'échec sur une
+# fenêtre glissante :
+# - fermé : les appels passent ;
+# - ouvert (taux d'échec >= CIRCUIT_FAILURE_RATE sur au moins
+#   CIRCUIT_MIN_CALLS appels) : les appels échouent immédiatement
+#   (CircuitOpenError) pendant CIRCUIT_OPEN_SECONDS ;
+# - semi-ouvert : CIRCUIT_HALF_OPEN_PROBES appel(s) d'essai ; un succès
+#   referme le disjoncteur, un échec le rouvre.
+#
+# L'état est propre à chaque worker et n'est manipulé que depuis la boucle
+# d'événements (les appels bloquants tournent dans un thread, sous le disjoncteur).
+
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", 0.5))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", 5))
+CIRCUIT_WINDOW_SECONDS = float(os.getenv("CIRCUIT_WINDOW_SECONDS", 60))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", 30))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", 1))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+# Valeur de la jauge aideo_circuit_state
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Disjoncteurs du processus, par nom (routes /system/circuit-breakers et /metrics)
+BREAKERS: Dict[str, "CircuitBreaker"] = {}
+
+
+class CircuitOpenError(Exception):
+    """Dépendance considérée comme indisponible : l'appel n'a pas été tenté."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} indisponible (disjoncteur ouvert, nouvel essai dans {retry_after:.0f}s)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_rate: float = CIRCUIT_FAILURE_RATE,
+        min_calls: int = CIRCUIT_MIN_CALLS,
+        window_seconds: float = CIRCUIT_WINDOW_SECONDS,
+        open_seconds: float = CIRCUIT_OPEN_SECONDS,
+        half_open_probes: int = CIRCUIT_HALF_OPEN_PROBES,
+        is_failure: Callable[[BaseException], bool] = lambda error: True,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """is_failure : les exceptions pour lesquelles il renvoie False (ex. 404) comptent comme des succès."""
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.is_failure = is_failure
+        self._clock = clock
+
+        self.state = CLOSED
+        self._calls: Deque[Tuple[float, bool]] = deque()  # (instant, échec)
+        self._opened_at = 0.0
+        self._probes = 0
+        self.rejected = 0
+        self.last_error: Optional[str] = None
+        BREAKERS[name] = self
+
+    # --- Transitions ---
+
+    def _transition(self, state: str, reason: str = ""):
+        if state == self.state:
+            return
+        print(f"Disjoncteur {self.name} : {self.state} -> {state}{f' ({reason})' if reason else ''}")
+        self.state = state
+        CIRCUIT_TRANSITIONS_TOTAL.inc(name=self.name, state=state)
+        if state == OPEN:
+            self._opened_at = self._clock()
+        self._probes = 0
+        self._calls.clear()
+
+    def _prune(self, now: float):
+        while self._calls and self._calls[0][0] < now - self.window_seconds:
+            self._calls.popleft()
+
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.open_seconds - self._clock())
+
+    def is_open(self) -> bool:
+        """Ouvert et délai non écoulé : les appels sont refusés."""
+        return self.state == OPEN and self.retry_after() > 0
+
+    def _reject(self):
+        self.rejected += 1
+        CIRCUIT_REJECTED_TOTAL.inc(name=self.name)
+        raise CircuitOpenError(self.name, self.retry_after())
+
+    # --- Appels ---
+
+    def check(self):
+        """Échec immédiat si le disjoncteur est ouvert (sans réserver d'appel d'essai)."""
+        if self.is_open():
+            self._reject()
+
+    def acquire(self):
+        """Autorise un appel ou lève CircuitOpenError ; l'appel doit être suivi de record()."""
+        if self.state == OPEN:
+            if self.retry_after() > 0:
+                self._reject()
+            self._transition(HALF_OPEN, "appel d'essai")
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_probes:
+                self._reject()
+            self._probes += 1
+
+    def record(self, success: bool, error: Optional[str] = None):
+        if not success:
+            self.last_error = error
+        if self.state == HALF_OPEN:
+            if success:
+                self._transition(CLOSED, "appel d'essai réussi")
+            else:
+                self._transition(OPEN, f"appel d'essai en échec : {error}")
+            return
+        if self.state == OPEN:
+            return  # appel lancé avant l'ouverture
+
+        now = self._clock()
+        self._calls.append((now, not success))
+        self._prune(now)
+        failures = sum(1 for _, failed in self._calls if failed)
+        if len(self._calls) >= self.min_calls and failures / len(self._calls) >= self.failure_rate:
+            self._transition(OPEN, f"{failures}/{len(self._calls)} échecs en {self.window_seconds:.0f}s")
+
+    def release(self):
+        """Appel abandonné (annulation) : ni succès ni échec, l'éventuel créneau d'essai est rendu."""
+        if self.state == HALF_OPEN and self._probes:
+            self._probes -= 1
+
+    @asynccontextmanager
+    async def guard(self):
+        """Encadre un appel : CircuitOpenError si ouvert, résultat enregistré sinon."""
+        self.acquire()
+        try:
+            yield
+        except Exception as e:
+            failed = self.is_failure(e)
+            self.record(not failed, repr(e) if failed else None)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        else:
+            self.record(True)
+
+    # --- Supervision ---
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._prune(self._clock())
+        failures = sum(1 for _, failed in self._calls if failed)
+        return {
+            "state": self.state,
+            "calls_in_window": len(self._calls),
+            "failures_in_window": failures,
+            "failure_rate": round(failures / len(self._calls), 3) if self._calls else None,
+            "retry_after_seconds": round(self.retry_after(), 1) if self.state == OPEN else None,
+            "rejected": self.rejected,
+            "last_error": self.last_error,
+            "settings": {
+                "failure_rate": self.failure_rate,
+                "min_calls": self.min_calls,
+                "window_seconds": self.window_seconds,
+                "open_seconds": self.open_seconds,
+                "half_open_probes": self.half_open_probes,
+            },
+        }
+
+
+def breaker_states() -> Dict[str, Dict[str, Any]]:
+    return {name: breaker.snapshot() for name, breaker in BREAKERS.items()}
+
+
+def breaker_state_values() -> List[Tuple[Tuple[str, ...], float]]:
+    """Valeurs de la jauge aideo_circuit_state (0 fermé, 1 semi-ouvert, 2 ouvert)."""
+    values = []
+    for name, breaker in list(BREAKERS.items()):
+        # Un disjoncteur ouvert dont le délai est écoulé attend son appel d'essai
+        state = HALF_OPEN if breaker.state == OPEN and not breaker.is_open() else breaker.state
+        values.append(((name,), float(STATE_VALUES[state])))
+    return values
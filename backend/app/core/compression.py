@@ -0,0 +1,192 @@
+import asyncio
+import os
+import zlib
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli est optionnel : gzip seul est alors proposé
+    brotli = None
+
+# --------------------------------------------------
+# Compression négociée des réponses JSON (gzip / brotli)
+# --------------------------------------------------
+# L'encodage est choisi selon l'en-tête Accept-Encoding du client (brotli
+# préféré à qualité égale). Ne sont compressées que les réponses JSON d'au
+# moins COMPRESSION_MIN_BYTES ; les réponses partielles (206), sans corps
+# ou déjà encodées sont transmises telles quelles. Les réponses en flux
+# (StreamingResponse) sont compressées au fil de l'eau, bloc par bloc.
+
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 1024))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 5))
+# Au-delà de cette taille, la compression est faite hors de la boucle d'événements
+COMPRESSION_THREAD_BYTES = int(os.getenv("COMPRESSION_THREAD_BYTES", 256 * 1024))
+
+_SKIPPED_STATUSES = {204, 206, 304}
+
+
+def available_encodings() -> tuple:
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def _encoding_weights(accept_encoding: str) -> Dict[str, float]:
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name.strip().lower()] = quality
+    return weights
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Encodage retenu parmi ceux acceptés par le client (None = pas de compression)."""
+    if not accept_encoding:
+        return None
+    weights = _encoding_weights(accept_encoding)
+
+    candidates = [
+        (weights.get(encoding, weights.get("*", 0.0)), -rank, encoding)
+        for rank, encoding in enumerate(available_encodings())
+    ]
+    quality, _, encoding = max(candidates)
+    return encoding if quality > 0 else None
+
+
+def accepts_encoding(accept_encoding: Optional[str], encoding: str) -> bool:
+    """Le client accepte-t-il cet encodage (ex : original stocké en gzip, servi tel quel) ?"""
+    if not accept_encoding:
+        return False
+    weights = _encoding_weights(accept_encoding)
+    return weights.get(encoding, weights.get("*", 0.0)) > 0
+
+
+def _is_json(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return media_type == "application/json" or media_type.endswith("+json") or media_type == "application/x-ndjson"
+
+
+class _StreamCompressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        """
+        Compresse un bloc et le vide aussitôt (sync flush) : le client reçoit
+        chaque bloc en entier (une ligne NDJSON complète, utile à la reprise
+        d'un export), au lieu d'attendre que le tampon du compresseur se remplisse.
+        """
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish() if self.encoding == "br" else self._compressor.flush()
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+        responder = _CompressionResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    """Retient l'en-tête de réponse jusqu'au premier bloc du corps pour décider."""
+
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self._start = None
+        self._compressor: Optional[_StreamCompressor] = None
+        self._passthrough = False
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self._start = message
+            headers = Headers(raw=message.get("headers", []))
+            self._passthrough = (
+                message["status"] in _SKIPPED_STATUSES
+                or message["status"] < 200
+                or "content-encoding" in headers
+                or not _is_json(headers.get("content-type", ""))
+            )
+            if not self._passthrough:
+                MutableHeaders(raw=message.setdefault("headers", [])).add_vary_header("Accept-Encoding")
+            return
+
+        if message["type"] != "http.response.body":
+            return await self._send(message)
+
+        if self._passthrough:
+            await self._flush_start()
+            return await self._send(message)
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._compressor is None and not more_body:
+            # Réponse complète en un seul bloc
+            if len(body) < self.minimum_size:
+                await self._flush_start()
+                return await self._send(message)
+            if len(body) >= COMPRESSION_THREAD_BYTES:
+                compressed = await asyncio.to_thread(compress_body, body, self.encoding)
+            else:
+                compressed = compress_body(body, self.encoding)
+            self._set_encoding_headers(len(compressed))
+            await self._flush_start()
+            return await self._send({"type": "http.response.body", "body": compressed})
+
+        if self._compressor is None:
+            # Réponse en flux : longueur inconnue, compression au fil de l'eau
+            self._compressor = _StreamCompressor(self.encoding)
+            self._set_encoding_headers(None)
+            await self._flush_start()
+
+        chunk = self._compressor.compress(body)
+        if not more_body:
+            chunk += self._compressor.finish()
+        if chunk or not more_body:
+            await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    def _set_encoding_headers(self, length: Optional[int]):
+        headers = MutableHeaders(raw=self._start.setdefault("headers", []))
+        headers["Content-Encoding"] = self.encoding
+        if length is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(length)
+
+    async def _flush_start(self):
+        if self._start is not None:
+            start, self._start = self._start, None
+            await self._send(start)
@@ -1,10 +1,15 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import os
+import time
 from app.models.base import Base
+from app.core.resources import resources
+from app.core.metrics import DB_POOL_TIMEOUTS_TOTAL, DB_POOL_WAIT_SECONDS, DB_POOL_WAITING
 # NOTE : Les valeurs par défaut sont ici pour le cas où .env ou Docker Compose ne fonctionnent pas
 DATABASE_URL = os.getenv(
-    "DATABASE_URL", 
+    "DATABASE_URL",
     "postgresql+asyncpg://postgres:postgres@db:5432/aideo_db" # Utilisation de 'db' pour l'interne Docker
 )
 TEST_DATABASE_URL = os.getenv(
@@ -12,35 +17,79 @@ TEST_DATABASE_URL = os.getenv(
     "postgresql+asyncpg://postgres:postgres@db:5432/aideo_test_db" # Base de données de test
 )
 
-# Détermine l'URL à utiliser (Logique critique pour les tests unitaires)
-if os.environ.get("TESTING") == "True":
-    ASYNC_DATABASE_URL = TEST_DATABASE_URL
-else:
-    ASYNC_DATABASE_URL = DATABASE_URL
-    
-# 1. Création du moteur de connexion asynchrone
-# Utilisation de ASYNC_DATABASE_URL pour se connecter soit à la BDD de prod, soit à celle de test.
-engine = create_async_engine(ASYNC_DATABASE_URL, echo=False)
-
-# 2. Suppression de la ligne incorrecte : Base = declarative_base() 
-# La classe Base est importée depuis base_models.py, elle ne doit pas être redéfinie ici.
-
-# 3. Création du générateur de sessions asynchrones
-AsyncSessionLocal = sessionmaker(
-    engine, 
-    class_=AsyncSession, 
-    expire_on_commit=False
-)
+# Pool de connexions (par processus) : valeurs par défaut de SQLAlchemy
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+
+
+# 1. Détermine l'URL à utiliser (Logique critique pour les tests unitaires)
+# Évaluée à la création du moteur (et non à l'import) : TESTING peut donc être
+# positionné après l'import de l'application.
+def get_database_url() -> str:
+    if os.environ.get("TESTING") == "True":
+        return TEST_DATABASE_URL
+    return DATABASE_URL
+
+
+# 2. Fabriques utilisées par le conteneur de ressources (app/core/resources.py)
+# Le moteur n'est plus une variable globale : il est créé au premier usage.
+class MeasuredPool(AsyncAdaptedQueuePool):
+    """
+    Pool qui mesure l'attente d'une connexion libre (aideo_db_pool_wait_seconds).
+    Une attente qui grandit signale des connexions gardées trop longtemps.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        DB_POOL_WAITING.inc()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            DB_POOL_TIMEOUTS_TOTAL.inc()
+            raise
+        finally:
+            DB_POOL_WAITING.dec()
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+
+def create_engine_from_env(**pool_options):
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        **pool_options,
+    }
+    return create_async_engine(get_database_url(), echo=False, poolclass=MeasuredPool, **options)
+
+
+def create_session_factory(engine):
+    return sessionmaker(
+        engine,
+        class_=AsyncSession,
+        expire_on_commit=False
+    )
+
+
+# 3. Accès au moteur et aux sessions
+def get_engine():
+    return resources.engine
+
+
+def new_session() -> AsyncSession:
+    """Ouvre une session hors requête HTTP (commandes, tâches de fond)."""
+    return resources.session_factory()
+
 
 # 4. Fonction utilitaire pour obtenir une session (Dépendance FastAPI)
 async def get_db_session():
     """Fournit une session de base de données asynchrone pour FastAPI."""
-    async with AsyncSessionLocal() as session:
+    async with new_session() as session:
         yield session
 
 # 5. Fonction pour créer toutes les tables
 async def init_db():
     """Crée toutes les tables définies par les modèles."""
-    async with engine.begin() as conn:
+    async with get_engine().begin() as conn:
         # Utilise la Base importée pour créer les tables
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await conn.run_sync(Base.metadata.create_all)
@@ -0,0 +1,71 @@
+import hashlib
+from typing import Optional, Tuple
+
+# --------------------------------------------------
+# Requêtes conditionnelles (ETag / If-None-Match) et partielles (Range)
+# --------------------------------------------------
+
+
+def document_etag(document_id: int, version: int) -> str:
+    """
+    ETag faible de la fiche d'un document : change à chaque nouvelle version
+    (PATCH, réanalyse). Faible car le corps peut être compressé ou non.
+    """
+    return f'W/"doc-{document_id}-v{version}"'
+
+
+def file_etag(file_url: str) -> str:
+    """ETag fort de l'original : la clé de stockage (UUID) n'est jamais réécrite."""
+    return '"' + hashlib.sha1(file_url.encode()).hexdigest()[:20] + '"'
+
+
+def _opaque(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparaison faible (RFC 9110) entre If-None-Match et l'ETag courant."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(_opaque(candidate.strip()) == _opaque(etag) for candidate in if_none_match.split(","))
+
+
+class RangeNotSatisfiable(Exception):
+    def __init__(self, size: int):
+        super().__init__(f"Plage hors du fichier ({size} octets)")
+        self.size = size
+
+
+def parse_range(range_header: Optional[str], size: Optional[int]) -> Optional[Tuple[int, int]]:
+    """
+    Analyse un en-tête Range à une seule plage ("bytes=0-499", "bytes=500-",
+    "bytes=-500") et renvoie (début, fin) inclusifs. None : servir le fichier
+    entier (pas de Range, syntaxe non reconnue, plages multiples ou taille
+    inconnue). Lève RangeNotSatisfiable si la plage est hors du fichier.
+    """
+    if not range_header or size is None:
+        return None
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    first, sep, last = ranges.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first == "":
+            # Suffixe : les N derniers octets
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable(size)
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(size)
+    if start > end:
+        return None
+    return start, min(end, size - 1)
@@ -0,0 +1,389 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# --------------------------------------------------
+# Métriques du processus, exposées au format texte Prometheus (GET /metrics)
+# --------------------------------------------------
+# Implémentation volontairement minimale (compteurs, jauges, histogrammes
+# avec étiquettes) pour ne pas ajouter de dépendance. Les valeurs sont propres
+# à chaque processus : en multi-worker, Prometheus agrège par instance.
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} attend les étiquettes {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        # Dans HELP, seuls la barre oblique inverse et le saut de ligne sont échappés
+        help_text = self.documentation.replace("\\", "\\\\").replace("\n", "\\n")
+        return [f"# HELP {self.name} {help_text}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """Jauge : valeur posée par le code, ou calculée au moment de la collecte (`callback`)."""
+    type_name = "gauge"
+
+    def __init__(self, *args, callback: Optional[Callable[[], Iterable[Tuple[LabelValues, float]]]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        if self._callback is not None:
+            items = list(self._callback())
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+# Secondes : de 5 ms (requêtes rapides) à 2 min (OCR/LLM lents)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Par jeu d'étiquettes : [compteurs par borne..., somme, total]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        lines = self.header()
+        for key, state in items:
+            cumulative = 0.0
+            for index, bound in enumerate(self.buckets):
+                cumulative += state[index]
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(state[-1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Type MIME du format texte Prometheus
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# --------------------------------------------------
+# Étiquettes normalisées (cardinalité bornée)
+# --------------------------------------------------
+
+KNOWN_CONTENT_TYPES = {"image/jpeg", "image/png", "image/tiff", "image/webp", "image/gif", "application/pdf"}
+
+
+def content_type_label(content_type: Optional[str]) -> str:
+    return content_type if content_type in KNOWN_CONTENT_TYPES else "other"
+
+
+def size_bucket_label(size: int) -> str:
+    if size < 100 * 1024:
+        return "lt_100k"
+    if size < 1024 * 1024:
+        return "100k_1m"
+    if size < 5 * 1024 * 1024:
+        return "1m_5m"
+    return "gt_5m"
+
+
+# --------------------------------------------------
+# Métriques de l'application
+# --------------------------------------------------
+
+PIPELINE_STAGE_SECONDS = REGISTRY.register(Histogram(
+    "aideo_scan_stage_seconds",
+    "Durée de chaque étape du scan (stub_user, phash, duplicate, upload, ocr, llm, db_insert).",
+    ("stage", "content_type", "size_bucket"),
+))
+
+SCANS_TOTAL = REGISTRY.register(Counter(
+    "aideo_scans_total",
+    "Scans traités, par résultat (success, empty_ocr, error).",
+    ("status", "content_type", "size_bucket"),
+))
+
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "aideo_http_request_seconds",
+    "Latence des requêtes HTTP par route.",
+    ("method", "route", "status"),
+))
+
+LLM_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "aideo_llm_queue_depth",
+    "Appels LLM en attente d'un créneau de concurrence, par niveau de modèle (small, large).",
+    ("tier",),
+))
+
+LLM_INFLIGHT = REGISTRY.register(Gauge(
+    "aideo_llm_inflight",
+    "Appels LLM en cours vers Ollama, par niveau de modèle.",
+    ("tier",),
+))
+
+LLM_CALL_SECONDS = REGISTRY.register(Histogram(
+    "aideo_llm_call_seconds",
+    "Durée des appels LLM par niveau de modèle et résultat (ok, error).",
+    ("tier", "outcome"),
+))
+
+LLM_ESCALATIONS_TOTAL = REGISTRY.register(Counter(
+    "aideo_llm_escalations_total",
+    "Analyses confiées au grand modèle, par raison (long, error, circuit, invalid, type).",
+    ("reason",),
+))
+
+
+CIRCUIT_REJECTED_TOTAL = REGISTRY.register(Counter(
+    "aideo_circuit_rejected_total",
+    "Appels refusés sans être tentés (disjoncteur ouvert), par dépendance.",
+    ("name",),
+))
+
+CIRCUIT_TRANSITIONS_TOTAL = REGISTRY.register(Counter(
+    "aideo_circuit_transitions_total",
+    "Changements d'état des disjoncteurs, par dépendance et nouvel état (closed, open, half_open).",
+    ("name", "state"),
+))
+
+
+ARCHIVE_READS_TOTAL = REGISTRY.register(Counter(
+    "aideo_archive_reads_total",
+    "Originaux lus dans un paquet du tier froid, par route (download, export).",
+    ("route",),
+))
+
+ARCHIVE_RESTORES_TOTAL = REGISTRY.register(Counter(
+    "aideo_archive_restores_total",
+    "Restaurations d'originaux archivés vers le bucket chaud, par résultat (restored, skipped, failed).",
+    ("outcome",),
+))
+
+
+def _circuit_state_values():
+    from app.core.circuit_breaker import breaker_state_values
+
+    return breaker_state_values()
+
+
+CIRCUIT_STATE = REGISTRY.register(Gauge(
+    "aideo_circuit_state",
+    "État des disjoncteurs (0 fermé, 1 semi-ouvert, 2 ouvert), par dépendance.",
+    ("name",),
+    callback=_circuit_state_values,
+))
+
+
+def _inflight_scans_values():
+    from app.core.resources import resources
+
+    return [((), float(resources.inflight_scans))]
+
+
+SCANS_INFLIGHT = REGISTRY.register(Gauge(
+    "aideo_scans_inflight",
+    "Scans en cours dans ce processus.",
+    callback=_inflight_scans_values,
+))
+
+
+def _db_pool_values():
+    from app.core.resources import resources
+
+    engine = resources.started_engine
+    if engine is None:
+        return []
+    pool = engine.pool
+    values = []
+    for state in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, state, None)
+        if callable(method):
+            values.append(((state,), float(method())))
+    return values
+
+
+DB_POOL_CONNECTIONS = REGISTRY.register(Gauge(
+    "aideo_db_pool_connections",
+    "État du pool de connexions SQLAlchemy (size, checkedin, checkedout, overflow).",
+    ("state",),
+    callback=_db_pool_values,
+))
+
+# Attente d'une connexion libre (pool plein) : alimentées par app/core/database.py
+DB_POOL_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "aideo_db_pool_wait_seconds",
+    "Attente d'une connexion du pool SQLAlchemy avant de pouvoir exécuter une requête.",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+))
+
+DB_POOL_WAITING = REGISTRY.register(Gauge(
+    "aideo_db_pool_waiting",
+    "Requêtes en attente d'une connexion du pool.",
+))
+
+DB_POOL_TIMEOUTS_TOTAL = REGISTRY.register(Counter(
+    "aideo_db_pool_timeouts_total",
+    "Attentes de connexion abandonnées après DB_POOL_TIMEOUT secondes.",
+))
+
+
+def _user_cache_values():
+    from app.core.user_cache import user_cache
+
+    stats = user_cache.stats()
+    return [((key,), float(stats[key])) for key in ("hits", "misses", "evictions", "expirations", "size")]
+
+
+USER_CACHE = REGISTRY.register(Gauge(
+    "aideo_user_cache",
+    "Cache des utilisateurs authentifiés (succès, échecs, évictions, taille).",
+    ("stat",),
+    callback=_user_cache_values,
+))
+
+
+# --------------------------------------------------
+# Middleware ASGI : latence HTTP par route
+# --------------------------------------------------
+
+class HTTPMetricsMiddleware:
+    """
+    Mesure chaque requête HTTP. La route est identifiée par le nom de la
+    fonction qui la traite (ex : get_document_details) : cardinalité bornée,
+    indépendante des identifiants présents dans l'URL.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            endpoint = scope.get("endpoint")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(endpoint, "__name__", None) or "unmatched",
+                status=str(status_code),
+            )
@@ -0,0 +1,364 @@
+import asyncio
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as CounterDict
+from typing import Dict, List, Optional
+
+# --------------------------------------------------
+# Profilage à la demande d'une requête (échantillonnage de piles)
+# --------------------------------------------------
+# Désactivé par défaut : le middleware n'est alors même pas installé
+# (aucun coût). Activé (PROFILING_ENABLED=true), une requête est profilée si :
+# - elle porte l'en-tête X-Profile: 1 accompagné d'un X-Admin-Token valide ;
+# - ou elle est tirée au sort (PROFILE_SAMPLE_RATE, entre 0 et 1).
+#
+# Un thread échantillonne la pile de la requête toutes les PROFILE_INTERVAL_MS :
+# - quand la tâche de la requête s'exécute sur la boucle : pile réelle, temps
+#   mur et temps CPU (horloge CPU du thread de la boucle) ;
+# - quand elle attend (réseau, LLM, BDD...) : pile des coroutines suspendues,
+#   préfixée "[attente]", temps mur seulement ;
+# - threads de travail lancés via `to_thread` ci-dessous : pile du thread,
+#   préfixée "[thread]", temps mur et CPU.
+#
+# Le résultat est écrit dans PROFILE_DIR au format "folded stacks"
+# (flamegraph.pl, speedscope...) : <id>.wall.folded et <id>.cpu.folded, valeurs
+# en microsecondes, plus <id>.json (métadonnées, fonctions les plus coûteuses).
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/aideo-profiles")
+# Nombre de profils conservés sur disque (les plus anciens sont supprimés)
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", 200))
+# Profils simultanés au maximum (un thread d'échantillonnage chacun)
+PROFILE_MAX_CONCURRENT = int(os.getenv("PROFILE_MAX_CONCURRENT", 2))
+
+PROFILE_KINDS = ("wall", "cpu")
+
+_active_profile: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar(
+    "active_profile", default=None
+)
+_profile_slots = threading.BoundedSemaphore(PROFILE_MAX_CONCURRENT)
+
+
+def _frame_label(code) -> str:
+    filename = code.co_filename
+    # Chemins raccourcis : "app/services/ocr_service.py" plutôt que le chemin absolu
+    marker = f"{os.sep}app{os.sep}"
+    if marker in filename:
+        filename = "app" + os.sep + filename.split(marker, 1)[1]
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ",")
+
+
+def _is_app_frame(label: str) -> bool:
+    return any(f"(app{os.sep}{package}{os.sep}" in label for package in ("api", "services"))
+
+
+def _thread_cpu_time(thread_id: int) -> Optional[float]:
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+    except (AttributeError, OSError, ProcessLookupError):
+        return None
+
+
+class RequestProfile:
+    """Profil d'une requête : échantillonneur dans un thread dédié, piles agrégées."""
+
+    def __init__(self, task: asyncio.Task, label: str, interval: float = PROFILE_INTERVAL_MS / 1000):
+        self.id = uuid.uuid4().hex
+        self.label = label
+        self.interval = interval
+        self.task = task
+        self.loop_thread_id = threading.get_ident()
+        self.wall: CounterDict = CounterDict()
+        self.cpu: CounterDict = CounterDict()
+        self.samples = 0
+        self.started_at = time.time()
+        self.duration = 0.0
+        self._threads: Dict[int, Optional[float]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._run, name=f"profiler-{self.id[:8]}", daemon=True)
+
+    # --- Threads de travail rattachés à la requête ---
+
+    def attach_thread(self):
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._threads[thread_id] = _thread_cpu_time(thread_id)
+
+    def detach_thread(self):
+        with self._lock:
+            self._threads.pop(threading.get_ident(), None)
+
+    # --- Échantillonnage ---
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+        self.duration = time.perf_counter() - self._start
+
+    def _task_frames(self) -> List:
+        """Pile de la tâche suspendue : chaîne des await, de la racine vers la plus profonde."""
+        frames = []
+        awaitable = self.task.get_coro()
+        while awaitable is not None and len(frames) < 256:
+            frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+            if frame is None:
+                break
+            frames.append(frame)
+            awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+        return frames
+
+    def _loop_frames(self, leaf) -> List:
+        """Pile réelle du thread de la boucle, coupée à la coroutine racine de la tâche."""
+        root = getattr(self.task.get_coro(), "cr_frame", None)
+        frames = []
+        frame = leaf
+        while frame is not None:
+            frames.append(frame)
+            if frame is root:
+                break
+            frame = frame.f_back
+        frames.reverse()
+        return frames
+
+    def _record(self, stack: List[str], wall: float, cpu: Optional[float]):
+        if not stack:
+            return
+        key = ";".join(stack)
+        self.wall[key] += wall
+        if cpu:
+            self.cpu[key] += cpu
+
+    def _sample(self, elapsed: float, loop_cpu: Dict[str, Optional[float]]):
+        frames = sys._current_frames()
+        prefix = [self.label]
+
+        # Requête : en cours d'exécution sur la boucle, ou suspendue
+        now_cpu = _thread_cpu_time(self.loop_thread_id)
+        cpu_delta = None
+        if now_cpu is not None and loop_cpu["last"] is not None:
+            cpu_delta = max(now_cpu - loop_cpu["last"], 0.0)
+        loop_cpu["last"] = now_cpu
+
+        loop = self.task.get_loop()
+        if asyncio.current_task(loop) is self.task and self.loop_thread_id in frames:
+            stack = [_frame_label(f.f_code) for f in self._loop_frames(frames[self.loop_thread_id])]
+            self._record(prefix + stack, elapsed, cpu_delta)
+        else:
+            stack = [_frame_label(f.f_code) for f in self._task_frames()]
+            self._record(prefix + ["[attente]"] + stack, elapsed, None)
+
+        # Threads de travail rattachés (OCR, S3...)
+        with self._lock:
+            threads = dict(self._threads)
+        for thread_id, last_cpu in threads.items():
+            leaf = frames.get(thread_id)
+            if leaf is None:
+                continue
+            thread_frames = []
+            while leaf is not None:
+                thread_frames.append(leaf)
+                leaf = leaf.f_back
+            now = _thread_cpu_time(thread_id)
+            delta = (now - last_cpu) if (now is not None and last_cpu is not None) else None
+            with self._lock:
+                if thread_id in self._threads:
+                    self._threads[thread_id] = now
+            stack = [_frame_label(f.f_code) for f in reversed(thread_frames)]
+            self._record(prefix + ["[thread]"] + stack, elapsed, delta)
+
+        self.samples += 1
+
+    def _run(self):
+        loop_cpu = {"last": _thread_cpu_time(self.loop_thread_id)}
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            self._sample(now - last, loop_cpu)
+            last = now
+
+    # --- Export ---
+
+    def folded(self, kind: str) -> str:
+        counts = self.wall if kind == "wall" else self.cpu
+        return "".join(
+            f"{stack} {int(round(seconds * 1_000_000))}\n"
+            for stack, seconds in sorted(counts.items())
+            if seconds > 0
+        )
+
+    def summary(self, top: int = 25) -> dict:
+        """
+        self : temps passé dans la fonction elle-même (feuille de la pile) ;
+        app : temps inclusif des routes et services (app/api, app/services).
+        """
+        own = {kind: CounterDict() for kind in PROFILE_KINDS}
+        app = {kind: CounterDict() for kind in PROFILE_KINDS}
+        for kind, counts in (("wall", self.wall), ("cpu", self.cpu)):
+            for stack, seconds in counts.items():
+                labels = stack.split(";")[1:]
+                own[kind][labels[-1]] += seconds
+                for label in set(labels):
+                    if _is_app_frame(label):
+                        app[kind][label] += seconds
+
+        def _top(functions):
+            return {
+                kind: [
+                    {"function": label, "seconds": round(seconds, 6)}
+                    for label, seconds in functions[kind].most_common(top)
+                ]
+                for kind in PROFILE_KINDS
+            }
+
+        return {
+            "id": self.id,
+            "label": self.label,
+            "started_at": self.started_at,
+            "duration_s": round(self.duration, 6),
+            "samples": self.samples,
+            "interval_ms": self.interval * 1000,
+            "cpu_s": round(sum(self.cpu.values()), 6),
+            "self": _top(own),
+            "app": _top(app),
+        }
+
+    def save(self, directory: str = PROFILE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        for kind in PROFILE_KINDS:
+            with open(os.path.join(directory, f"{self.id}.{kind}.folded"), "w") as handle:
+                handle.write(self.folded(kind))
+        with open(os.path.join(directory, f"{self.id}.json"), "w") as handle:
+            json.dump(self.summary(), handle, ensure_ascii=False, indent=2)
+        _prune(directory)
+
+
+# --------------------------------------------------
+# Lecture et rotation des profils stockés
+# --------------------------------------------------
+
+def _prune(directory: str):
+    summaries = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith(".json")),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in summaries[:max(len(summaries) - PROFILE_MAX_FILES, 0)]:
+        profile_id = entry.name[:-len(".json")]
+        for name in [entry.name] + [f"{profile_id}.{kind}.folded" for kind in PROFILE_KINDS]:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(directory: str = PROFILE_DIR) -> List[dict]:
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(".json"):
+            with open(entry.path) as handle:
+                summary = json.load(handle)
+            summary.pop("self", None)
+            summary.pop("app", None)
+            profiles.append(summary)
+    return sorted(profiles, key=lambda profile: profile["started_at"], reverse=True)
+
+
+def profile_path(profile_id: str, kind: str, directory: str = PROFILE_DIR) -> Optional[str]:
+    """Chemin d'un fichier de profil, ou None (identifiant invalide ou absent)."""
+    try:
+        uuid.UUID(hex=profile_id)
+    except ValueError:
+        return None
+    suffix = "json" if kind == "summary" else f"{kind}.folded"
+    path = os.path.join(directory, f"{profile_id}.{suffix}")
+    return path if os.path.isfile(path) else None
+
+
+# --------------------------------------------------
+# Threads de travail : rattachement au profil de la requête
+# --------------------------------------------------
+
+async def to_thread(func, *args, **kwargs):
+    """
+    Équivalent de asyncio.to_thread ; si la requête est profilée, le thread de
+    travail est échantillonné lui aussi (le contexte est copié dans le thread).
+    """
+    if _active_profile.get() is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    def run():
+        profile = _active_profile.get()
+        profile.attach_thread()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.detach_thread()
+
+    return await asyncio.to_thread(run)
+
+
+# --------------------------------------------------
+# Middleware ASGI (installé uniquement si PROFILING_ENABLED)
+# --------------------------------------------------
+
+def _wants_profile(scope) -> bool:
+    from app.core.security import is_admin_token
+
+    headers = dict(scope.get("headers") or [])
+    if headers.get(b"x-profile") in (b"1", b"true"):
+        token = headers.get(b"x-admin-token")
+        return is_admin_token(token.decode("latin-1") if token else None)
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+class ProfilingMiddleware:
+    """Profile les requêtes demandées ou tirées au sort ; renvoie X-Profile-Id."""
+
+    def __init__(self, app, directory: str = PROFILE_DIR):
+        self.app = app
+        self.directory = directory
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _wants_profile(scope):
+            return await self.app(scope, receive, send)
+        if not _profile_slots.acquire(blocking=False):
+            # Trop de profils en cours : la requête est servie sans profilage
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile(asyncio.current_task(), f"{scope['method']} {scope['path']}")
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile.id.encode())
+                ]
+            await send(message)
+
+        token = _active_profile.set(profile)
+        profile.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _active_profile.reset(token)
+            await asyncio.to_thread(profile.stop)
+            _profile_slots.release()
+            try:
+                await asyncio.to_thread(profile.save, self.directory)
+            except OSError as e:
+                print(f"Profil {profile.id} non enregistré : {e}")
@@ -0,0 +1,182 @@
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import text
+
+# --------------------------------------------------
+# Budgets par utilisateur (seau à jetons)
+# --------------------------------------------------
+# capacity : rafale autorisée ; refill_per_second : débit soutenu.
+# Les budgets sont configurables par variables d'environnement.
+
+@dataclass(frozen=True)
+class Budget:
+    name: str
+    capacity: float
+    refill_per_second: float
+
+
+def _budget(name: str, capacity: float, per_minute: float) -> Budget:
+    prefix = f"RATE_LIMIT_{name.upper()}"
+    return Budget(
+        name=name,
+        capacity=float(os.getenv(f"{prefix}_CAPACITY", capacity)),
+        refill_per_second=float(os.getenv(f"{prefix}_PER_MINUTE", per_minute)) / 60.0,
+    )
+
+
+BUDGETS: Dict[str, Budget] = {
+    budget.name: budget
+    for budget in (
+        _budget("uploads", capacity=10, per_minute=10),        # fichiers envoyés à /scan
+        _budget("ocr_seconds", capacity=120, per_minute=60),   # secondes de Tesseract
+        _budget("llm_calls", capacity=10, per_minute=10),      # appels à Ollama
+    )
+}
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "True") == "True"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # "memory" | "postgres"
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, budget: str, retry_after: float):
+        super().__init__(f"Budget '{budget}' épuisé")
+        self.budget = budget
+        self.retry_after = retry_after
+
+
+# --------------------------------------------------
+# Backends
+# --------------------------------------------------
+# Un backend implémente `consume(key, budget, cost, require)` et retourne
+# (accepté, secondes avant de réessayer). `require` est le solde minimal
+# exigé : il permet de vérifier un budget débité plus tard (ex : secondes
+# d'OCR, connues seulement après le traitement ; le solde peut alors devenir
+# négatif et la dette est remboursée par le remplissage).
+
+class InMemoryBackend:
+    """Seaux en mémoire du processus (défaut, un seul worker)."""
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    async def consume(self, key: str, budget: Budget, cost: float, require: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (budget.capacity, now))
+            tokens = min(budget.capacity, tokens + (now - updated) * budget.refill_per_second)
+            if tokens < require:
+                self._buckets[key] = (tokens, now)
+                return False, _retry_after(budget, require - tokens)
+            self._buckets[key] = (tokens - cost, now)
+            return True, 0.0
+
+
+class PostgresBackend:
+    """
+    Seaux partagés entre workers, stockés dans PostgreSQL (table
+    rate_limit_buckets) : la ligne est verrouillée le temps du calcul.
+    """
+
+    # extract() renvoie un numeric depuis PostgreSQL 14 : converti en float, comme les colonnes
+    _CONSUME_SQL = text("""
+        INSERT INTO rate_limit_buckets (key, tokens, updated_at)
+        VALUES (:key, :capacity, CAST(extract(epoch FROM clock_timestamp()) AS double precision))
+        ON CONFLICT (key) DO UPDATE SET key = EXCLUDED.key
+        RETURNING tokens, updated_at, CAST(extract(epoch FROM clock_timestamp()) AS double precision) AS now
+    """)
+    _UPDATE_SQL = text(
+        "UPDATE rate_limit_buckets SET tokens = :tokens, updated_at = :now WHERE key = :key"
+    )
+
+    async def consume(self, key: str, budget: Budget, cost: float, require: float) -> Tuple[bool, float]:
+        # Import local : le backend mémoire (défaut) n'a pas besoin de la base
+        from app.core.database import new_session
+
+        async with new_session() as session:
+            # L'upsert verrouille la ligne jusqu'au commit : pas de double débit
+            row = (await session.execute(
+                self._CONSUME_SQL, {"key": key, "capacity": budget.capacity}
+            )).one()
+            tokens = min(budget.capacity, row.tokens + (row.now - row.updated_at) * budget.refill_per_second)
+            accepted = tokens >= require
+            if accepted:
+                tokens -= cost
+            await session.execute(self._UPDATE_SQL, {"key": key, "tokens": tokens, "now": row.now})
+            await session.commit()
+
+        if not accepted:
+            return False, _retry_after(budget, require - tokens)
+        return True, 0.0
+
+
+def _retry_after(budget: Budget, missing: float) -> float:
+    if budget.refill_per_second <= 0:
+        return 3600.0
+    return missing / budget.refill_per_second
+
+
+# --------------------------------------------------
+# Limiteur
+# --------------------------------------------------
+
+class RateLimiter:
+    def __init__(self, backend=None, enabled: bool = RATE_LIMIT_ENABLED):
+        self.backend = backend or (PostgresBackend() if RATE_LIMIT_BACKEND == "postgres" else InMemoryBackend())
+        self.enabled = enabled
+
+    async def acquire(self, user_id: str, budget_name: str, cost: float = 1.0, require: Optional[float] = None):
+        """Débite `cost` jetons ; lève RateLimitExceeded si le solde est inférieur à `require` (= cost)."""
+        if not self.enabled:
+            return
+        budget = BUDGETS[budget_name]
+        accepted, retry_after = await self.backend.consume(
+            f"{budget_name}:{user_id}", budget, cost, cost if require is None else require
+        )
+        if not accepted:
+            raise RateLimitExceeded(budget_name, retry_after)
+
+    async def charge(self, user_id: str, budget_name: str, cost: float):
+        """Débit a posteriori (jamais refusé, peut rendre le solde négatif)."""
+        await self.acquire(user_id, budget_name, cost=cost, require=-math.inf)
+
+
+rate_limiter = RateLimiter()
+
+
+async def check_scan_budgets(user_id: str):
+    """
+    Admission d'un scan : vérifie d'abord les budgets débités plus tard
+    (OCR, LLM), puis débite l'upload. Un refus ne consomme donc rien.
+    """
+    await rate_limiter.acquire(user_id, "ocr_seconds", cost=0, require=1)
+    await rate_limiter.acquire(user_id, "llm_calls", cost=0, require=1)
+    await rate_limiter.acquire(user_id, "uploads", cost=1)
+
+
+def caller_key(user, request) -> str:
+    """
+    Identité dont les budgets d'un scan sont débités : l'utilisateur du jeton,
+    sinon l'adresse du client (derrière un proxy, celle transmise par
+    X-Forwarded-For si le serveur lui fait confiance). Jamais un seau commun
+    à tous les clients.
+    """
+    if user is not None:
+        return user.id
+    host = request.client.host if request.client else "inconnu"
+    return f"client:{host}"
+
+
+def too_many_requests(exc: RateLimitExceeded) -> HTTPException:
+    """Convertit un dépassement en réponse 429 avec l'en-tête Retry-After."""
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=f"Limite atteinte pour '{exc.budget}', réessayez plus tard.",
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
@@ -0,0 +1,134 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Any, Optional
+
+# --------------------------------------------------
+# Conteneur des ressources partagées du processus
+# --------------------------------------------------
+# Les clients (moteur SQLAlchemy, client S3, client HTTP vers Ollama) ne sont
+# plus créés à l'import des modules : ils sont construits au premier usage
+# et fermés par le lifespan de l'application (app/main.py). L'import de
+# app.main reste ainsi rapide, et les modules lourds (boto3, httpx...) ne
+# sont chargés que lorsqu'ils servent.
+#
+# Les fabriques sont importées localement : chaque service reste propriétaire
+# de sa configuration (variables d'environnement) et de son client.
+#
+# En mode multi-processus (gunicorn, voir gunicorn.conf.py), chaque worker
+# repart d'un conteneur vide après le fork : aucun client (socket, pool de
+# connexions) n'est partagé avec le processus maître.
+
+
+class ResourceContainer:
+    def __init__(self):
+        self._engine = None
+        self._session_factory = None
+        self._s3_client = None
+        self._http_client = None
+        # État des vérifications de démarrage (voir /health/ready)
+        self.ready = False
+        self.startup_error: Optional[str] = None
+        # Scans en cours (attendus à l'arrêt avant la fermeture des clients)
+        self.inflight_scans = 0
+        self._scans_idle: Optional[asyncio.Event] = None
+
+    # --- Base de données ---
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from app.core.database import create_engine_from_env
+            self._engine = create_engine_from_env()
+        return self._engine
+
+    @property
+    def started_engine(self):
+        """Moteur s'il a déjà été créé, sans le créer (collecte des métriques)."""
+        return self._engine
+
+    @property
+    def session_factory(self):
+        if self._session_factory is None:
+            from app.core.database import create_session_factory
+            self._session_factory = create_session_factory(self.engine)
+        return self._session_factory
+
+    # --- Stockage S3 / MinIO ---
+
+    @property
+    def s3_client(self) -> Any:
+        if self._s3_client is None:
+            from app.services.storage_service import create_s3_client
+            self._s3_client = create_s3_client()
+        return self._s3_client
+
+    # --- Client HTTP (Ollama) ---
+
+    @property
+    def http_client(self) -> Any:
+        if self._http_client is None:
+            from app.services.ai_service import create_http_client
+            self._http_client = create_http_client()
+        return self._http_client
+
+    # --- Scans en cours (arrêt gracieux) ---
+
+    @asynccontextmanager
+    async def track_scan(self):
+        self.inflight_scans += 1
+        try:
+            yield
+        finally:
+            self.inflight_scans -= 1
+            if self.inflight_scans == 0 and self._scans_idle is not None:
+                self._scans_idle.set()
+
+    async def drain_scans(self, timeout: float) -> int:
+        """Attend la fin des scans en cours ; renvoie le nombre de scans non terminés."""
+        if self.inflight_scans:
+            print(f"Arrêt : attente de {self.inflight_scans} scan(s) en cours (max {timeout}s)...")
+            self._scans_idle = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._scans_idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._scans_idle = None
+        return self.inflight_scans
+
+    # --- Fermeture (arrêt de l'application) ---
+
+    async def aclose(self):
+        """Ferme les clients ouverts ; ils seront recréés au prochain usage."""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+        if self._s3_client is not None:
+            self._s3_client.close()
+        if self._engine is not None:
+            await self._engine.dispose()
+        self._engine = self._session_factory = None
+        self._s3_client = self._http_client = None
+        self.ready = False
+
+    # --- Après un fork (workers gunicorn) ---
+
+    def reset_after_fork(self):
+        """
+        Oublie les clients hérités du processus parent sans les fermer : leurs
+        sockets appartiennent toujours au parent. Le worker recrée les siens.
+        """
+        if self._engine is not None:
+            self._engine.sync_engine.dispose(close=False)
+        self._engine = self._session_factory = None
+        self._s3_client = self._http_client = None
+        self.ready = False
+        self.startup_error = None
+        self.inflight_scans = 0
+        self._scans_idle = None
+
+
+resources = ResourceContainer()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=resources.reset_after_fork)
@@ -1,24 +1,39 @@
 from passlib.context import CryptContext
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+import asyncio
 from jose import jwt, JWTError
-from fastapi import HTTPException, status, Depends
+from fastapi import HTTPException, status, Depends, Header
 from fastapi.security import OAuth2PasswordBearer
+import hmac
 import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 
 from sqlalchemy.future import select
 
 from app.dependencies import DB_SESSION_DEPENDENCY
 from app.models.base_models import User
+from app.core.user_cache import CachedUser, user_cache
 
 # --------------------------------------------------
 # Configuration sécurité
 # --------------------------------------------------
 
-password_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Coût bcrypt : toute empreinte dont le coût diffère (min = max = BCRYPT_ROUNDS)
+# est marquée "à mettre à jour" et ré-hachée à la prochaine connexion réussie.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+password_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "CLE_SECRETE_TRES_COMPLEXE_A_REMPLACER_EN_PROD")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60))
+# Jeton des routes d'exploitation (/api/v1/system) ; vide = routes désactivées
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN", "")
 
 
 # --------------------------------------------------
@@ -33,6 +48,56 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return password_context.verify(plain_password, hashed_password)
 
 
+# --------------------------------------------------
+# Versions non bloquantes (routes HTTP)
+# --------------------------------------------------
+# bcrypt coûte plusieurs centaines de ms de CPU : exécuté dans la boucle
+# d'événements, il bloquerait toutes les autres requêtes du worker.
+# Les calculs partent dans un pool dédié (bcrypt libère le GIL) et le nombre
+# de calculs en attente est borné : au-delà, la requête est refusée (503).
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 32))
+
+_hash_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+_hash_slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_PENDING)
+
+
+async def _run_in_hash_pool(func, *args):
+    if _hash_slots.locked():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Service d'authentification surchargé, réessayez.",
+            headers={"Retry-After": "1"},
+        )
+    async with _hash_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, func, *args)
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_in_hash_pool(password_context.hash, password)
+
+
+async def verify_password_async(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """
+    Vérifie le mot de passe hors de la boucle d'événements.
+    Retourne (valide, nouvelle_empreinte) : la nouvelle empreinte est fournie
+    quand les paramètres de coût ont changé et doit être enregistrée.
+    """
+    try:
+        return await _run_in_hash_pool(
+            password_context.verify_and_update, plain_password, hashed_password
+        )
+    except ValueError:
+        # Empreinte non reconnue (ex : utilisateur stub) : identifiants invalides
+        return False, None
+
+
 # --------------------------------------------------
 # JWT helpers
 # --------------------------------------------------
@@ -67,6 +132,8 @@ def decode_access_token(token: str) -> Dict[str, Any]:
 # --------------------------------------------------
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login")
+# Variante sans 401 automatique : jeton facultatif (ex : /documents/scan)
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login", auto_error=False)
 
 
 async def get_current_user_from_token(
@@ -76,11 +143,14 @@ async def get_current_user_from_token(
     """
     Dépendance FastAPI :
     - décode le JWT
-    - récupère l'utilisateur en base
+    - récupère l'utilisateur (cache mémoire, sinon base)
 
     ⚠️ SAFE FastAPI :
     - aucune annotation AsyncSession
-    - aucun retour typé ORM
+    - aucun retour typé ORM (CachedUser, détaché de la session)
+
+    Sur un succès de cache, la session n'est jamais utilisée : aucune
+    connexion n'est empruntée au pool.
     """
 
     payload = decode_access_token(token)
@@ -93,13 +163,54 @@ async def get_current_user_from_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    result = await db.execute(select(User).filter(User.id == user_id))
-    user = result.scalars().first()
+    user = user_cache.get(user_id)
+    if user is None:
+        result = await db.execute(select(User).filter(User.id == user_id))
+        db_user = result.scalars().first()
+
+        if not db_user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Utilisateur non trouvé",
+            )
 
-    if not user:
+        user = CachedUser(id=db_user.id, email=db_user.email, is_active=bool(db_user.is_active))
+        user_cache.set(user)
+
+    if not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Utilisateur non trouvé",
+            detail="Utilisateur désactivé",
+            headers={"WWW-Authenticate": "Bearer"},
         )
 
-    return user
\ No newline at end of file
+    return user
+
+
+async def get_optional_user(token: Optional[str] = Depends(optional_oauth2_scheme)):
+    """
+    Utilisateur du jeton s'il y en a un, None sinon (un jeton invalide reste
+    refusé). En cas d'absence du cache, la base est lue dans une session
+    courte : la route (ex : scan) ne garde aucune connexion du pool.
+    """
+    if not token:
+        return None
+    from app.core.database import new_session
+
+    async with new_session() as db:
+        return await get_current_user_from_token(token, db)
+
+
+# --------------------------------------------------
+# Dépendance FastAPI – routes d'exploitation
+# --------------------------------------------------
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """Compare le jeton fourni à ADMIN_API_TOKEN (toujours faux si non configuré)."""
+    return bool(ADMIN_API_TOKEN and token and hmac.compare_digest(token, ADMIN_API_TOKEN))
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Protège les routes d'exploitation par le jeton ADMIN_API_TOKEN (en-tête X-Admin-Token)."""
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Accès réservé")
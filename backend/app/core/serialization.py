@@ -0,0 +1,41 @@
+from typing import Any, Mapping, Optional
+
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+
+# --------------------------------------------------
+# Sérialisation JSON des réponses volumineuses
+# --------------------------------------------------
+# Les routes de documents renvoient directement des octets JSON produits par
+# pydantic-core : le schéma est compilé une fois (TypeAdapter), la validation
+# lit les attributs des objets ORM et l'encodage JSON se fait en Rust, sans
+# passer par model_validate ligne par ligne ni par l'encodeur JSON de Python.
+#
+# Le `response_model` des routes est conservé pour la documentation OpenAPI ;
+# FastAPI ne revalide pas une `Response` renvoyée telle quelle.
+
+
+class ModelSerializer:
+    """Sérialiseur compilé pour un type de réponse (modèle, List[modèle]...)."""
+
+    def __init__(self, response_type: Any):
+        self.adapter = TypeAdapter(response_type)
+
+    def validate(self, obj: Any) -> Any:
+        return self.adapter.validate_python(obj, from_attributes=True)
+
+    def dump(self, obj: Any) -> bytes:
+        return self.adapter.dump_json(self.validate(obj))
+
+    def response(
+        self,
+        obj: Any,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> Response:
+        return Response(
+            content=self.dump(obj),
+            status_code=status_code,
+            headers=headers,
+            media_type="application/json",
+        )
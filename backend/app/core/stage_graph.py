@@ -0,0 +1,126 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from app.core.metrics import PIPELINE_STAGE_SECONDS
+
+# --------------------------------------------------
+# Graphe d'étapes (pipeline du scan)
+# --------------------------------------------------
+# Chaque étape déclare les étapes dont elle dépend ; une étape démarre dès
+# que ses dépendances sont terminées, les étapes indépendantes (ex : upload
+# et OCR) tournent donc en parallèle. Les résultats sont accessibles dans
+# graph.results, sous le nom de l'étape.
+#
+# En cas d'échec (exception, délai dépassé) :
+# - les étapes en cours sans nettoyage sont annulées ;
+# - celles qui ont un nettoyage (ex : upload) sont attendues : un appel
+#   bloquant lancé dans un thread ne s'annule pas, son résultat doit être défait ;
+# - les nettoyages des étapes terminées sont exécutés (ordre inverse), puis
+#   l'erreur d'origine est relevée.
+
+
+class StageTimeoutError(Exception):
+    def __init__(self, stage: str, timeout: float):
+        super().__init__(f"étape {stage} interrompue après {timeout:.0f}s")
+        self.stage = stage
+        self.timeout = timeout
+
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable[[], Awaitable[Any]]
+    after: Sequence[str] = ()
+    timeout: Optional[float] = None
+    # Défait le résultat de l'étape si une étape ultérieure échoue
+    cleanup: Optional[Callable[[Any], Awaitable[None]]] = None
+    # Évaluée au démarrage : étape sautée (résultat None, ni durée ni métrique)
+    skip: Optional[Callable[[], bool]] = None
+
+
+class StageGraph:
+    def __init__(self, labels: Dict[str, str], results: Optional[Dict[str, Any]] = None):
+        """labels : étiquettes de aideo_scan_stage_seconds ; results : valeurs connues d'avance."""
+        self.labels = labels
+        self.results: Dict[str, Any] = dict(results or {})
+        # Durée de chaque étape exécutée, en millisecondes
+        self.timings_ms: Dict[str, float] = {}
+        self._stages: Dict[str, Stage] = {}
+        self._completed: List[str] = []
+
+    def add(self, name: str, run: Callable[[], Awaitable[Any]], **options) -> "StageGraph":
+        if name in self._stages or name in self.results:
+            raise ValueError(f"étape en double : {name}")
+        self._stages[name] = Stage(name, run, **options)
+        return self
+
+    def _check(self):
+        known = set(self._stages) | set(self.results)
+        for stage in self._stages.values():
+            missing = [name for name in stage.after if name not in known]
+            if missing:
+                raise ValueError(f"étape {stage.name} : dépendance inconnue {missing}")
+
+    async def _execute(self, stage: Stage) -> Any:
+        if stage.skip is not None and stage.skip():
+            return None
+        start = time.perf_counter()
+        try:
+            if stage.timeout is None:
+                return await stage.run()
+            return await asyncio.wait_for(stage.run(), stage.timeout)
+        except asyncio.TimeoutError:
+            raise StageTimeoutError(stage.name, stage.timeout) from None
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings_ms[stage.name] = round(elapsed * 1000, 1)
+            PIPELINE_STAGE_SECONDS.observe(elapsed, stage=stage.name, **self.labels)
+
+    async def run(self) -> Dict[str, Any]:
+        """Exécute toutes les étapes ; retourne les résultats ou relève la première erreur."""
+        self._check()
+        pending = dict(self._stages)
+        running: Dict[asyncio.Task, Stage] = {}
+        try:
+            while pending or running:
+                ready = [
+                    stage for stage in pending.values()
+                    if all(name in self.results for name in stage.after)
+                ]
+                for stage in ready:
+                    del pending[stage.name]
+                    running[asyncio.create_task(self._execute(stage))] = stage
+                if not running:
+                    raise ValueError(f"dépendances circulaires : {sorted(pending)}")
+
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    stage = running.pop(task)
+                    self.results[stage.name] = task.result()
+                    self._completed.append(stage.name)
+        except BaseException:
+            # Protégé : le nettoyage va à son terme même si la requête est annulée
+            await asyncio.shield(self._abort(running))
+            raise
+        return self.results
+
+    async def _abort(self, running: Dict[asyncio.Task, Stage]):
+        for task, stage in running.items():
+            if stage.cleanup is None:
+                task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        for task, stage in running.items():
+            if not task.cancelled() and task.exception() is None:
+                self.results[stage.name] = task.result()
+                self._completed.append(stage.name)
+
+        for name in reversed(self._completed):
+            stage = self._stages[name]
+            if stage.cleanup is None or self.results.get(name) is None:
+                continue
+            try:
+                await stage.cleanup(self.results[name])
+            except Exception as e:
+                print(f"Nettoyage de l'étape {name} impossible : {e}")
@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app.models.base_models import User
+
+# --------------------------------------------------
+# Configuration du cache
+# --------------------------------------------------
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 60))  # secondes, 0 = désactivé
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    """Identité minimale de l'utilisateur courant (détachée de toute session ORM)."""
+    id: str
+    email: str
+    is_active: bool
+
+
+# --------------------------------------------------
+# Cache LRU borné avec expiration (TTL)
+# --------------------------------------------------
+
+class UserCache:
+    """
+    Cache en mémoire du processus, indexé par id utilisateur.
+    - taille bornée : l'entrée la moins récemment utilisée est évincée
+    - TTL : borne la durée pendant laquelle un autre worker peut servir
+      une donnée périmée (l'invalidation n'est que locale au processus)
+    """
+
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.maxsize > 0
+
+    def get(self, user_id: str) -> Optional[CachedUser]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            user, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[user_id]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return user
+
+    def set(self, user: CachedUser):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[user.id] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+user_cache = UserCache()
+
+
+# --------------------------------------------------
+# Invalidation : toute modification ORM d'un utilisateur (désactivation,
+# changement d'email...) retire son entrée du cache de ce processus.
+# --------------------------------------------------
+# Les événements du mapper ont lieu au flush, avant le commit : entre les
+# deux, une autre requête peut relire l'ancienne ligne (encore validée) et la
+# remettre en cache jusqu'au TTL. L'entrée est donc retirée au flush, puis
+# une seconde fois au commit de la session.
+
+_PENDING_KEY = "user_cache_invalidations"
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_KEY, set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session):
+    for user_id in session.info.pop(_PENDING_KEY, ()):
+        user_cache.invalidate(user_id)
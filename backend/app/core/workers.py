@@ -0,0 +1,19 @@
+from uvicorn_worker import UvicornWorker
+
+# --------------------------------------------------
+# Worker gunicorn pour l'application ASGI (voir gunicorn.conf.py)
+# --------------------------------------------------
+
+
+class AideoUvicornWorker(UvicornWorker):
+    """
+    UvicornWorker dont l'arrêt gracieux est borné par le graceful_timeout de
+    gunicorn : à SIGTERM, le worker cesse d'accepter des connexions, laisse
+    les requêtes en cours (scans) se terminer, puis exécute le lifespan d'arrêt
+    avant que le maître ne le tue.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Marge pour le lifespan d'arrêt (fermeture des clients)
+        self.config.timeout_graceful_shutdown = max(self.cfg.graceful_timeout - 5, 1)
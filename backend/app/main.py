@@ -1,17 +1,88 @@
 # aideo/backend/app/main.py (VERSION CORRIGÉE)
 
-from fastapi import FastAPI
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.core.database import init_db
-from app.services.storage_service import check_bucket_existence 
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.database import init_db, get_engine
+from app.core.compression import CompressionMiddleware
+from app.core.metrics import REGISTRY, CONTENT_TYPE_LATEST, HTTPMetricsMiddleware
+from app.core.profiling import PROFILING_ENABLED
+from app.core.resources import resources
+from app.services.reanalysis_service import REANALYSIS_ENABLED, run_reanalysis_worker
+from app.services.storage_service import check_bucket_existence, check_bucket_reachable
 
 # NOTE: Les imports des routeurs sont décalés APRÈS la définition de l'app.
 # L'importation des modèles de base n'est plus nécessaire ici car elle se fait dans init_db ou les routeurs.
 
+# Délai entre deux tentatives d'initialisation (BDD ou MinIO pas encore prêts)
+STARTUP_RETRY_SECONDS = 5
+# Délai maximal des vérifications de /health/ready
+READINESS_TIMEOUT_SECONDS = 2
+# Attente maximale des scans en cours à l'arrêt (voir aussi GRACEFUL_TIMEOUT, gunicorn.conf.py)
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", 120))
+
+
+# --- INITIALISATION : BDD et Stockage, en parallèle et en tâche de fond ---
+
+async def run_startup_checks():
+    """Initialise la BDD et le bucket S3/MinIO (en parallèle), en réessayant jusqu'au succès."""
+
+    # Importation des modèles de BDD juste avant init_db pour garantir leur chargement
+    from app.models import base_models
+
+    while True:
+        print("Initialisation de la base de données et du stockage MinIO/S3...")
+        try:
+            await asyncio.gather(init_db(), check_bucket_existence())
+        except Exception as e:
+            resources.startup_error = str(e)
+            print(f"Initialisation incomplète ({e}), nouvel essai dans {STARTUP_RETRY_SECONDS}s.")
+            await asyncio.sleep(STARTUP_RETRY_SECONDS)
+            continue
+
+        resources.ready = True
+        resources.startup_error = None
+        print("Services backend Aideo prêts.")
+        return
+
+
+async def run_reanalysis_after_startup(startup_task: asyncio.Task):
+    """Réanalyse de fond, une fois la BDD initialisée (voir reanalysis_service)."""
+    await asyncio.shield(startup_task)
+    await run_reanalysis_worker()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Démarrage : l'API accepte les requêtes immédiatement (/health/live), les
+    vérifications tournent en tâche de fond et conditionnent /health/ready.
+    Arrêt : attend les scans en cours, puis ferme les clients du conteneur de ressources.
+    """
+    startup_task = asyncio.create_task(run_startup_checks())
+    reanalysis_task = (
+        asyncio.create_task(run_reanalysis_after_startup(startup_task)) if REANALYSIS_ENABLED else None
+    )
+    yield
+    startup_task.cancel()
+    if reanalysis_task is not None:
+        reanalysis_task.cancel()
+    interrupted = await resources.drain_scans(SHUTDOWN_DRAIN_SECONDS)
+    if interrupted:
+        print(f"Arrêt : {interrupted} scan(s) interrompu(s).")
+    await resources.aclose()
+
+
 app = FastAPI(
     title="Aideo API - Assistance Documentaire",
     description="API pour le scan, l'analyse IA et la gestion des documents administratifs.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # --- Configuration CORS ---
@@ -23,22 +94,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# --- ÉVÉNEMENT DE DÉMARRAGE : Initialisation de la BDD et du Stockage ---
+# --- Compression gzip/brotli des réponses JSON volumineuses ---
+app.add_middleware(CompressionMiddleware)
 
-@app.on_event("startup")
-async def startup_event():
-    """Exécute l'initialisation de la BDD et vérifie le stockage S3/MinIO au démarrage de l'API."""
-    
-    # Importation des modèles de BDD juste avant init_db pour garantir leur chargement
-    from app.models import base_models 
-    
-    print("Tentative d'initialisation de la base de données...")
-    await init_db()
-    
-    print("Vérification et création du bucket de stockage MinIO/S3...")
-    await check_bucket_existence()
-    
-    print("Services backend Aideo prêts.")
+# --- Métriques : latence HTTP par route ---
+app.add_middleware(HTTPMetricsMiddleware)
+
+# --- Profilage à la demande (absent si PROFILING_ENABLED n'est pas activé) ---
+if PROFILING_ENABLED:
+    from app.core.profiling import ProfilingMiddleware
+    app.add_middleware(ProfilingMiddleware)
+
+
+# --- Dépendance en panne (disjoncteur ouvert, voir app/core/circuit_breaker.py) ---
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    """Réponse immédiate 503 plutôt qu'une attente jusqu'au timeout de la dépendance."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Service momentanément indisponible ({exc.name}). Réessayez plus tard."},
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))},
+    )
 
 
 # --- Routes de base ---
@@ -49,12 +126,58 @@ def read_root():
     return {"message": "Bienvenue sur l'API Aideo. Le service est opérationnel."}
 
 
+@app.get("/health/live")
+def liveness():
+    """Sonde de vivacité : le processus répond (aucune dépendance vérifiée)."""
+    return {"status": "alive"}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Métriques du processus au format texte Prometheus (à collecter par scrape)."""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE_LATEST)
+
+
+async def _check_database():
+    from sqlalchemy import text
+
+    async with get_engine().connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+@app.get("/health/ready")
+async def readiness():
+    """Sonde de disponibilité : initialisation terminée, BDD et stockage joignables."""
+    if not resources.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "starting", "error": resources.startup_error},
+        )
+
+    checks = {"database": _check_database(), "storage": check_bucket_reachable()}
+    results = await asyncio.gather(
+        *[asyncio.wait_for(check, READINESS_TIMEOUT_SECONDS) for check in checks.values()],
+        return_exceptions=True,
+    )
+    report = {
+        name: "ok" if not isinstance(result, BaseException) else f"erreur: {result!r}"
+        for name, result in zip(checks, results)
+    }
+    ready = all(value == "ok" for value in report.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "degraded", "checks": report},
+    )
+
+
 # --- INCLUSION DES ROUTEURS (Importation et inclusion à la fin) ---
 from app.api import auth
 from app.api import documents
+from app.api import system
 
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["Authentification"])
 app.include_router(documents.router, prefix="/api/v1/documents", tags=["Documents & Scan"])
+app.include_router(system.router, prefix="/api/v1/system", tags=["Exploitation"])
 
 
 if __name__ == "__main__":
@@ -1,6 +1,8 @@
 from .base import Base # Importation corrigée
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, JSON
+from sqlalchemy import Column, Integer, BigInteger, Float, Numeric, String, Text, DateTime, ForeignKey, Boolean, Index
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 import uuid
 
@@ -33,18 +35,181 @@ class Document(Base):
     file_name = Column(String)
     content_type = Column(String)
     file_url = Column(String, nullable=True) 
+    file_size = Column(BigInteger, nullable=True)  # Taille de l'original en octets
+    # Format de l'objet stocké (webp, gzip ; NULL : octets tels qu'envoyés) et sa taille
+    stored_format = Column(String, nullable=True)
+    stored_size = Column(BigInteger, nullable=True)
+    # Tier de stockage de l'original (NULL : bucket chaud ; cold : archivé dans un paquet, voir tiering_service)
+    storage_tier = Column(String, nullable=True)
+    # Dernière consultation (fiche ou téléchargement), à la résolution TIERING_ACCESS_RESOLUTION_SECONDS
+    last_accessed_at = Column(DateTime, nullable=True)
     
     raw_text = Column(Text) 
     
     ai_type = Column(String, nullable=True)      
     ai_resume = Column(Text, nullable=True)      
-    ai_actions = Column(JSON, default=[])        
-    ai_dates = Column(JSON, default=[])          
-    ai_montants = Column(JSON, default=[])       
+    # JSONB (et non JSON) : tableaux lus directement en SQL (jsonb_array_elements, voir analytics_service)
+    ai_actions = Column(JSONB, default=[])
+    ai_dates = Column(JSONB, default=[])
+    ai_montants = Column(JSONB, default=[])
+    # Provenance de l'analyse : une analyse faite par un autre modèle ou prompt,
+    # ou issue de la structure de repli, est réanalysée en tâche de fond
+    ai_model = Column(String, nullable=True)
+    ai_prompt_version = Column(String, nullable=True)
+    ai_fallback = Column(Boolean, nullable=False, default=False, server_default="false")
+    # Type ou résumé corrigé par l'utilisateur : jamais écrasé par une réanalyse
+    ai_edited = Column(Boolean, nullable=False, default=False, server_default="false")
+    # Re-scan d'une page déjà scannée (pHash proche, voir dedup_service) : document d'origine
+    duplicate_of = Column(Integer, ForeignKey("documents.id", ondelete="SET NULL"), nullable=True)
+    # Durée de chaque étape du scan en ms (upload, ocr, llm...), hors insertion
+    stage_timings = Column(JSONB, nullable=True)
     
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Incrémentée à chaque modification (PATCH, réanalyse) : sert d'ETag
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     
     owner = relationship("User", back_populates="documents")
+
+    __table_args__ = (
+        # Listes et agrégats sont toujours filtrés par propriétaire
+        Index("ix_documents_owner_created", "owner_id", "created_at"),
+        Index("ix_documents_owner_type", "owner_id", "ai_type"),
+        # Candidats à l'archivage : originaux chauds par dernière consultation
+        Index(
+            "ix_documents_hot_last_access",
+            text("coalesce(last_accessed_at, created_at)"),
+            postgresql_where=text("storage_tier IS NULL AND file_url IS NOT NULL"),
+        ),
+    )
     
     def __repr__(self):
-        return f"<Document(id={self.id}, name='{self.file_name}')>"
\ No newline at end of file
+        return f"<Document(id={self.id}, name='{self.file_name}')>"
+
+
+# --- 3. Statistiques agrégées par utilisateur (tableau de bord) ---
+
+class UserStats(Base):
+    """
+    Agrégats maintenus de façon incrémentale à chaque scan, modification
+    ou suppression (voir app/services/stats_service.py).
+    """
+    __tablename__ = "user_stats"
+
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    documents_count = Column(Integer, nullable=False, default=0, server_default="0")
+    type_counts = Column(JSONB, nullable=False, default=dict, server_default="{}")  # {"impôts": 3, ...}
+    total_amount = Column(Numeric(14, 2), nullable=False, default=0, server_default="0")
+    pending_actions = Column(Integer, nullable=False, default=0, server_default="0")
+    storage_bytes = Column(BigInteger, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<UserStats(user_id={self.user_id}, documents={self.documents_count})>"
+
+
+
+# --- 4. Seaux de limitation de débit (backend partagé, voir app/core/rate_limit.py) ---
+
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_buckets"
+
+    key = Column(String, primary_key=True)        # "<budget>:<user_id>"
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)    # epoch (horloge de PostgreSQL)
+
+
+# --- 5. Empreintes perceptuelles des pages (quasi-doublons, voir app/services/dedup_service.py) ---
+
+class DocumentPageHash(Base):
+    __tablename__ = "document_page_hashes"
+
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True)
+    page = Column(Integer, primary_key=True, default=0)
+    owner_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    phash = Column(BigInteger, nullable=False)  # pHash 64 bits (signé)
+
+    __table_args__ = (
+        # Recherche par distance de Hamming limitée au propriétaire, en parcours d'index seul
+        Index("ix_page_hashes_owner_phash", "owner_id", "phash", "document_id"),
+    )
+
+
+# --- 6. Réanalyse en tâche de fond (une seule ligne, voir app/services/reanalysis_service.py) ---
+
+class ReanalysisState(Base):
+    __tablename__ = "reanalysis_state"
+
+    id = Column(Integer, primary_key=True)
+    paused = Column(Boolean, nullable=False, default=False, server_default="false")
+    # Cible du passage en cours : modèle et empreinte du prompt
+    model = Column(String, nullable=True)
+    prompt_version = Column(String, nullable=True)
+    cursor_id = Column(Integer, nullable=False, default=0, server_default="0")  # dernier id distribué
+    pass_started_at = Column(DateTime, nullable=True)
+    pass_finished_at = Column(DateTime, nullable=True)
+    processed = Column(Integer, nullable=False, default=0, server_default="0")
+    updated = Column(Integer, nullable=False, default=0, server_default="0")
+    fallbacks = Column(Integer, nullable=False, default=0, server_default="0")
+    conflicts = Column(Integer, nullable=False, default=0, server_default="0")
+    last_error = Column(Text, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# --- 7. Tier froid : paquets d'originaux archivés (voir app/services/tiering_service.py) ---
+
+class ArchiveBundle(Base):
+    __tablename__ = "archive_bundles"
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    key = Column(String, nullable=False, unique=True)  # clé dans STORAGE_ARCHIVE_BUCKET
+    size = Column(BigInteger, nullable=False)
+    members = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ArchivedFile(Base):
+    """Position d'un original archivé dans son paquet ; supprimée à la restauration ou avec le document."""
+    __tablename__ = "archived_files"
+
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True)
+    bundle_id = Column(Integer, ForeignKey("archive_bundles.id"), nullable=False, index=True)
+    byte_offset = Column(BigInteger, nullable=False)
+    length = Column(BigInteger, nullable=False)
+    # Métadonnées de l'objet d'origine (format stocké, type d'origine), remises à la restauration
+    file_metadata = Column(JSONB, nullable=False, default=dict, server_default="{}")
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+
+# --- 8. Journal des modifications (synchronisation par deltas, voir app/services/change_service.py) ---
+
+class DocumentChange(Base):
+    """
+    Dernière modification de chaque document : une ligne par document, remplacée
+    à chaque écriture par une ligne de numéro supérieur. Une suppression laisse
+    une ligne "delete" (tombstone), sans clé étrangère vers le document.
+    """
+    __tablename__ = "document_changes"
+
+    seq = Column(BigInteger, primary_key=True, autoincrement=True)  # croissant, par ordre de commit pour un propriétaire
+    owner_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    document_id = Column(Integer, nullable=False, unique=True)
+    op = Column(String(10), nullable=False)  # "upsert" | "delete"
+    changed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_document_changes_owner_seq", "owner_id", "seq"),
+    )
+
+
+# --- 9. Suppressions de fichiers en attente (voir app/services/deletion_service.py) ---
+
+class PendingFileDeletion(Base):
+    """Original à supprimer du stockage, noté dans la transaction qui supprime le document."""
+    __tablename__ = "pending_file_deletions"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    file_url = Column(String, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
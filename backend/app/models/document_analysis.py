@@ -1,6 +1,7 @@
-from pydantic import BaseModel, Field
-from datetime import datetime
-from typing import List, Optional, Any
+from pydantic import BaseModel, Field, field_validator, model_validator
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, List, Optional, Any
 
 # --- Pydantic Schemas pour la gestion des Documents ---
 
@@ -21,11 +22,24 @@ class DocumentResponse(BaseModel):
     ai_dates: List[Any] = Field(default_factory=list)
     ai_montants: List[Any] = Field(default_factory=list)
     
+    # Re-scan d'une page déjà scannée : id du document d'origine
+    duplicate_of: Optional[int] = None
+    # Durée de chaque étape du scan (ms)
+    stage_timings: Optional[Dict[str, float]] = None
+    
     created_at: datetime
+    updated_at: Optional[datetime] = None
+    version: int = 1
     
     class Config:
         from_attributes = True 
 
+    @field_validator("version", mode="before")
+    @classmethod
+    def _default_version(cls, value):
+        # Document pas encore inséré : le défaut ORM (1) n'est appliqué qu'au flush
+        return 1 if value is None else value
+
 
 # 2. Modèle pour la création rapide 
 class DocumentCreation(BaseModel):
@@ -47,4 +61,81 @@ class DocumentUpdate(BaseModel):
     ai_resume: Optional[str] = None
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# 4. Échéance à venir (extraite de ai_dates, calculée en SQL)
+class UpcomingDeadline(BaseModel):
+    """Schéma d'une échéance (utilisé pour GET /documents/deadlines)."""
+    document_id: int
+    file_name: Optional[str] = None
+    ai_type: Optional[str] = None
+    label: Optional[str] = None
+    due_date: date
+
+
+# 5. Total des montants par type de document
+class AmountsByType(BaseModel):
+    """Schéma d'agrégat (utilisé pour GET /documents/amounts-by-type)."""
+    ai_type: str
+    documents: int
+    amounts: int
+    total: Decimal
+
+
+# 6. Sélection de documents pour les opérations groupées
+class DocumentFilter(BaseModel):
+    """Filtre appliqué côté SQL (toujours restreint au propriétaire)."""
+    ai_type: Optional[str] = None
+    created_before: Optional[datetime] = None
+    created_after: Optional[datetime] = None
+
+
+class DocumentSelection(BaseModel):
+    """Liste d'identifiants et/ou filtre (utilisé pour DELETE /documents/)."""
+    ids: Optional[List[int]] = Field(None, min_length=1, max_length=5000)
+    filter: Optional[DocumentFilter] = None
+
+    @model_validator(mode="after")
+    def check_not_empty(self):
+        # Garde-fou : une sélection vide ne doit jamais viser tous les documents
+        if not self.ids and not (self.filter and self.filter.model_dump(exclude_none=True)):
+            raise ValueError("Indiquez une liste d'identifiants ou un filtre non vide.")
+        return self
+
+
+class DocumentBulkUpdate(DocumentSelection):
+    """Sélection + modifications (utilisé pour PATCH /documents/)."""
+    update: DocumentUpdate
+
+
+class BulkOperationResult(BaseModel):
+    """Résultat d'une opération groupée."""
+    matched: int
+    ids: List[int]
+
+
+# 7. Statistiques du tableau de bord (lecture O(1) de user_stats)
+class DashboardStats(BaseModel):
+    """Schéma des agrégats par utilisateur (utilisé pour GET /documents/stats)."""
+    documents_count: int
+    type_counts: Dict[str, int] = Field(default_factory=dict)
+    total_amount: Decimal
+    pending_actions: int
+    storage_bytes: int
+    updated_at: Optional[datetime] = None
+
+
+# 8. Synchronisation par deltas (GET /documents/changes)
+class DocumentChangeEntry(BaseModel):
+    """Modification d'un document : document courant (upsert) ou suppression (delete)."""
+    seq: int
+    id: int
+    op: str
+    document: Optional[DocumentResponse] = None
+
+
+class DocumentChangesPage(BaseModel):
+    """Page du journal ; next_token est à renvoyer en `since` à l'appel suivant."""
+    changes: List[DocumentChangeEntry]
+    next_token: str
+    has_more: bool
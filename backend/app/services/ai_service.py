@@ -1,13 +1,50 @@
+import asyncio
+import hashlib
 import json
-import httpx
 import os
-from typing import Dict, Any
+import time
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List
 from fastapi import HTTPException
+from pydantic import BaseModel, Field, ValidationError
+
+from app.core.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.core.resources import resources
+from app.core.metrics import LLM_CALL_SECONDS, LLM_ESCALATIONS_TOTAL, LLM_INFLIGHT, LLM_QUEUE_DEPTH
 
 # Configuration via variables d'environnement (définies dans docker-compose)
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://ollama:11434")
 AI_MODEL = os.getenv("AI_MODEL", "mistral")
 
+# Augmentation du timeout car l'IA locale peut être lente (30 à 60s selon ton PC)
+AI_TIMEOUT = float(os.getenv("AI_TIMEOUT", 60.0))
+# Connexion : un Ollama arrêté doit échouer vite, pas au bout de AI_TIMEOUT
+AI_CONNECT_TIMEOUT = float(os.getenv("AI_CONNECT_TIMEOUT", 5.0))
+# Appels simultanés vers Ollama (au-delà, les appels attendent leur tour)
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", 2))
+
+# Routage à deux niveaux : un petit modèle rapide classe et extrait, AI_MODEL
+# (grand modèle) n'est appelé que si nécessaire. Vide : un seul modèle.
+AI_SMALL_MODEL = os.getenv("AI_SMALL_MODEL", "")
+AI_SMALL_MAX_CONCURRENCY = int(os.getenv("AI_SMALL_MAX_CONCURRENCY", 4))
+# Au-delà de cette longueur de texte OCR, le grand modèle est appelé directement
+AI_SMALL_MAX_CHARS = int(os.getenv("AI_SMALL_MAX_CHARS", 4000))
+
+
+def _normalize_type(value: Any) -> str:
+    text = unicodedata.normalize("NFKD", str(value or "")).encode("ascii", "ignore").decode()
+    return text.strip().lower()
+
+
+# Types dont le résumé mérite le grand modèle, même si le petit a répondu correctement
+AI_CAREFUL_TYPES = {
+    _normalize_type(value)
+    for value in os.getenv("AI_CAREFUL_TYPES", "impôts,santé,justice,banque").split(",")
+    if value.strip()
+}
+
 SYSTEM_PROMPT = """Tu es un assistant expert qui aide les citoyens à comprendre leurs documents administratifs. 
 Analyse le texte brut fourni et extrais les informations dans une structure JSON stricte.
 Règles :
@@ -18,17 +55,181 @@ Règles :
 5. Montants financiers trouvés.
 Réponds UNIQUEMENT avec le JSON."""
 
+# Empreinte du prompt, stockée avec chaque analyse : modifier SYSTEM_PROMPT
+# (ou AI_MODEL) rend les analyses existantes éligibles à la réanalyse.
+PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+
+class ModelTier:
+    """
+    Un modèle Ollama, avec sa propre limite d'appels simultanés, ses
+    statistiques et son disjoncteur (llm_small, llm_large).
+    """
+
+    def __init__(self, name: str, model: str, max_concurrency: int):
+        self.name = name
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.calls = 0
+        self.failures = 0
+        self.seconds = 0.0
+        self.breaker = CircuitBreaker(f"llm_{name}")
+        LLM_QUEUE_DEPTH.set(0, tier=name)
+        LLM_INFLIGHT.set(0, tier=name)
+
+    async def post(self, payload: Dict[str, Any]):
+        """
+        Envoie la requête à Ollama dans la limite de max_concurrency appels
+        simultanés. Lève CircuitOpenError sans attendre si le modèle est en panne,
+        httpx.HTTPStatusError si Ollama répond par une erreur.
+        """
+        # Disjoncteur ouvert : échec immédiat, sans attendre un créneau
+        self.breaker.check()
+        LLM_QUEUE_DEPTH.inc(tier=self.name)
+        waiting = True
+        try:
+            async with self.slots:
+                LLM_QUEUE_DEPTH.dec(tier=self.name)
+                waiting = False
+                async with self.breaker.guard():
+                    LLM_INFLIGHT.inc(tier=self.name)
+                    start = time.perf_counter()
+                    outcome = "error"
+                    try:
+                        response = await resources.http_client.post(f"{OLLAMA_URL}/api/generate", json=payload)
+                        # Erreur HTTP (modèle absent, surcharge) : échec pour le disjoncteur
+                        response.raise_for_status()
+                        outcome = "ok"
+                        return response
+                    finally:
+                        elapsed = time.perf_counter() - start
+                        LLM_INFLIGHT.dec(tier=self.name)
+                        LLM_CALL_SECONDS.observe(elapsed, tier=self.name, outcome=outcome)
+                        self.calls += 1
+                        self.seconds += elapsed
+                        self.failures += outcome != "ok"
+        finally:
+            if waiting:
+                LLM_QUEUE_DEPTH.dec(tier=self.name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "max_concurrency": self.max_concurrency,
+            "calls": self.calls,
+            "failures": self.failures,
+            "avg_latency_ms": round(self.seconds / self.calls * 1000, 1) if self.calls else None,
+            "circuit": self.breaker.state,
+        }
+
+
+LARGE_TIER = ModelTier("large", AI_MODEL, AI_MAX_CONCURRENCY)
+SMALL_TIER = ModelTier("small", AI_SMALL_MODEL, AI_SMALL_MAX_CONCURRENCY) if AI_SMALL_MODEL else None
+TIERS = [tier for tier in (SMALL_TIER, LARGE_TIER) if tier is not None]
+# Modèles dont les analyses sont à jour ; leur signature sert de cible à la réanalyse
+ACTIVE_MODELS = tuple(tier.model for tier in TIERS)
+MODEL_SIGNATURE = "+".join(ACTIVE_MODELS)
+
+# Statistiques de routage du processus (voir routing_stats)
+_analyses = 0
+_escalations: Counter = Counter()
+
+
+class _SmallModelSchema(BaseModel):
+    """Sortie attendue du petit modèle ; sinon, escalade vers le grand."""
+    type: str = Field(min_length=1)
+    resume: str = Field(min_length=1)
+    actions: List[Any]
+    dates: List[Any]
+    montants: List[Any]
+
+
+@dataclass
+class AIAnalysis:
+    """Résultat d'une analyse et sa provenance (modèle, prompt, repli en cas d'erreur)."""
+    data: Dict[str, Any]
+    model: str = AI_MODEL
+    prompt_version: str = PROMPT_VERSION
+    fallback: bool = False
+
+    def columns(self) -> Dict[str, Any]:
+        """Colonnes ai_* d'un Document."""
+        return {
+            "ai_type": self.data.get("type"),
+            "ai_resume": self.data.get("resume"),
+            "ai_actions": self.data.get("actions", []),
+            "ai_dates": self.data.get("dates", []),
+            "ai_montants": self.data.get("montants", []),
+            "ai_model": self.model,
+            "ai_prompt_version": self.prompt_version,
+            "ai_fallback": self.fallback,
+        }
+
+def create_http_client():
+    """Client HTTP partagé (connexions réutilisées), créé par le conteneur de ressources."""
+    import httpx
+
+    return httpx.AsyncClient(timeout=httpx.Timeout(AI_TIMEOUT, connect=AI_CONNECT_TIMEOUT))
+
+
 async def analyze_document_with_ai(document_text: str) -> Dict[str, Any]:
     """
     Appelle l'IA locale (Ollama) pour analyser le texte du document.
     """
+    return (await run_analysis(document_text)).data
+
+
+async def run_analysis(document_text: str) -> AIAnalysis:
+    """
+    Comme analyze_document_with_ai, en indiquant le modèle utilisé et le recours
+    à la structure de repli. Avec AI_SMALL_MODEL, le petit modèle est essayé
+    d'abord ; escalade vers AI_MODEL si le texte est long (long), si l'appel
+    échoue (error), si la sortie n'est pas conforme (invalid) ou si le type
+    demande un résumé soigné (type, AI_CAREFUL_TYPES).
+    """
+    global _analyses
+    _analyses += 1
+    if SMALL_TIER is None:
+        return await _analyze_with_large(document_text)
+
+    candidate = None
+    if len(document_text) > AI_SMALL_MAX_CHARS:
+        reason = "long"
+    else:
+        try:
+            data = await _call_model(SMALL_TIER, document_text)
+            candidate = _SmallModelSchema.model_validate(data).model_dump()
+        except ValidationError:
+            reason = "invalid"
+        except CircuitOpenError:
+            reason = "circuit"
+        except Exception as e:
+            print(f"Erreur du petit modèle ({SMALL_TIER.model}) : {e}")
+            reason = "error"
+        else:
+            if _normalize_type(candidate["type"]) not in AI_CAREFUL_TYPES:
+                return AIAnalysis(data=candidate, model=SMALL_TIER.model)
+            reason = "type"
+
+    _escalations[reason] += 1
+    LLM_ESCALATIONS_TOTAL.inc(reason=reason)
+    analysis = await _analyze_with_large(document_text)
+    if analysis.fallback and candidate is not None:
+        # Grand modèle indisponible : la réponse valide du petit modèle vaut mieux que le repli
+        return AIAnalysis(data=candidate, model=SMALL_TIER.model)
+    return analysis
+
+
+async def _call_model(tier: ModelTier, document_text: str) -> Dict[str, Any]:
+    """Un appel à Ollama ; lève une exception si la réponse n'est pas un objet JSON."""
     
     # Préparation de la requête pour Ollama
     # Note : On combine le system prompt et le texte pour Mistral
     full_prompt = f"{SYSTEM_PROMPT}\n\nDocument à analyser :\n{document_text}"
     
     payload = {
-        "model": AI_MODEL,
+        "model": tier.model,
         "prompt": full_prompt,
         "stream": False,
         "format": "json",
@@ -38,25 +239,57 @@ async def analyze_document_with_ai(document_text: str) -> Dict[str, Any]:
         }
     }
 
+    response = await tier.post(payload)
+
+    raw_response = response.json()
+    # La réponse d'Ollama contient le texte généré dans le champ 'response'
+    ai_content = raw_response.get("response")
+
+    # Conversion de la chaîne de caractères JSON en dictionnaire Python
+    data = json.loads(ai_content)
+    if not isinstance(data, dict):
+        raise ValueError("réponse JSON inattendue")
+    return data
+
+
+async def _analyze_with_large(document_text: str) -> AIAnalysis:
+    import httpx
+
     try:
-        # Augmentation du timeout car l'IA locale peut être lente (30 à 60s selon ton PC)
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(f"{OLLAMA_URL}/api/generate", json=payload)
-            response.raise_for_status()
-            
-            raw_response = response.json()
-            # La réponse d'Ollama contient le texte généré dans le champ 'response'
-            ai_content = raw_response.get("response")
-            
-            # Conversion de la chaîne de caractères JSON en dictionnaire Python
-            return json.loads(ai_content)
+        return AIAnalysis(data=await _call_model(LARGE_TIER, document_text), model=LARGE_TIER.model)
 
+    except CircuitOpenError:
+        # Panne en cours : repli immédiat (pas de message à chaque scan)
+        return AIAnalysis(data=_get_fallback_data(), fallback=True)
     except httpx.TimeoutException:
         print("L'IA a mis trop de temps à répondre.")
-        return _get_fallback_data()
+        return AIAnalysis(data=_get_fallback_data(), fallback=True)
     except Exception as e:
         print(f"Erreur lors de l'appel à Ollama : {e}")
-        return _get_fallback_data()
+        return AIAnalysis(data=_get_fallback_data(), fallback=True)
+
+
+def llm_saturated() -> bool:
+    """Vrai si tous les créneaux d'un des modèles sont pris (des appels attendent ou vont attendre)."""
+    return any(tier.slots.locked() for tier in TIERS)
+
+
+def llm_unavailable() -> bool:
+    """Vrai si le disjoncteur du grand modèle est ouvert (toute analyse finirait en repli)."""
+    return LARGE_TIER.breaker.is_open()
+
+
+def routing_stats() -> Dict[str, Any]:
+    """Appels et latence par modèle, taux d'escalade (depuis le démarrage du processus)."""
+    escalated = sum(_escalations.values())
+    return {
+        "routing": "small+large" if SMALL_TIER is not None else "single",
+        "analyses": _analyses,
+        "escalations": dict(_escalations),
+        "escalation_rate": round(escalated / _analyses, 3) if SMALL_TIER is not None and _analyses else None,
+        "tiers": {tier.name: tier.stats() for tier in TIERS},
+    }
+
 
 def _get_fallback_data() -> Dict[str, Any]:
     """Retourne une structure vide en cas d'erreur de l'IA pour ne pas bloquer le scan."""
@@ -66,4 +299,4 @@ def _get_fallback_data() -> Dict[str, Any]:
         "actions": [],
         "dates": [],
         "montants": []
-    }
\ No newline at end of file
+    }
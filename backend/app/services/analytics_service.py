@@ -0,0 +1,128 @@
+from typing import Any, Dict, List
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# --- Extraction SQL des champs JSONB produits par l'IA ---
+# L'IA renvoie des listes hétérogènes : chaînes ("2025-01-31", "120,50 €"),
+# nombres, ou objets ({"date": ..., "label": ...}). Les fragments ci-dessous
+# normalisent chaque élément directement dans PostgreSQL, pour ne jamais
+# rapatrier tous les documents en Python afin de les filtrer.
+
+# Valeur texte d'un élément de ai_dates (chaîne ou objet {"date": ...})
+_DATE_TEXT_SQL = """
+    CASE jsonb_typeof(e.value)
+        WHEN 'string' THEN e.value #>> '{}'
+        WHEN 'object' THEN COALESCE(e.value ->> 'date', e.value ->> 'echeance')
+    END
+"""
+
+# Libellé éventuel d'une date (uniquement pour les objets)
+_DATE_LABEL_SQL = """
+    CASE WHEN jsonb_typeof(e.value) = 'object'
+        THEN COALESCE(e.value ->> 'label', e.value ->> 'description', e.value ->> 'libelle')
+    END
+"""
+
+# Valeur texte d'un élément de ai_montants (nombre, chaîne ou objet)
+_AMOUNT_TEXT_SQL = """
+    CASE jsonb_typeof(e.value)
+        WHEN 'number' THEN e.value #>> '{}'
+        WHEN 'string' THEN e.value #>> '{}'
+        WHEN 'object' THEN COALESCE(
+            e.value ->> 'montant', e.value ->> 'amount',
+            e.value ->> 'valeur', e.value ->> 'value'
+        )
+    END
+"""
+
+# Éléments d'un tableau JSONB (tableau vide si la colonne n'est pas un tableau)
+_ARRAY_SQL = "CASE WHEN jsonb_typeof({column}) = 'array' THEN {column} ELSE CAST('[]' AS jsonb) END"
+
+
+# --- Échéances à venir ---
+
+# Préfixe AAAA-MM-JJ (mois 01-12, jour 01-31). Les CAST sont placés sous un
+# CASE WHEN sur ce motif : PostgreSQL peut intégrer une CTE à la requête
+# parente et évaluer les expressions avant le WHERE, qui ne protège donc pas.
+_ISO_DATE_SQL = "raw_date ~ '^\\d{4}-(0[1-9]|1[0-2])-(0[1-9]|[12]\\d|3[01])'"
+
+UPCOMING_DEADLINES_SQL = text(f"""
+    WITH raw AS (
+        SELECT d.id AS document_id, d.file_name, d.ai_type,
+               {_DATE_TEXT_SQL} AS raw_date,
+               {_DATE_LABEL_SQL} AS label
+        FROM documents d
+        CROSS JOIN LATERAL jsonb_array_elements({_ARRAY_SQL.format(column="d.ai_dates")}) AS e(value)
+        WHERE d.owner_id = :owner_id
+    ),
+    parts AS (
+        SELECT document_id, file_name, ai_type, label,
+               CASE WHEN {_ISO_DATE_SQL} THEN CAST(substring(raw_date FROM 1 FOR 4) AS int) END AS yy,
+               CASE WHEN {_ISO_DATE_SQL} THEN CAST(substring(raw_date FROM 6 FOR 2) AS int) END AS mm,
+               CASE WHEN {_ISO_DATE_SQL} THEN CAST(substring(raw_date FROM 9 FOR 2) AS int) END AS dd
+        FROM raw
+        WHERE {_ISO_DATE_SQL}
+    ),
+    dated AS (
+        -- make_date(yy, mm, 1) + (dd - 1) ne lève jamais d'erreur : les dates
+        -- impossibles (ex : 2025-02-30) sont écartées par le contrôle du jour.
+        SELECT document_id, file_name, ai_type, label, dd,
+               make_date(yy, mm, 1) + (dd - 1) AS due_date
+        FROM parts
+    )
+    SELECT document_id, file_name, ai_type, label, due_date
+    FROM dated
+    WHERE EXTRACT(DAY FROM due_date) = dd
+      AND due_date BETWEEN CURRENT_DATE AND CURRENT_DATE + CAST(:days AS int)
+    ORDER BY due_date, document_id
+    LIMIT :limit
+""")
+
+
+async def get_upcoming_deadlines(
+    db_session: AsyncSession, owner_id: str, days: int = 30, limit: int = 100
+) -> List[Dict[str, Any]]:
+    """Retourne les échéances des `days` prochains jours, calculées en SQL."""
+    result = await db_session.execute(
+        UPCOMING_DEADLINES_SQL,
+        {"owner_id": owner_id, "days": days, "limit": limit},
+    )
+    return [dict(row) for row in result.mappings().all()]
+
+
+# --- Montants totaux par type de document ---
+
+AMOUNTS_BY_TYPE_SQL = text(f"""
+    WITH amounts AS (
+        SELECT d.id AS document_id,
+               COALESCE(d.ai_type, 'Inconnu') AS ai_type,
+               regexp_replace({_AMOUNT_TEXT_SQL}, '[^0-9,.-]', '', 'g') AS clean
+        FROM documents d
+        CROSS JOIN LATERAL jsonb_array_elements({_ARRAY_SQL.format(column="d.ai_montants")}) AS e(value)
+        WHERE d.owner_id = :owner_id
+    ),
+    normalized AS (
+        -- "1.234,56" / "120,50" : virgule décimale ; "1,234.56" : virgule de milliers
+        SELECT document_id, ai_type,
+               CASE WHEN clean ~ ',\\d{{1,2}}$'
+                   THEN replace(replace(clean, '.', ''), ',', '.')
+                   ELSE replace(clean, ',', '')
+               END AS value
+        FROM amounts
+    )
+    SELECT ai_type,
+           COUNT(DISTINCT document_id) AS documents,
+           COUNT(*) AS amounts,
+           -- CAST sous CASE WHEN : le WHERE seul ne garantit pas l'ordre d'évaluation
+           SUM(CASE WHEN value ~ '^-?\\d+(\\.\\d+)?$' THEN CAST(value AS numeric) END) AS total
+    FROM normalized
+    WHERE value ~ '^-?\\d+(\\.\\d+)?$'
+    GROUP BY ai_type
+    ORDER BY total DESC
+""")
+
+
+async def get_amounts_by_type(db_session: AsyncSession, owner_id: str) -> List[Dict[str, Any]]:
+    """Retourne la somme des montants extraits par l'IA, groupée par type de document."""
+    result = await db_session.execute(AMOUNTS_BY_TYPE_SQL, {"owner_id": owner_id})
+    return [dict(row) for row in result.mappings().all()]
@@ -0,0 +1,135 @@
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, text
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.base_models import Document, DocumentChange
+
+# --------------------------------------------------
+# Journal des modifications (synchronisation par deltas)
+# --------------------------------------------------
+# Chaque écriture sur un document (scan, ingestion, PATCH, réanalyse,
+# suppression) remplace, dans la même transaction, la ligne du document dans
+# document_changes par une ligne de numéro (seq) supérieur. Un client garde le
+# dernier numéro reçu (jeton) et ne demande que les lignes suivantes.
+#
+# Les numéros d'une séquence sont attribués dans l'ordre des INSERT, pas des
+# commits : sans précaution, un client pourrait lire seq=12 avant que la
+# transaction qui a obtenu seq=11 ne soit validée, et ne jamais la voir. Le
+# verrou consultatif par propriétaire (pris juste avant l'INSERT, rendu au
+# commit) aligne l'ordre des numéros sur celui des commits pour un même
+# propriétaire : une lecture voit toujours un préfixe de son journal.
+
+UPSERT = "upsert"
+DELETE = "delete"
+
+# Durée de conservation des suppressions (tombstones) : un jeton plus ancien
+# est refusé (410) et le client repart d'une synchronisation complète
+CHANGES_TOMBSTONE_DAYS = int(os.getenv("CHANGES_TOMBSTONE_DAYS", 30))
+CHANGES_PAGE_SIZE = int(os.getenv("CHANGES_PAGE_SIZE", 500))
+
+# Au-delà, la liste d'identifiants du DELETE est découpée (limite de paramètres d'asyncpg)
+_IDS_PER_STATEMENT = 10000
+
+_LOCK_SQL = text("SELECT pg_advisory_xact_lock(hashtext(:key))")
+
+
+class ExpiredSyncToken(Exception):
+    """Jeton antérieur à la conservation des tombstones : resynchronisation complète."""
+
+
+# --- Écriture (dans la transaction de l'appelant) ---
+
+async def record_changes(db_session: AsyncSession, owner_id: str, document_ids: Iterable[int], op: str):
+    """
+    Enregistre la modification (UPSERT) ou la suppression (DELETE) de documents
+    d'un propriétaire ; le commit reste à la charge de l'appelant. À appeler en
+    dernier, juste avant le commit (après apply_stats_delta) : le verrou du
+    propriétaire est gardé jusqu'à la fin de la transaction.
+    """
+    ids = sorted(set(document_ids))
+    if not owner_id or not ids:
+        return
+    await db_session.execute(_LOCK_SQL, {"key": f"document_changes:{owner_id}"})
+    for start in range(0, len(ids), _IDS_PER_STATEMENT):
+        await db_session.execute(
+            delete(DocumentChange)
+            .where(DocumentChange.document_id.in_(ids[start:start + _IDS_PER_STATEMENT]))
+            .execution_options(synchronize_session=False)
+        )
+    now = datetime.utcnow()
+    await db_session.execute(
+        insert(DocumentChange),
+        [{"owner_id": owner_id, "document_id": document_id, "op": op, "changed_at": now} for document_id in ids],
+    )
+
+
+# --- Jetons de synchronisation ---
+
+def encode_token(seq: int, issued: Optional[float] = None) -> str:
+    """Jeton opaque : dernier numéro lu et date d'émission (epoch)."""
+    return f"{seq}-{int(issued if issued is not None else time.time())}"
+
+
+def decode_token(token: str, now: Optional[float] = None) -> int:
+    """Numéro contenu dans le jeton ; ValueError si illisible, ExpiredSyncToken si trop ancien."""
+    seq, issued = (int(part) for part in token.split("-"))
+    if seq < 0:
+        raise ValueError(token)
+    now = now if now is not None else time.time()
+    if issued < now - CHANGES_TOMBSTONE_DAYS * 86400:
+        raise ExpiredSyncToken(token)
+    return seq
+
+
+# --- Lecture ---
+
+async def list_changes(
+    db_session: AsyncSession, owner_id: str, since: int, limit: int = CHANGES_PAGE_SIZE,
+) -> Tuple[List[Dict[str, Any]], int, bool]:
+    """
+    Modifications postérieures à `since`, dans l'ordre du journal, avec le
+    document courant pour chaque UPSERT. Retourne (modifications, dernier
+    numéro lu, reste-t-il des modifications).
+    """
+    query = (
+        select(DocumentChange.seq, DocumentChange.document_id, DocumentChange.op, Document)
+        .outerjoin(Document, Document.id == DocumentChange.document_id)
+        .where(DocumentChange.owner_id == owner_id, DocumentChange.seq > since)
+        .order_by(DocumentChange.seq)
+        .limit(limit + 1)
+    )
+    if since == 0:
+        # Synchronisation complète : les suppressions sont sans objet
+        query = query.where(DocumentChange.op == UPSERT)
+    rows = (await db_session.execute(query)).all()
+
+    changes = [
+        {
+            "seq": row.seq,
+            "id": row.document_id,
+            "op": UPSERT if row.op == UPSERT and row.Document is not None else DELETE,
+            "document": row.Document if row.op == UPSERT else None,
+        }
+        for row in rows[:limit]
+    ]
+    last_seq = changes[-1]["seq"] if changes else since
+    return changes, last_seq, len(rows) > limit
+
+
+# --- Purge des tombstones (app/commands/prune_changes.py) ---
+
+async def prune_tombstones(db_session: AsyncSession, now: Optional[datetime] = None) -> int:
+    """Supprime les tombstones plus anciennes que CHANGES_TOMBSTONE_DAYS ; retourne leur nombre."""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=CHANGES_TOMBSTONE_DAYS)
+    result = await db_session.execute(
+        delete(DocumentChange)
+        .where(DocumentChange.op == DELETE, DocumentChange.changed_at < cutoff)
+        .execution_options(synchronize_session=False)
+    )
+    await db_session.commit()
+    return result.rowcount
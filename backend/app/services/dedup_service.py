@@ -0,0 +1,135 @@
+import io
+import os
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from sqlalchemy import cast, func
+from sqlalchemy.dialects.postgresql import BIT
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core import profiling
+from app.models.base_models import Document, DocumentPageHash
+
+# --------------------------------------------------
+# Détection des quasi-doublons (re-scans d'une même page)
+# --------------------------------------------------
+# Deux photos d'une même page n'ont pas les mêmes octets, mais des empreintes
+# perceptuelles (pHash, 64 bits) proches : on compare la distance de Hamming
+# aux pages déjà scannées par le même utilisateur, avant l'OCR.
+#
+# Politique (PHASH_DUPLICATE_POLICY, ou paramètre on_duplicate de /scan) :
+# - reuse : le texte OCR (et l'analyse IA, sauf si elle était en repli sans
+#   correction de l'utilisateur) du document d'origine est repris ; ni OCR ni
+#   appel LLM ;
+# - flag : traitement complet, le document est seulement marqué duplicate_of ;
+# - off : aucune recherche.
+
+PHASH_DUPLICATE_POLICY = os.getenv("PHASH_DUPLICATE_POLICY", "reuse")
+# Nombre maximal de bits différents (sur 64) pour deux scans d'une même page
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", 6))
+DUPLICATE_POLICIES = ("reuse", "flag", "off")
+if PHASH_DUPLICATE_POLICY not in DUPLICATE_POLICIES:
+    raise ValueError(f"PHASH_DUPLICATE_POLICY invalide : {PHASH_DUPLICATE_POLICY!r} (attendu : {', '.join(DUPLICATE_POLICIES)})")
+
+# Taille de l'image réduite et du bloc de basses fréquences conservé
+_PHASH_SIZE = 32
+_PHASH_BITS = 8
+
+
+@lru_cache(maxsize=1)
+def _dct_matrix():
+    """Matrice de la DCT-II orthonormée (32 x 32) : DCT 2D = C @ image @ C.T."""
+    import numpy as np
+
+    n = np.arange(_PHASH_SIZE)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * _PHASH_SIZE))
+    matrix *= np.sqrt(2 / _PHASH_SIZE)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+def compute_phash(file_content: bytes) -> Optional[int]:
+    """
+    pHash d'une image : niveaux de gris 32x32, DCT 2D (deux produits
+    matriciels), bits des 8x8 basses fréquences comparées à leur médiane.
+    Retourne un entier signé 64 bits (colonne BIGINT), ou None si l'image est illisible.
+    """
+    import numpy as np
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(io.BytesIO(file_content)) as image:
+            image.draft("L", (_PHASH_SIZE * 4, _PHASH_SIZE * 4))  # JPEG : décodage réduit
+            pixels = np.asarray(
+                image.convert("L").resize((_PHASH_SIZE, _PHASH_SIZE), Image.LANCZOS), dtype=np.float64
+            )
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+
+    matrix = _dct_matrix()
+    low = (matrix @ pixels @ matrix.T)[:_PHASH_BITS, :_PHASH_BITS].ravel()
+    # La composante continue (luminosité moyenne) est exclue du seuil
+    bits = low > np.median(low[1:])
+    value = int(np.packbits(bits).view(">u8")[0])
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+async def page_hash(file_content: bytes, content_type: str) -> Optional[int]:
+    """pHash calculé hors de la boucle d'événements (images seulement)."""
+    if not content_type.startswith("image/"):
+        return None
+    return await profiling.to_thread(compute_phash, file_content)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin((a ^ b) & ((1 << 64) - 1)).count("1")
+
+
+async def find_near_duplicate(session: AsyncSession, owner_id: str, phash: int) -> Optional[Document]:
+    """
+    Document le plus proche parmi ceux du même propriétaire (distance de Hamming
+    <= PHASH_MAX_DISTANCE), le plus récent à distance égale. L'index sur
+    owner_id borne la recherche aux pages de l'utilisateur.
+    """
+    distance = func.bit_count(cast(DocumentPageHash.phash.op("#")(phash), BIT(64)))
+    row = (
+        await session.execute(
+            select(DocumentPageHash.document_id, distance.label("distance"))
+            .filter(DocumentPageHash.owner_id == owner_id)
+            .order_by(distance, DocumentPageHash.document_id.desc())
+            .limit(1)
+        )
+    ).first()
+    if row is None or row.distance > PHASH_MAX_DISTANCE:
+        return None
+    return await session.get(Document, row.document_id)
+
+
+def original_of(document: Document) -> int:
+    """Id du document d'origine (un re-scan renvoie à l'original, pas à un autre re-scan)."""
+    return document.duplicate_of or document.id
+
+
+def reused_columns(document: Document) -> Dict[str, Any]:
+    """
+    Analyse reprise d'un quasi-doublon (colonnes ai_* et provenance). Les
+    corrections de l'utilisateur suivent (ai_edited) : la réanalyse de fond
+    ne les écrase pas sur le re-scan.
+    """
+    return {
+        "ai_type": document.ai_type,
+        "ai_resume": document.ai_resume,
+        "ai_edited": bool(document.ai_edited),
+        "ai_actions": document.ai_actions or [],
+        "ai_dates": document.ai_dates or [],
+        "ai_montants": document.ai_montants or [],
+        "ai_model": document.ai_model,
+        "ai_prompt_version": document.ai_prompt_version,
+        "ai_fallback": document.ai_fallback,
+    }
+
+
+def page_hash_row(document: Document, phash: int, page: int = 0) -> DocumentPageHash:
+    """Ligne d'index d'une page (à ajouter après le flush du document)."""
+    return DocumentPageHash(document_id=document.id, owner_id=document.owner_id, page=page, phash=phash)
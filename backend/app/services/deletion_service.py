@@ -0,0 +1,89 @@
+import os
+from typing import Iterable, List, Optional
+
+from sqlalchemy import delete, func, insert, update
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import new_session
+from app.models.base_models import PendingFileDeletion
+from app.services.storage_service import delete_files_from_s3
+
+# --------------------------------------------------
+# Suppressions de fichiers en attente
+# --------------------------------------------------
+# La suppression d'un document note ses originaux dans pending_file_deletions,
+# dans la même transaction que le DELETE : si le worker s'arrête entre le
+# commit et l'appel au stockage, la ligne reste et la purge suivante
+# (app/commands/purge_files.py) la reprend. Une ligne n'est retirée qu'après
+# la suppression effective de l'objet ; supprimer deux fois une clé n'est pas
+# une erreur S3.
+
+FILE_PURGE_BATCH_SIZE = int(os.getenv("FILE_PURGE_BATCH_SIZE", 1000))
+
+
+# --- Écriture (dans la transaction de l'appelant) ---
+
+async def schedule_file_deletions(db_session: AsyncSession, file_urls: Iterable[str]) -> List[int]:
+    """Note les fichiers à supprimer ; le commit reste à la charge de l'appelant. Retourne les ids des lignes."""
+    urls = [url for url in file_urls if url]
+    if not urls:
+        return []
+    result = await db_session.execute(
+        insert(PendingFileDeletion).returning(PendingFileDeletion.id),
+        [{"file_url": url} for url in urls],
+    )
+    return list(result.scalars().all())
+
+
+# --- Purge (après le commit, ou depuis la commande) ---
+
+async def purge_files(ids: Optional[List[int]] = None, limit: int = FILE_PURGE_BATCH_SIZE) -> int:
+    """
+    Supprime du stockage les fichiers en attente (ceux de `ids`, ou les
+    `limit` plus anciens), puis leurs lignes. Les échecs restent en attente,
+    `attempts` incrémenté. Retourne le nombre de fichiers supprimés.
+    """
+    if ids is None:
+        return await _purge_batch(None, limit)
+    purged = 0
+    for start in range(0, len(ids), limit):
+        purged += await _purge_batch(ids[start:start + limit], limit)
+    return purged
+
+
+async def _purge_batch(ids: Optional[List[int]], limit: int) -> int:
+    """Un lot : aucune connexion n'est gardée pendant les appels au stockage."""
+    query = select(PendingFileDeletion.id, PendingFileDeletion.file_url).order_by(PendingFileDeletion.id).limit(limit)
+    if ids is not None:
+        query = query.where(PendingFileDeletion.id.in_(ids))
+    async with new_session() as session:
+        rows = (await session.execute(query)).all()
+    if not rows:
+        return 0
+
+    failed = set(await delete_files_from_s3([row.file_url for row in rows]))
+    done = [row.id for row in rows if row.file_url not in failed]
+    retry = [row.id for row in rows if row.file_url in failed]
+
+    async with new_session() as session:
+        if done:
+            await session.execute(
+                delete(PendingFileDeletion)
+                .where(PendingFileDeletion.id.in_(done))
+                .execution_options(synchronize_session=False)
+            )
+        if retry:
+            await session.execute(
+                update(PendingFileDeletion)
+                .where(PendingFileDeletion.id.in_(retry))
+                .values(attempts=PendingFileDeletion.attempts + 1)
+                .execution_options(synchronize_session=False)
+            )
+        await session.commit()
+    return len(done)
+
+
+async def count_pending(db_session: AsyncSession) -> int:
+    """Nombre de fichiers encore en attente de suppression."""
+    return (await db_session.execute(select(func.count()).select_from(PendingFileDeletion))).scalar_one()
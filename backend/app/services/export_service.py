@@ -0,0 +1,264 @@
+import base64
+import io
+import json
+import os
+import zipfile
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.future import select
+
+from app.core.database import new_session
+from app.models.base_models import Document
+from app.models.document_analysis import DocumentResponse
+from app.services.storage_service import FILE_CHUNK_SIZE, iter_file_chunks
+from app.services.tiering_service import open_document_original
+
+# --------------------------------------------------
+# Export complet des documents d'un utilisateur (ZIP ou NDJSON)
+# --------------------------------------------------
+# Mémoire constante quelle que soit la taille de l'archive :
+# - documents lus par un curseur côté serveur (yield_per), détachés de la
+#   session une fois écrits ;
+# - originaux relus depuis le stockage par blocs de FILE_CHUNK_SIZE ;
+# - archive produite au fil de l'eau (ZIP sur flux non positionnable, avec
+#   descripteurs de données) et envoyée bloc par bloc.
+#
+# Reprise : les documents sont exportés par id croissant ; un export
+# interrompu reprend avec after_id = dernier id reçu en entier.
+
+EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT", 2))
+EXPORT_YIELD_PER = 100
+# Au-delà de 2 Go, une entrée ZIP doit être écrite en ZIP64 dès son en-tête
+_ZIP64_LIMIT = 2 ** 31 - 1
+
+
+
+class _ExportSlots:
+    """
+    Créneaux d'export du worker, pris sans attente avant de répondre (503
+    au-delà de la limite) : deux requêtes simultanées ne peuvent pas toutes
+    deux passer le contrôle puis attendre le même créneau.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+
+    def try_acquire(self) -> Optional["_Slot"]:
+        # Pas d'await entre le test et l'incrément : atomique dans la boucle d'événements
+        if self.active >= self.limit:
+            return None
+        self.active += 1
+        return _Slot(self)
+
+
+class _Slot:
+    """Créneau pris ; release() est sans effet après le premier appel."""
+
+    def __init__(self, slots: _ExportSlots):
+        self._slots = slots
+
+    def release(self):
+        if self._slots is not None:
+            self._slots.active -= 1
+            self._slots = None
+
+
+_export_slots = _ExportSlots(EXPORT_MAX_CONCURRENT)
+
+
+def _metadata(document: Document) -> Dict[str, Any]:
+    return DocumentResponse.model_validate(document).model_dump(mode="json", exclude={"raw_text"})
+
+
+def _safe_file_name(document: Document) -> str:
+    name = os.path.basename((document.file_name or "").replace("\\", "/")).strip()
+    return name or f"document_{document.id}"
+
+
+async def iter_user_documents(owner_id: str, after_id: int) -> AsyncIterator[Document]:
+    """Documents de l'utilisateur par id croissant, via un curseur côté serveur."""
+    async with new_session() as session:
+        result = await session.stream(
+            select(Document)
+            .filter(Document.owner_id == owner_id, Document.id > after_id)
+            .order_by(Document.id)
+            .execution_options(yield_per=EXPORT_YIELD_PER)
+        )
+        async for document in result.scalars():
+            yield document
+            # Détaché une fois exporté : la session ne garde pas toute l'archive
+            session.expunge(document)
+
+
+# --------------------------------------------------
+# NDJSON : une ligne par document (original en base64), puis une ligne de fin
+# --------------------------------------------------
+
+async def ndjson_chunks(
+    documents: AsyncIterator[Document], after_id: int, include_files: bool
+) -> AsyncIterator[bytes]:
+    count, last_id, missing = 0, after_id, []
+    async for document in documents:
+        record = {"type": "document", **_metadata(document), "raw_text": document.raw_text}
+        stored = None
+        if include_files and document.file_url:
+            try:
+                stored = await open_document_original(document)
+            except FileNotFoundError:
+                missing.append(document.id)
+
+        if stored is None:
+            yield json.dumps(record, ensure_ascii=False).encode() + b"\n"
+        else:
+            # Le fichier est encodé bloc par bloc (multiples de 3 octets)
+            yield json.dumps(record, ensure_ascii=False).encode()[:-1] + b', "file_base64": "'
+            pending = b""
+            async for chunk in iter_file_chunks(stored["Body"]):
+                pending += chunk
+                usable = len(pending) - len(pending) % 3
+                if usable:
+                    yield base64.b64encode(pending[:usable])
+                    pending = pending[usable:]
+            yield base64.b64encode(pending) + b'"}\n'
+
+        count, last_id = count + 1, document.id
+
+    yield json.dumps({
+        "type": "end", "documents": count, "after_id": after_id,
+        "last_id": last_id, "missing_files": missing,
+    }).encode() + b"\n"
+
+
+# --------------------------------------------------
+# ZIP : documents/<id>/metadata.json, texte.txt, original ; export.json à la fin
+# --------------------------------------------------
+
+class _ZipSink(io.RawIOBase):
+    """Flux d'écriture non positionnable : zipfile y écrit, le générateur le vide."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _zip_info(name: str, when: datetime, compress: bool) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(name, date_time=(when or datetime.utcnow()).timetuple()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    return info
+
+
+async def zip_chunks(
+    documents: AsyncIterator[Document], after_id: int, include_files: bool
+) -> AsyncIterator[bytes]:
+    sink = _ZipSink()
+    archive = zipfile.ZipFile(sink, mode="w")
+    count, last_id, missing = 0, after_id, []
+
+    async for document in documents:
+        folder = f"documents/{document.id}"
+        archive.writestr(
+            _zip_info(f"{folder}/metadata.json", document.created_at, compress=True),
+            json.dumps(_metadata(document), ensure_ascii=False, indent=2),
+        )
+        archive.writestr(
+            _zip_info(f"{folder}/texte.txt", document.created_at, compress=True),
+            document.raw_text or "",
+        )
+        yield sink.drain()
+
+        if include_files and document.file_url:
+            try:
+                stored = await open_document_original(document)
+            except FileNotFoundError:
+                missing.append(document.id)
+            else:
+                # Originaux (images, PDF) déjà compressés : stockés tels quels
+                info = _zip_info(f"{folder}/{_safe_file_name(document)}", document.created_at, compress=False)
+                large = (document.file_size or 0) > _ZIP64_LIMIT
+                with archive.open(info, mode="w", force_zip64=large) as entry:
+                    async for chunk in iter_file_chunks(stored["Body"], FILE_CHUNK_SIZE):
+                        entry.write(chunk)
+                        yield sink.drain()
+                yield sink.drain()
+
+        count, last_id = count + 1, document.id
+
+    archive.writestr(
+        _zip_info("export.json", datetime.utcnow(), compress=True),
+        json.dumps({
+            "documents": count, "after_id": after_id, "last_id": last_id,
+            "missing_files": missing, "generated_at": datetime.utcnow().isoformat(),
+        }, indent=2),
+    )
+    archive.close()
+    yield sink.drain()
+
+
+# --------------------------------------------------
+# Réponse HTTP
+# --------------------------------------------------
+
+async def _guarded(chunks: AsyncIterator[bytes], slot: _Slot) -> AsyncIterator[bytes]:
+    # Le créneau, pris avant la réponse, est rendu à la fin du flux (ou à la déconnexion)
+    try:
+        async for chunk in chunks:
+            if chunk:
+                yield chunk
+    finally:
+        slot.release()
+
+
+class _ExportResponse(StreamingResponse):
+    """Rend aussi le créneau si le flux n'a jamais démarré (client parti avant le premier bloc)."""
+
+    def __init__(self, content, slot: _Slot, **kwargs):
+        super().__init__(content, **kwargs)
+        self._slot = slot
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._slot.release()
+
+
+def export_response(owner_id: str, export_format: str, after_id: int, include_files: bool) -> StreamingResponse:
+    """Réponse en flux de l'export ; 503 si EXPORT_MAX_CONCURRENT exports sont déjà en cours."""
+    slot = _export_slots.try_acquire()
+    if slot is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Trop d'exports en cours, réessayez plus tard",
+            headers={"Retry-After": "30"},
+        )
+
+    documents = iter_user_documents(owner_id, after_id)
+    stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    if export_format == "ndjson":
+        chunks, media_type, extension = ndjson_chunks(documents, after_id, include_files), "application/x-ndjson", "ndjson"
+    else:
+        chunks, media_type, extension = zip_chunks(documents, after_id, include_files), "application/zip", "zip"
+
+    suffix = f"-apres-{after_id}" if after_id else ""
+    return _ExportResponse(
+        _guarded(chunks, slot),
+        slot,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="aideo-export-{stamp}{suffix}.{extension}"'},
+    )
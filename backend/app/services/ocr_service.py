@@ -1,35 +1,80 @@
+import asyncio
 import io
-from PIL import Image
-import pytesseract
+import time
 from fastapi import HTTPException, status
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from app.core.database import new_session
 from app.models.base_models import Document, User
-from app.services.storage_service import upload_file_to_s3
-from app.services.ai_service import analyze_document_with_ai
+from app.services.storage_service import IDENTITY, STORAGE_BREAKER, delete_file_from_s3, store_original
+from app.services import dedup_service
+from app.services.ai_service import run_analysis
+from app.services.stats_service import apply_stats_delta, document_stats
+from app.services.change_service import UPSERT, record_changes
+from app.services.deletion_service import schedule_file_deletions
+from app.core import profiling
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.stage_graph import StageGraph, StageTimeoutError
+from app.core.rate_limit import rate_limiter
+from app.core.resources import resources
+from app.core.metrics import (
+    PIPELINE_STAGE_SECONDS,
+    SCANS_TOTAL,
+    content_type_label,
+    size_bucket_label,
+)
 import os
-import pytesseract
 
-# Si on est dans Docker (Linux), le chemin est /usr/bin/tesseract
-# Sinon, on garde ton chemin Windows pour tes tests locaux hors Docker
-if os.name == 'nt':  # 'nt' veut dire Windows
-    pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-else:  # Sinon, on est sur Linux/Docker
-    pytesseract.pytesseract.tesseract_cmd = r'/usr/bin/tesseract'
+# Délai maximal de chaque étape du scan (secondes) : au-delà, 504 et suppression
+# de l'original déjà envoyé. L'IA a ses propres délais (AI_TIMEOUT, repli).
+STAGE_TIMEOUTS = {
+    "db": float(os.getenv("SCAN_DB_TIMEOUT", 30)),
+    "phash": float(os.getenv("SCAN_PHASH_TIMEOUT", 10)),
+    "upload": float(os.getenv("SCAN_UPLOAD_TIMEOUT", 60)),
+    "ocr": float(os.getenv("SCAN_OCR_TIMEOUT", 120)),
+    "llm": float(os.getenv("SCAN_LLM_TIMEOUT", 180)),
+}
+
+# PIL et pytesseract sont importés au premier OCR (et non au démarrage de l'API)
+_pytesseract = None
+
+
+def _get_pytesseract():
+    global _pytesseract
+    if _pytesseract is None:
+        import pytesseract
+
+        # Si on est dans Docker (Linux), le chemin est /usr/bin/tesseract
+        # Sinon, on garde ton chemin Windows pour tes tests locaux hors Docker
+        if os.name == 'nt':  # 'nt' veut dire Windows
+            pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+        else:  # Sinon, on est sur Linux/Docker
+            pytesseract.pytesseract.tesseract_cmd = r'/usr/bin/tesseract'
+        _pytesseract = pytesseract
+    return _pytesseract
 
 # --- OCR : Extraction du texte ---
 
+def _ocr_image(file_content: bytes) -> str:
+    """Décodage et OCR d'une image (bloquant : appelé dans un thread)."""
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(file_content))
+    # Utilisation de 'fra' pour la langue française
+    return _get_pytesseract().image_to_string(image, lang='fra')
+
+
 async def perform_ocr(file_content: bytes, content_type: str) -> str:
     """
     Exécute l'OCR sur le contenu du fichier (image) en mémoire.
+    Tesseract tourne hors de la boucle d'événements.
     """
     if content_type.startswith("image/"):
+        pytesseract = _get_pytesseract()
         try:
-            image = Image.open(io.BytesIO(file_content))
-            # Utilisation de 'fra' pour la langue française
-            text = pytesseract.image_to_string(image, lang='fra') 
-            return text
+            return await profiling.to_thread(_ocr_image, file_content)
         except pytesseract.TesseractNotFoundError:
              raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
                                  detail="Tesseract n'est pas installé ou trouvé sur le système.")
@@ -62,11 +107,25 @@ async def create_stub_user_if_not_exists(user_id: str, db_session: AsyncSession)
             hashed_password="hashed_password_stub" 
         )
         db_session.add(new_user)
-        # Note : Le commit sera effectué par la fonction principale
+        # Note : Le commit est effectué par l'appelant
         return new_user
     return user
 
 
+async def ensure_stub_user(user_id: str):
+    """
+    Crée l'utilisateur de test dans sa propre transaction, validée aussitôt :
+    la connexion est rendue au pool avant l'upload, l'OCR et l'IA.
+    """
+    async with new_session() as session:
+        await create_stub_user_if_not_exists(user_id, session)
+        try:
+            await session.commit()
+        except IntegrityError:
+            # Créé entre-temps par un scan concurrent
+            await session.rollback()
+
+
 # --- FONCTION PRINCIPALE APPELÉE PAR LE ROUTEUR ---
 
 async def process_ocr_and_ai(
@@ -74,52 +133,284 @@ async def process_ocr_and_ai(
     file_name: str, 
     content_type: str, 
     user_id: str,
-    db_session: AsyncSession
+    on_duplicate: Optional[str] = None,
+    budget_key: Optional[str] = None,
 ) -> Dict[str, Any]:
-    
+    """budget_key : identité débitée des secondes d'OCR et appels LLM (par défaut, user_id)."""
+    # Étiquettes des métriques : type de contenu et tranche de taille
+    labels = {
+        "content_type": content_type_label(content_type),
+        "size_bucket": size_bucket_label(len(file_content)),
+    }
+    try:
+        # Suivi des scans en cours : l'arrêt du worker attend leur fin
+        async with resources.track_scan():
+            result = await _process_ocr_and_ai(
+                file_content, file_name, content_type, user_id, labels,
+                on_duplicate or dedup_service.PHASH_DUPLICATE_POLICY, budget_key or user_id,
+            )
+    except Exception:
+        SCANS_TOTAL.inc(status="error", **labels)
+        raise
+    SCANS_TOTAL.inc(status="success" if result["status"] == "success" else "empty_ocr", **labels)
+    return result
+
+
+async def _process_ocr_and_ai(
+    file_content: bytes,
+    file_name: str,
+    content_type: str,
+    user_id: str,
+    labels: Dict[str, str],
+    on_duplicate: str,
+    budget_key: str,
+) -> Dict[str, Any]:
+    """
+    Chaque étape BDD ouvre sa propre session, le temps de ses requêtes : aucune
+    connexion du pool n'est gardée pendant l'upload, l'OCR ou l'appel à Ollama
+    (jusqu'à une minute), qui sinon épuiseraient le pool sous quelques scans
+    concurrents et bloqueraient les routes rapides (liste, détail).
+    """
+
+    # Stockage en panne : échec immédiat, avant tout calcul
+    STORAGE_BREAKER.check()
+
+    reuse_duplicate = on_duplicate == "reuse"
+    graph = StageGraph(labels)
+    _add_scan_stages(graph, file_content, file_name, content_type, user_id, budget_key, reuse_duplicate)
+
     # 0. S'assurer que l'utilisateur existe
-    await create_stub_user_if_not_exists(user_id, db_session)
+    graph.add("stub_user", lambda: ensure_stub_user(user_id), timeout=STAGE_TIMEOUTS["db"])
+
+    # 0 bis. Empreinte perceptuelle et recherche d'un scan antérieur de la même page
+    if on_duplicate == "off":
+        graph.results.update(phash=None, duplicate=None)
+    else:
+        async def find_duplicate():
+            phash = graph.results["phash"]
+            if phash is None:
+                return None
+            async with new_session() as session:
+                return await dedup_service.find_near_duplicate(session, user_id, phash)
+
+        graph.add(
+            "phash", lambda: dedup_service.page_hash(file_content, content_type),
+            timeout=STAGE_TIMEOUTS["phash"],
+        )
+        graph.add("duplicate", find_duplicate, after=("phash",), timeout=STAGE_TIMEOUTS["db"])
+
+    try:
+        await graph.run()
+    except EmptyOCRError:
+        return {"status": "fail", "message": "OCR vide."}
+    except StageTimeoutError as e:
+        raise HTTPException(status_code=504, detail=f"Scan trop long : {e}")
+
+    # 4. Insertion du document, une fois l'upload et l'analyse terminés (hors du graphe)
+    document = _build_document(graph, file_content, file_name, content_type, user_id, reuse_duplicate)
+    new_document = await _insert_document(document, graph.results["upload"], graph.results["phash"], user_id, labels)
     
-    # 1. Upload vers MinIO
+    if new_document.duplicate_of is not None:
+        return {
+          "document_id": new_document.id,
+          "status": "success",
+          "duplicate_of": new_document.duplicate_of,
+          "reused_analysis": reuse_duplicate,
+          "message": "Page déjà scannée : document rapproché de l'original.",
+        }
+    return {
+      "document_id": new_document.id,
+      "status": "success",
+      "message": "Document scanné et analysé par l'IA avec succès.",
+    }
+
+
+async def _stage_document(session: AsyncSession, document: Document, phash: Optional[int], user_id: str):
+    session.add(document)
+    # Flush d'abord : l'upsert de user_stats référence l'utilisateur (clé étrangère)
+    await session.flush()
+    if phash is not None:
+        session.add(dedup_service.page_hash_row(document, phash))
+    # Statistiques du tableau de bord mises à jour dans la même transaction
+    await apply_stats_delta(session, user_id, document_stats(document))
+    # Journal de synchronisation (GET /documents/changes), en dernier : verrou du propriétaire
+    await record_changes(session, user_id, [document.id], UPSERT)
+
+
+async def _discard_upload(file_url: str):
+    """
+    Supprime l'original d'un scan abandonné sans masquer l'erreur d'origine :
+    si le stockage est indisponible (disjoncteur ouvert, panne), le fichier
+    est noté dans pending_file_deletions pour la purge (app/commands/purge_files.py).
+    """
     try:
-        file_url = await upload_file_to_s3(file_content, user_id, file_name)
+        await delete_file_from_s3(file_url)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erreur stockage: {e}")
+        print(f"Suppression de l'original impossible, reportée à la purge : {file_url} ({e})")
+        try:
+            async with new_session() as session:
+                await schedule_file_deletions(session, [file_url])
+                await session.commit()
+        except Exception as e:
+            print(f"Alerte: original orphelin, non noté pour la purge : {file_url} ({e})")
 
-    # 2. OCR : Extraction du texte brut
-    raw_text = await perform_ocr(file_content, content_type)
-    
-    # 3. Validation de l'OCR
-    if not raw_text.strip():
-        return {"status": "fail", "message": "OCR vide."}
 
-    # --- NOUVEAU : APPEL À L'IA (OLLAMA) ---
-    ai_data = await analyze_document_with_ai(raw_text)
-    if not ai_data:
-        ai_data = {} # Évite les erreurs si l'IA échoue
-    # ---------------------------------------
-    
-    # 4. Création de l'objet Document avec les données de l'IA
-    new_document = Document(
+async def _insert_document(
+    document: Document, stored, phash: Optional[int], user_id: str, labels: Dict[str, str],
+) -> Document:
+    """
+    Insère le document dans une transaction courte. Seules les requêtes qui
+    précèdent le commit sont soumises au délai SCAN_DB_TIMEOUT, et l'original
+    envoyé n'est supprimé que si l'échec survient avant le commit : un document
+    validé ne doit jamais pointer vers un objet supprimé (au pire, un échec
+    pendant le commit laisse un objet orphelin).
+    """
+    with PIPELINE_STAGE_SECONDS.time(stage="db_insert", **labels):
+        async with new_session() as session:
+            try:
+                await asyncio.wait_for(_stage_document(session, document, phash, user_id), STAGE_TIMEOUTS["db"])
+            except BaseException as e:
+                await asyncio.shield(_discard_upload(stored.url))
+                if isinstance(e, asyncio.TimeoutError):
+                    timeout = StageTimeoutError("db_insert", STAGE_TIMEOUTS["db"])
+                    raise HTTPException(status_code=504, detail=f"Scan trop long : {timeout}")
+                raise
+            await session.commit()
+    # expire_on_commit=False : id et colonnes restent lisibles, sans relecture
+    return document
+
+
+# --- Étapes du scan (partagées par /scan et app/commands/ingest.py) ---
+
+class EmptyOCRError(Exception):
+    """L'OCR n'a trouvé aucun texte : le scan s'arrête et l'original envoyé est supprimé."""
+
+
+def _add_scan_stages(
+    graph: StageGraph,
+    file_content: bytes,
+    file_name: str,
+    content_type: str,
+    user_id: str,
+    budget_key: Optional[str],
+    reuse_duplicate: bool,
+):
+    """
+    Upload, OCR et analyse IA. L'upload ne dépend de rien : il tourne en
+    parallèle de l'OCR et de l'IA. Avec reuse_duplicate, OCR et IA attendent
+    l'étape "duplicate" et reprennent le texte et l'analyse du quasi-doublon.
+    budget_key : identité dont les budgets sont débités (None : aucun débit).
+    """
+
+    def reused() -> Optional[Document]:
+        return _reused(graph, reuse_duplicate)
+
+    # 1. Upload vers MinIO, transcodé selon la politique de stockage (supprimé si une étape ultérieure échoue)
+    async def upload():
+        try:
+            return await store_original(file_content, user_id, file_name, content_type)
+        except CircuitOpenError:
+            # Stockage en panne : 503 immédiat (gestionnaire de app/main.py)
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erreur stockage: {e}")
+
+    # 2. OCR : Extraction du texte brut (durée débitée du budget "ocr_seconds")
+    async def ocr():
+        ocr_start = time.perf_counter()
+        raw_text = await perform_ocr(file_content, content_type)
+        if budget_key is not None:
+            await rate_limiter.charge(budget_key, "ocr_seconds", time.perf_counter() - ocr_start)
+        # 3. Validation de l'OCR
+        if not raw_text.strip():
+            raise EmptyOCRError()
+        return raw_text
+
+    # --- APPEL À L'IA (OLLAMA) ---
+    async def llm():
+        if budget_key is not None:
+            await rate_limiter.charge(budget_key, "llm_calls", 1)
+        return (await run_analysis(_raw_text(graph, reuse_duplicate))).columns()
+
+    depends_on_duplicate = ("duplicate",) if reuse_duplicate else ()
+    graph.add(
+        "upload", upload, timeout=STAGE_TIMEOUTS["upload"],
+        cleanup=lambda stored: _discard_upload(stored.url),
+    )
+    graph.add(
+        "ocr", ocr, after=depends_on_duplicate, timeout=STAGE_TIMEOUTS["ocr"],
+        skip=lambda: reused() is not None,
+    )
+    graph.add(
+        "llm", llm, after=("ocr",) + depends_on_duplicate, timeout=STAGE_TIMEOUTS["llm"],
+        # L'analyse d'origine est reprise, sauf si elle était en repli (et non corrigée par l'utilisateur)
+        skip=lambda: reused() is not None and (reused().ai_edited or not reused().ai_fallback),
+    )
+
+
+def _reused(graph: StageGraph, reuse_duplicate: bool) -> Optional[Document]:
+    """Quasi-doublon dont le texte et l'analyse sont repris (None : traitement complet)."""
+    return graph.results.get("duplicate") if reuse_duplicate else None
+
+
+def _raw_text(graph: StageGraph, reuse_duplicate: bool) -> str:
+    if graph.results["ocr"] is not None:
+        return graph.results["ocr"]
+    return _reused(graph, reuse_duplicate).raw_text
+
+
+def _build_document(
+    graph: StageGraph,
+    file_content: bytes,
+    file_name: str,
+    content_type: str,
+    user_id: str,
+    reuse_duplicate: bool,
+) -> Document:
+    """Document à insérer, à partir des résultats des étapes (durées incluses)."""
+    duplicate = graph.results.get("duplicate")
+    columns = graph.results["llm"]
+    if columns is None:
+        columns = dedup_service.reused_columns(_reused(graph, reuse_duplicate))
+    stored = graph.results["upload"]
+    # Création de l'objet Document avec les données de l'IA (et leur provenance)
+    return Document(
         owner_id=user_id,
         file_name=file_name,
         content_type=content_type,
-        file_url=file_url,
-        raw_text=raw_text,
-        # On injecte ici les résultats de l'IA locale
-        ai_type=ai_data.get("type"),
-        ai_resume=ai_data.get("resume"),
-        ai_actions=ai_data.get("actions", []),
-        ai_dates=ai_data.get("dates", []),
-        ai_montants=ai_data.get("montants", [])
+        file_url=stored.url,
+        file_size=len(file_content),
+        stored_format=stored.format if stored.format != IDENTITY else None,
+        stored_size=stored.size,
+        raw_text=_raw_text(graph, reuse_duplicate),
+        duplicate_of=dedup_service.original_of(duplicate) if duplicate is not None else None,
+        stage_timings=dict(graph.timings_ms),
+        **columns,
     )
 
-    db_session.add(new_document)
-    await db_session.commit()
-    await db_session.refresh(new_document)
-    
-    return {
-      "document_id": new_document.id,
-      "status": "success",
-      "message": "Document scanné et analysé par l'IA avec succès.",
-    }
\ No newline at end of file
+
+async def run_scan_stages(
+    file_content: bytes,
+    file_name: str,
+    content_type: str,
+    user_id: str,
+    labels: Dict[str, str],
+    charge_budgets: bool = True,
+    duplicate: Optional[Document] = None,
+    reuse_duplicate: bool = False,
+) -> Optional[Document]:
+    """
+    Upload, OCR puis analyse IA. Retourne le Document à insérer (non ajouté à
+    une session), ou None si l'OCR ne trouve aucun texte (l'original envoyé est alors supprimé).
+    charge_budgets=False : pas de débit des quotas de l'utilisateur (ingestion hors ligne).
+    duplicate : quasi-doublon déjà trouvé (duplicate_of) ; avec reuse_duplicate,
+    son texte OCR est repris, ainsi que son analyse IA sauf si elle était en repli.
+    """
+    graph = StageGraph(labels, {"duplicate": duplicate})
+    budget_key = user_id if charge_budgets else None
+    _add_scan_stages(graph, file_content, file_name, content_type, user_id, budget_key, reuse_duplicate)
+    try:
+        await graph.run()
+    except EmptyOCRError:
+        return None
+    return _build_document(graph, file_content, file_name, content_type, user_id, reuse_duplicate)
@@ -0,0 +1,267 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from sqlalchemy import and_, func, or_, text, update
+from sqlalchemy.future import select
+
+from app.core.database import new_session
+from app.core.resources import resources
+from app.models.base_models import Document, ReanalysisState
+from app.services import ai_service
+from app.services.stats_service import apply_stats_delta, document_stats
+from app.services.change_service import UPSERT, record_changes
+
+# --------------------------------------------------
+# Réanalyse en tâche de fond des analyses périmées
+# --------------------------------------------------
+# Un document est périmé si son analyse vient d'un modèle qui n'est plus utilisé
+# (ni AI_MODEL ni AI_SMALL_MODEL), d'un autre prompt (PROMPT_VERSION), ou de
+# la structure de repli (IA indisponible). Le texte OCR stocké est réutilisé : ni OCR ni téléchargement.
+#
+# Les documents sont parcourus par id croissant, par lots distribués sous le
+# verrou de la ligne reanalysis_state (plusieurs workers se partagent le
+# travail sans doublon). Un appel LLM n'est lancé que si le worker est
+# inactif : aucun scan en cours et un créneau LLM libre.
+
+REANALYSIS_ENABLED = os.getenv("REANALYSIS_ENABLED", "true").lower() in ("1", "true", "yes")
+REANALYSIS_BATCH_SIZE = int(os.getenv("REANALYSIS_BATCH_SIZE", 10))
+# Pause entre deux lots, et entre deux vérifications quand il n'y a rien à faire
+REANALYSIS_PAUSE_SECONDS = float(os.getenv("REANALYSIS_PAUSE_SECONDS", 2))
+REANALYSIS_POLL_SECONDS = float(os.getenv("REANALYSIS_POLL_SECONDS", 30))
+# Attente après un échec de l'IA (repli) : inutile d'insister pendant une panne
+REANALYSIS_BACKOFF_SECONDS = float(os.getenv("REANALYSIS_BACKOFF_SECONDS", 300))
+# Délai avant un nouveau passage (analyses restées en repli)
+REANALYSIS_RETRY_SECONDS = float(os.getenv("REANALYSIS_RETRY_SECONDS", 3600))
+
+_STATE_ID = 1
+_COUNTERS = ("processed", "updated", "fallbacks", "conflicts")
+_OUTCOME_COUNTERS = {"updated": "updated", "fallback": "fallbacks", "conflict": "conflicts"}
+
+
+def stale_clause():
+    """Documents dont l'analyse est à refaire (hors corrections de l'utilisateur)."""
+    return and_(
+        Document.ai_edited.is_(False),
+        Document.raw_text.isnot(None),
+        Document.raw_text != "",
+        or_(
+            Document.ai_fallback.is_(True),
+            Document.ai_model.is_(None),
+            Document.ai_model.notin_(ai_service.ACTIVE_MODELS),
+            Document.ai_prompt_version.is_distinct_from(ai_service.PROMPT_VERSION),
+        ),
+    )
+
+
+def is_idle() -> bool:
+    """Le worker n'a aucun scan en cours, au moins un créneau LLM libre, et l'IA n'est pas en panne."""
+    return resources.inflight_scans == 0 and not ai_service.llm_saturated() and not ai_service.llm_unavailable()
+
+
+async def _locked_state(session) -> ReanalysisState:
+    # Crée la ligne au besoin puis la verrouille jusqu'à la fin de la transaction
+    await session.execute(
+        text("INSERT INTO reanalysis_state (id) VALUES (:id) ON CONFLICT DO NOTHING"),
+        {"id": _STATE_ID},
+    )
+    return (
+        await session.execute(
+            select(ReanalysisState).filter(ReanalysisState.id == _STATE_ID).with_for_update()
+        )
+    ).scalars().first()
+
+
+def _start_pass(state: ReanalysisState):
+    state.model = ai_service.MODEL_SIGNATURE
+    state.prompt_version = ai_service.PROMPT_VERSION
+    state.cursor_id = 0
+    state.pass_started_at = datetime.utcnow()
+    state.pass_finished_at = None
+    state.last_error = None
+    for counter in _COUNTERS:
+        setattr(state, counter, 0)
+
+
+async def claim_batch() -> List[Any]:
+    """Distribue le prochain lot de documents périmés (transaction courte)."""
+    async with new_session() as session:
+        state = await _locked_state(session)
+        if state.paused:
+            await session.rollback()
+            return []
+
+        target_changed = (state.model, state.prompt_version) != (ai_service.MODEL_SIGNATURE, ai_service.PROMPT_VERSION)
+        if target_changed:
+            _start_pass(state)
+        elif state.pass_finished_at is not None:
+            if datetime.utcnow() - state.pass_finished_at < timedelta(seconds=REANALYSIS_RETRY_SECONDS):
+                await session.rollback()
+                return []
+            _start_pass(state)
+
+        rows = (
+            await session.execute(
+                select(
+                    Document.id, Document.owner_id, Document.version, Document.raw_text,
+                    Document.ai_type, Document.ai_actions, Document.ai_montants, Document.file_size,
+                )
+                .filter(Document.id > state.cursor_id, stale_clause())
+                .order_by(Document.id)
+                .limit(REANALYSIS_BATCH_SIZE)
+            )
+        ).all()
+
+        if rows:
+            state.cursor_id = rows[-1].id
+        else:
+            state.pass_finished_at = datetime.utcnow()
+            print(
+                f"Réanalyse : passage terminé ({state.processed} document(s), "
+                f"{state.updated} mis à jour, {state.fallbacks} échec(s) de l'IA)."
+            )
+        await session.commit()
+        return rows
+
+
+async def _record(counters: Dict[str, int], error: str = None):
+    async with new_session() as session:
+        values = {name: getattr(ReanalysisState, name) + count for name, count in counters.items()}
+        if error is not None:
+            values["last_error"] = error
+        await session.execute(
+            update(ReanalysisState).where(ReanalysisState.id == _STATE_ID).values(**values)
+        )
+        await session.commit()
+
+
+async def reanalyze_document(row) -> str:
+    """
+    Réanalyse un document à partir de son texte OCR. Retourne "updated",
+    "fallback" (IA en échec : l'analyse existante est conservée) ou
+    "conflict" (document modifié entre-temps : la modification l'emporte).
+    """
+    analysis = await ai_service.run_analysis(row.raw_text)
+    if analysis.fallback:
+        return "fallback"
+
+    async with new_session() as session:
+        # Mise à jour conditionnelle : la version ne doit pas avoir bougé pendant l'appel LLM
+        result = await session.execute(
+            update(Document)
+            .where(Document.id == row.id, Document.version == row.version, Document.ai_edited.is_(False))
+            .values(**analysis.columns(), version=Document.version + 1)
+            .returning(Document.ai_type, Document.ai_actions, Document.ai_montants, Document.file_size)
+            .execution_options(synchronize_session=False)
+        )
+        new = result.first()
+        if new is None:
+            await session.rollback()
+            return "conflict"
+        await apply_stats_delta(session, row.owner_id, document_stats(new) - document_stats(row))
+        await record_changes(session, row.owner_id, [row.id], UPSERT)
+        await session.commit()
+    return "updated"
+
+
+async def _wait_until_idle():
+    while not is_idle():
+        await asyncio.sleep(REANALYSIS_PAUSE_SECONDS)
+
+
+async def run_batch() -> float:
+    """Traite un lot ; retourne le délai avant le lot suivant."""
+    if not is_idle():
+        return REANALYSIS_PAUSE_SECONDS
+    rows = await claim_batch()
+    if not rows:
+        return REANALYSIS_POLL_SECONDS
+
+    counters = dict.fromkeys(_COUNTERS, 0)
+    delay, error = REANALYSIS_PAUSE_SECONDS, None
+    try:
+        for row in rows:
+            # Les scans des utilisateurs passent avant la réanalyse
+            await _wait_until_idle()
+            outcome = await reanalyze_document(row)
+            counters["processed"] += 1
+            counters[_OUTCOME_COUNTERS[outcome]] += 1
+            if outcome == "fallback":
+                # IA indisponible : le reste du lot sera repris au prochain passage
+                delay, error = REANALYSIS_BACKOFF_SECONDS, f"IA indisponible ({datetime.utcnow():%Y-%m-%d %H:%M})"
+                break
+    finally:
+        if counters["processed"]:
+            await _record(counters, error)
+    return delay
+
+
+async def run_reanalysis_worker():
+    """Boucle de fond (une par worker), lancée au démarrage de l'API."""
+    while True:
+        try:
+            delay = await run_batch()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Erreur de réanalyse : {e}")
+            delay = REANALYSIS_POLL_SECONDS
+        await asyncio.sleep(delay)
+
+
+# --------------------------------------------------
+# Pilotage (routes /system/reanalysis)
+# --------------------------------------------------
+
+async def get_status() -> Dict[str, Any]:
+    async with new_session() as session:
+        state = await session.get(ReanalysisState, _STATE_ID)
+        stale = (await session.execute(select(func.count(Document.id)).filter(stale_clause()))).scalar()
+        remaining = stale
+        if state is not None and state.pass_finished_at is None:
+            remaining = (
+                await session.execute(
+                    select(func.count(Document.id)).filter(Document.id > state.cursor_id, stale_clause())
+                )
+            ).scalar()
+
+    status = {
+        "enabled": REANALYSIS_ENABLED,
+        "target": {"model": ai_service.MODEL_SIGNATURE, "prompt_version": ai_service.PROMPT_VERSION},
+        "stale_documents": stale,
+        "remaining_in_pass": remaining,
+    }
+    if state is None:
+        return {**status, "state": "not_started", "paused": False}
+
+    state_name = "paused" if state.paused else ("done" if state.pass_finished_at else "running")
+    return {
+        **status,
+        "state": state_name,
+        "paused": state.paused,
+        "pass": {
+            "model": state.model,
+            "prompt_version": state.prompt_version,
+            "cursor_id": state.cursor_id,
+            "started_at": state.pass_started_at,
+            "finished_at": state.pass_finished_at,
+            **{counter: getattr(state, counter) for counter in _COUNTERS},
+        },
+        "last_error": state.last_error,
+    }
+
+
+async def set_paused(paused: bool):
+    async with new_session() as session:
+        state = await _locked_state(session)
+        state.paused = paused
+        await session.commit()
+
+
+async def restart_pass():
+    """Nouveau passage immédiat depuis le début (ex. après une panne de l'IA)."""
+    async with new_session() as session:
+        state = await _locked_state(session)
+        _start_pass(state)
+        await session.commit()
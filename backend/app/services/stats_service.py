@@ -0,0 +1,222 @@
+import json
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Optional
+from sqlalchemy import func, text
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.base_models import Document, UserStats
+
+# Type utilisé quand l'IA n'a rien détecté (même convention que analytics_service)
+UNKNOWN_TYPE = "Inconnu"
+
+
+# --- Normalisation des montants (miroir Python des règles SQL d'analytics_service) ---
+
+def _amount_text(value: Any) -> Optional[str]:
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float, str)):
+        return str(value)
+    if isinstance(value, dict):
+        for key in ("montant", "amount", "valeur", "value"):
+            if value.get(key) is not None:
+                return str(value[key])
+    return None
+
+
+def parse_amount(value: Any) -> Optional[Decimal]:
+    """Convertit un montant extrait par l'IA ("1.234,56 €", 100, {"montant": ...})."""
+    raw = _amount_text(value)
+    if raw is None:
+        return None
+    clean = re.sub(r"[^0-9,.-]", "", raw)
+    if re.search(r",\d{1,2}$", clean):
+        clean = clean.replace(".", "").replace(",", ".")
+    else:
+        clean = clean.replace(",", "")
+    if not re.fullmatch(r"-?\d+(\.\d+)?", clean):
+        return None
+    return Decimal(clean)
+
+
+# --- Contribution d'un document aux statistiques ---
+
+@dataclass
+class StatsDelta:
+    """Variation à appliquer à la ligne user_stats d'un utilisateur."""
+    documents: int = 0
+    types: Counter = field(default_factory=Counter)
+    amount: Decimal = Decimal("0")
+    actions: int = 0
+    storage: int = 0
+
+    def __add__(self, other: "StatsDelta") -> "StatsDelta":
+        types = Counter(self.types)
+        types.update(other.types)
+        return StatsDelta(
+            documents=self.documents + other.documents,
+            types=types,
+            amount=self.amount + other.amount,
+            actions=self.actions + other.actions,
+            storage=self.storage + other.storage,
+        )
+
+    def __neg__(self) -> "StatsDelta":
+        return StatsDelta(
+            documents=-self.documents,
+            types=Counter({key: -count for key, count in self.types.items()}),
+            amount=-self.amount,
+            actions=-self.actions,
+            storage=-self.storage,
+        )
+
+    def __sub__(self, other: "StatsDelta") -> "StatsDelta":
+        return self + (-other)
+
+    def is_empty(self) -> bool:
+        return (
+            not self.documents and not self.amount and not self.actions
+            and not self.storage and not any(self.types.values())
+        )
+
+
+def document_stats(document: Any) -> StatsDelta:
+    """Contribution d'un document (objet ORM ou ligne RETURNING) aux agrégats."""
+    actions = getattr(document, "ai_actions", None)
+    amounts = getattr(document, "ai_montants", None)
+
+    total = Decimal("0")
+    for value in amounts if isinstance(amounts, list) else []:
+        parsed = parse_amount(value)
+        if parsed is not None:
+            total += parsed
+
+    return StatsDelta(
+        documents=1,
+        types=Counter({getattr(document, "ai_type", None) or UNKNOWN_TYPE: 1}),
+        amount=total,
+        actions=len(actions) if isinstance(actions, list) else 0,
+        storage=getattr(document, "file_size", None) or 0,
+    )
+
+
+def sum_stats(documents: Iterable[Any]) -> StatsDelta:
+    total = StatsDelta()
+    for document in documents:
+        total = total + document_stats(document)
+    return total
+
+
+# --- Application incrémentale (dans la transaction de l'appelant) ---
+
+# Upsert atomique : le verrou de ligne sérialise les mises à jour concurrentes.
+# Les compteurs par type sont fusionnés en SQL, les types à zéro sont retirés.
+_APPLY_DELTA_SQL = text("""
+    INSERT INTO user_stats (
+        user_id, documents_count, type_counts, total_amount,
+        pending_actions, storage_bytes, updated_at
+    )
+    VALUES (
+        :user_id, :documents, CAST(:types AS jsonb), :amount,
+        :actions, :storage, now() AT TIME ZONE 'utc'
+    )
+    ON CONFLICT (user_id) DO UPDATE SET
+        documents_count = user_stats.documents_count + EXCLUDED.documents_count,
+        total_amount = user_stats.total_amount + EXCLUDED.total_amount,
+        pending_actions = user_stats.pending_actions + EXCLUDED.pending_actions,
+        storage_bytes = user_stats.storage_bytes + EXCLUDED.storage_bytes,
+        updated_at = EXCLUDED.updated_at,
+        type_counts = (
+            SELECT COALESCE(jsonb_object_agg(key, total) FILTER (WHERE total <> 0), CAST('{}' AS jsonb))
+            FROM (
+                SELECT key, SUM(CAST(value AS int)) AS total
+                FROM (
+                    SELECT * FROM jsonb_each_text(user_stats.type_counts)
+                    UNION ALL
+                    SELECT * FROM jsonb_each_text(EXCLUDED.type_counts)
+                ) AS merged
+                GROUP BY key
+            ) AS summed
+        )
+""")
+
+
+async def apply_stats_delta(db_session: AsyncSession, owner_id: str, delta: StatsDelta):
+    """Applique une variation aux statistiques ; le commit reste à la charge de l'appelant."""
+    if not owner_id or delta.is_empty():
+        return
+    await db_session.execute(
+        _APPLY_DELTA_SQL,
+        {
+            "user_id": owner_id,
+            "documents": delta.documents,
+            "types": json.dumps({key: count for key, count in delta.types.items() if count}),
+            "amount": delta.amount,
+            "actions": delta.actions,
+            "storage": delta.storage,
+        },
+    )
+
+
+# --- Lecture O(1) ---
+
+async def get_user_stats(db_session: AsyncSession, owner_id: str) -> Dict[str, Any]:
+    """Lit la ligne d'agrégats de l'utilisateur (valeurs nulles si aucun document)."""
+    stats = await db_session.get(UserStats, owner_id, populate_existing=True)
+    if stats is None:
+        return {
+            "documents_count": 0,
+            "type_counts": {},
+            "total_amount": Decimal("0"),
+            "pending_actions": 0,
+            "storage_bytes": 0,
+            "updated_at": None,
+        }
+    return {
+        "documents_count": stats.documents_count,
+        "type_counts": stats.type_counts or {},
+        "total_amount": stats.total_amount,
+        "pending_actions": stats.pending_actions,
+        "storage_bytes": stats.storage_bytes,
+        "updated_at": stats.updated_at,
+    }
+
+
+# --- Occupation du stockage (politique de transcodage, voir storage_service) ---
+
+async def get_storage_usage(db_session: AsyncSession) -> Dict[str, Any]:
+    """Taille des originaux envoyés et des objets stockés, par format stocké (toute la base)."""
+    stored_format = func.coalesce(Document.stored_format, "identity")
+    rows = (
+        await db_session.execute(
+            select(
+                stored_format.label("format"),
+                func.count(Document.id).label("documents"),
+                func.coalesce(func.sum(Document.file_size), 0).label("original_bytes"),
+                func.coalesce(func.sum(func.coalesce(Document.stored_size, Document.file_size)), 0).label("stored_bytes"),
+            )
+            .filter(Document.file_url.isnot(None))
+            .group_by(stored_format)
+        )
+    ).all()
+
+    def summary(original: int, stored: int) -> Dict[str, Any]:
+        return {
+            "original_bytes": original,
+            "stored_bytes": stored,
+            "saved_bytes": original - stored,
+            "saved_ratio": round(1 - stored / original, 3) if original else None,
+        }
+
+    return {
+        **summary(sum(row.original_bytes for row in rows), sum(row.stored_bytes for row in rows)),
+        "documents": sum(row.documents for row in rows),
+        "by_format": {
+            row.format: {"documents": row.documents, **summary(int(row.original_bytes), int(row.stored_bytes))}
+            for row in rows
+        },
+    }
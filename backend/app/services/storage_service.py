@@ -1,67 +1,362 @@
 import os
-import boto3
-from botocore.exceptions import NoCredentialsError, ClientError
+import asyncio
+import gzip
+import io
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
 import uuid
 
+from app.core import profiling
+from app.core.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.core.resources import resources
+
 # --- Configuration des variables d'environnement ---
 STORAGE_ENDPOINT = os.getenv("STORAGE_ENDPOINT", "http://minio:9000")  # MinIO local
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID", "aideo_access_key")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY", "aideo_secret_key")
 BUCKET_NAME = os.getenv("BUCKET_NAME", "aideo-documents")
+# delete_objects accepte au plus 1000 clés par appel
+DELETE_BATCH_SIZE = 1000
+# Taille des blocs relus depuis le stockage pour le téléchargement proxifié
+FILE_CHUNK_SIZE = 64 * 1024
+# Délais et tentatives de boto3 : un MinIO injoignable doit échouer en secondes, pas en minutes
+S3_CONNECT_TIMEOUT = float(os.getenv("S3_CONNECT_TIMEOUT", 3))
+S3_READ_TIMEOUT = float(os.getenv("S3_READ_TIMEOUT", 30))
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", 2))
+
+# --- Politique de stockage des originaux ---
+# webp : les images sont stockées en WebP (avec perte pour les photos JPEG,
+# sans perte pour les scans PNG/TIFF/BMP) ; off : octets tels qu'envoyés.
+STORAGE_TRANSCODE_IMAGES = os.getenv("STORAGE_TRANSCODE_IMAGES", "off")
+# Qualité WebP des photos : 80 garde le texte net à une fraction de la taille d'un JPEG de téléphone
+STORAGE_WEBP_QUALITY = int(os.getenv("STORAGE_WEBP_QUALITY", 80))
+# Compression gzip des autres types (PDF...), restitués à l'octet près
+STORAGE_COMPRESS_OTHER = os.getenv("STORAGE_COMPRESS_OTHER", "false").lower() in ("1", "true", "yes")
+# Gain minimal (fraction de la taille) pour garder la version transformée
+STORAGE_MIN_SAVING = float(os.getenv("STORAGE_MIN_SAVING", 0.1))
+
+# --- Tier froid (originaux archivés en paquets, voir app/services/tiering_service.py) ---
+STORAGE_ARCHIVE_BUCKET = os.getenv("STORAGE_ARCHIVE_BUCKET", "aideo-archive")
+# Classe de stockage des paquets (ex : STANDARD_IA) ; doit rester lisible immédiatement (pas GLACIER)
+STORAGE_ARCHIVE_CLASS = os.getenv("STORAGE_ARCHIVE_CLASS", "")
+# list_objects_v2 renvoie au plus 1000 clés par page
+LIST_PAGE_SIZE = 1000
 
 # --- Initialisation du client S3 / MinIO ---
-s3_client = boto3.client(
-    's3',
-    endpoint_url=STORAGE_ENDPOINT,
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    config=boto3.session.Config(signature_version='s3v4'),
-    verify=False  # IMPORTANT pour MinIO local sans HTTPS
-)
+# Appelée par le conteneur de ressources au premier usage (boto3 est lourd à importer)
+def create_s3_client():
+    import boto3
+    from botocore.config import Config
+
+    return boto3.client(
+        's3',
+        endpoint_url=STORAGE_ENDPOINT,
+        aws_access_key_id=AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+        config=Config(
+            signature_version='s3v4',
+            connect_timeout=S3_CONNECT_TIMEOUT,
+            read_timeout=S3_READ_TIMEOUT,
+            retries={"max_attempts": S3_MAX_ATTEMPTS, "mode": "standard"},
+        ),
+        verify=False  # IMPORTANT pour MinIO local sans HTTPS
+    )
+
+# --- Disjoncteur du stockage ---
+def _is_storage_failure(error: BaseException) -> bool:
+    """Une réponse 4xx (clé absente, accès refusé) ou un échec partiel prouvent que le stockage répond."""
+    if isinstance(error, PartialDeleteError):
+        return False
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        return response.get("ResponseMetadata", {}).get("HTTPStatusCode", 500) >= 500
+    return True
+
+
+STORAGE_BREAKER = CircuitBreaker("storage", is_failure=_is_storage_failure)
+
+
+async def _call_storage(function, *args, **kwargs):
+    """Appel boto3 bloquant, exécuté hors de la boucle d'événements sous le disjoncteur du stockage."""
+    async with STORAGE_BREAKER.guard():
+        return await profiling.to_thread(function, *args, **kwargs)
 
 # --- Vérification / création du bucket ---
-async def check_bucket_existence():
-    """Vérifie l'existence du bucket et le crée s'il n'existe pas."""
+def _ensure_bucket(bucket: str = BUCKET_NAME):
+    from botocore.exceptions import ClientError
+
+    s3_client = resources.s3_client
     try:
-        s3_client.head_bucket(Bucket=BUCKET_NAME)
-        print(f"Bucket '{BUCKET_NAME}' existe déjà.")
+        s3_client.head_bucket(Bucket=bucket)
+        print(f"Bucket '{bucket}' existe déjà.")
     except ClientError as e:
         error_code = e.response['Error']['Code']
         if error_code == '404':
-            print(f"Bucket '{BUCKET_NAME}' non trouvé. Création en cours...")
-            s3_client.create_bucket(Bucket=BUCKET_NAME)
-            print(f"Bucket '{BUCKET_NAME}' créé avec succès.")
+            print(f"Bucket '{bucket}' non trouvé. Création en cours...")
+            s3_client.create_bucket(Bucket=bucket)
+            print(f"Bucket '{bucket}' créé avec succès.")
         else:
             raise e
 
+
+async def check_bucket_existence():
+    """Vérifie l'existence du bucket et le crée s'il n'existe pas."""
+    # Appels boto3 bloquants : exécutés hors de la boucle d'événements
+    await asyncio.to_thread(_ensure_bucket)
+
+
+async def check_bucket_reachable():
+    """Vérifie que le bucket répond (sonde /health/ready), sans le créer."""
+    await _call_storage(resources.s3_client.head_bucket, Bucket=BUCKET_NAME)
+
 # --- Upload de fichier ---
-async def upload_file_to_s3(file_content: bytes, user_id: str, file_name: str) -> str:
+async def upload_file_to_s3(
+    file_content: bytes, user_id: str, file_name: str, metadata: Optional[Dict[str, str]] = None
+) -> str:
     """
     Télécharge un fichier sur le stockage S3/MinIO.
     Retourne l'URL complète du fichier.
+    metadata : métadonnées de l'objet (format stocké, type d'origine, voir encode_for_storage).
     """
+    from botocore.exceptions import NoCredentialsError
+
     file_extension = os.path.splitext(file_name)[1]
     s3_key = f"documents/{user_id}/{str(uuid.uuid4())}{file_extension}"
 
     try:
-        s3_client.put_object(
+        # Appel boto3 bloquant : exécuté hors de la boucle d'événements
+        await _call_storage(
+            resources.s3_client.put_object,
             Bucket=BUCKET_NAME,
             Key=s3_key,
-            Body=file_content
+            Body=file_content,
+            **({"Metadata": metadata} if metadata else {}),
         )
         return f"{STORAGE_ENDPOINT}/{BUCKET_NAME}/{s3_key}"
 
     except NoCredentialsError:
         raise Exception("Les clés d'accès S3/MinIO sont manquantes ou invalides.")
+    except CircuitOpenError:
+        raise
     except Exception as e:
         print(f"Erreur d'upload S3/MinIO : {e}")
         raise Exception("Échec du téléchargement du fichier vers le stockage.")
 
+# --- Transcodage et compression des originaux ---
+# Formats stockés (colonne documents.stored_format, NULL pour "identity")
+IDENTITY, WEBP, GZIP = "identity", "webp", "gzip"
+# Format Pillow de réencodage vers le format d'origine
+_IMAGE_FORMATS = {"image/jpeg": "JPEG", "image/png": "PNG", "image/tiff": "TIFF", "image/bmp": "BMP"}
+# Modes restitués exactement après un passage en WebP (16 bits, palettes, CMYK... : stockés tels quels)
+_WEBP_MODES = {"1", "L", "LA", "RGB", "RGBA"}
+
+
+@dataclass
+class StoredFile:
+    url: str
+    format: str = IDENTITY
+    size: int = 0
+
+
+def _to_webp(file_content: bytes, content_type: str) -> Optional[Tuple[bytes, str]]:
+    """(WebP, mode d'origine), ou None si l'image ne s'y prête pas."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(file_content)) as image:
+        if getattr(image, "n_frames", 1) > 1 or image.mode not in _WEBP_MODES:
+            return None  # TIFF multipage, 16 bits...
+        mode = image.mode
+        converted = image.convert("RGBA" if "A" in mode else "RGB")
+        options = {"method": 4}
+        if content_type == "image/jpeg":
+            options["quality"] = STORAGE_WEBP_QUALITY
+        else:
+            # Scans : sans perte, les pixels sont restitués à l'identique
+            options["lossless"] = True
+        if image.info.get("exif"):
+            options["exif"] = image.info["exif"]  # orientation des photos
+        if image.info.get("icc_profile"):
+            options["icc_profile"] = image.info["icc_profile"]
+        buffer = io.BytesIO()
+        converted.save(buffer, format="WEBP", **options)
+    return buffer.getvalue(), mode
+
+
+def encode_for_storage(file_content: bytes, content_type: str) -> Tuple[bytes, str, Dict[str, str]]:
+    """
+    Octets à stocker, format et métadonnées de l'objet selon la politique de
+    stockage. La version transformée n'est gardée que si elle fait gagner au
+    moins STORAGE_MIN_SAVING (bloquant : appelé dans un thread).
+    """
+    metadata = {"original-content-type": content_type, "original-size": str(len(file_content))}
+    limit = len(file_content) * (1 - STORAGE_MIN_SAVING)
+
+    if STORAGE_TRANSCODE_IMAGES == WEBP and content_type in _IMAGE_FORMATS:
+        try:
+            result = _to_webp(file_content, content_type)
+        except Exception as e:
+            print(f"Transcodage WebP impossible, original conservé : {e}")
+            result = None
+        if result is not None and len(result[0]) <= limit:
+            return result[0], WEBP, {**metadata, "stored-format": WEBP, "original-mode": result[1]}
+
+    elif STORAGE_COMPRESS_OTHER and not content_type.startswith("image/"):
+        compressed = gzip.compress(file_content, compresslevel=6, mtime=0)
+        if len(compressed) <= limit:
+            return compressed, GZIP, {**metadata, "stored-format": GZIP}
+
+    return file_content, IDENTITY, {**metadata, "stored-format": IDENTITY}
+
+
+def decode_original(data: bytes, stored_format: str, metadata: Dict[str, str]) -> bytes:
+    """Reconstitue le fichier au format d'origine (bloquant : appelé dans un thread)."""
+    if stored_format == GZIP:
+        return gzip.decompress(data)
+    if stored_format != WEBP:
+        return data
+
+    from PIL import Image
+
+    content_type = metadata.get("original-content-type", "image/png")
+    with Image.open(io.BytesIO(data)) as image:
+        exif = image.info.get("exif")
+        restored = image.convert(metadata.get("original-mode") or image.mode)
+    options = {"quality": 92} if content_type == "image/jpeg" else {}
+    if exif and content_type in ("image/jpeg", "image/png", "image/tiff"):
+        options["exif"] = exif
+    buffer = io.BytesIO()
+    restored.save(buffer, format=_IMAGE_FORMATS.get(content_type, "PNG"), **options)
+    return buffer.getvalue()
+
+
+async def store_original(file_content: bytes, user_id: str, file_name: str, content_type: str) -> StoredFile:
+    """Encode l'original selon la politique de stockage puis l'envoie (voir upload_file_to_s3)."""
+    if STORAGE_TRANSCODE_IMAGES == "off" and not STORAGE_COMPRESS_OTHER:
+        body, stored_format, metadata = file_content, IDENTITY, None
+    else:
+        body, stored_format, metadata = await profiling.to_thread(encode_for_storage, file_content, content_type)
+    url = await upload_file_to_s3(body, user_id, file_name, metadata=metadata)
+    return StoredFile(url=url, format=stored_format, size=len(body))
+
+
+async def decode_stream(stored: Dict[str, Any], stored_format: Optional[str]) -> bytes:
+    """Lit entièrement un objet ouvert (open_file_stream, open_archive_member) et le remet au format d'origine."""
+    chunks = [chunk async for chunk in iter_file_chunks(stored["Body"])]
+    data = b"".join(chunks)
+    if stored_format in (None, IDENTITY):
+        return data
+    return await profiling.to_thread(decode_original, data, stored_format, stored.get("Metadata") or {})
+
+
+# --- Tier froid : paquets d'originaux dans le bucket d'archive ---
+# Un paquet est la concaténation des objets stockés (déjà en WebP/gzip) ;
+# la position de chaque original (décalage, longueur) et ses métadonnées
+# sont en base (table archived_files). Un original se relit par une requête
+# Range dans son paquet.
+
+async def check_archive_bucket():
+    """Crée le bucket d'archive au besoin (appelé par la commande de tiering)."""
+    await _call_storage(_ensure_bucket, STORAGE_ARCHIVE_BUCKET)
+
+
+async def read_stored_object(file_url: str) -> Tuple[bytes, Dict[str, str]]:
+    """Objet tel que stocké et ses métadonnées (FileNotFoundError si absent)."""
+    stored = await open_file_stream(file_url)
+    chunks = [chunk async for chunk in iter_file_chunks(stored["Body"])]
+    return b"".join(chunks), dict(stored.get("Metadata") or {})
+
+
+async def restore_stored_object(file_url: str, body: bytes, metadata: Dict[str, str]):
+    """Réécrit un original archivé à sa clé d'origine dans le bucket chaud (même URL, même ETag)."""
+    s3_key = get_s3_key_from_url(file_url)
+    if not s3_key:
+        raise ValueError(f"URL de stockage invalide : {file_url}")
+    await _call_storage(
+        resources.s3_client.put_object,
+        Bucket=BUCKET_NAME, Key=s3_key, Body=body,
+        **({"Metadata": metadata} if metadata else {}),
+    )
+
+
+async def put_archive_bundle(key: str, body: bytes):
+    options = {"StorageClass": STORAGE_ARCHIVE_CLASS} if STORAGE_ARCHIVE_CLASS else {}
+    await _call_storage(
+        resources.s3_client.put_object, Bucket=STORAGE_ARCHIVE_BUCKET, Key=key, Body=body, **options
+    )
+
+
+async def _get_archive_object(key: str, **params) -> Dict[str, Any]:
+    from botocore.exceptions import ClientError
+
+    try:
+        return await _call_storage(resources.s3_client.get_object, Bucket=STORAGE_ARCHIVE_BUCKET, Key=key, **params)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            raise FileNotFoundError(key)
+        raise
+
+
+async def read_archive_bundle(key: str) -> bytes:
+    """Paquet entier (compactage) ; FileNotFoundError si absent."""
+    stored = await _get_archive_object(key)
+    return b"".join([chunk async for chunk in iter_file_chunks(stored["Body"])])
+
+
+async def open_archive_member(
+    key: str, offset: int, length: int, metadata: Dict[str, str],
+    byte_range: Optional[Tuple[int, int]] = None,
+) -> Dict[str, Any]:
+    """
+    Ouvre un original archivé (entier ou plage inclusive, relative à l'original).
+    Même forme de réponse que open_file_stream ; Content-Range est exprimé
+    dans les coordonnées de l'original, pas du paquet.
+    """
+    first, last = byte_range if byte_range is not None else (0, length - 1)
+    stored = await _get_archive_object(key, Range=f"bytes={offset + first}-{offset + last}")
+    response = {"Body": stored["Body"], "ContentLength": last - first + 1, "Metadata": dict(metadata or {})}
+    if byte_range is not None:
+        response["ContentRange"] = f"bytes {first}-{last}/{length}"
+    return response
+
+
+async def read_archive_member(key: str, offset: int, length: int) -> bytes:
+    """Octets stockés d'un original archivé (restauration)."""
+    stored = await open_archive_member(key, offset, length, {})
+    return b"".join([chunk async for chunk in iter_file_chunks(stored["Body"])])
+
+
+async def delete_archive_bundle(key: str):
+    await _call_storage(resources.s3_client.delete_object, Bucket=STORAGE_ARCHIVE_BUCKET, Key=key)
+
+
+def _list_prefix(bucket: str, prefix: str) -> Dict[str, Any]:
+    objects, size, pages = 0, 0, 0
+    params = {"Bucket": bucket, "Prefix": prefix, "MaxKeys": LIST_PAGE_SIZE}
+    while True:
+        response = resources.s3_client.list_objects_v2(**params)
+        pages += 1
+        contents = response.get("Contents", [])
+        objects += len(contents)
+        size += sum(item.get("Size", 0) for item in contents)
+        if not response.get("IsTruncated"):
+            return {"objects": objects, "bytes": size, "pages": pages}
+        params["ContinuationToken"] = response["NextContinuationToken"]
+
+
+async def measure_bucket(bucket: str = BUCKET_NAME, prefix: str = "documents/") -> Dict[str, Any]:
+    """Nombre d'objets, taille et durée d'un listage complet (mesure avant/après tiering)."""
+    start = time.perf_counter()
+    report = await _call_storage(_list_prefix, bucket, prefix)
+    return {"bucket": bucket, **report, "list_seconds": round(time.perf_counter() - start, 3)}
+
 # --- Création d'une URL pré-signée ---
 def create_presigned_url(s3_key: str, expiration: int = 3600) -> str:
     """Génère une URL pré-signée pour accéder temporairement au fichier."""
+    from botocore.exceptions import ClientError
+
     try:
-        url = s3_client.generate_presigned_url(
+        url = resources.s3_client.generate_presigned_url(
             'get_object',
             Params={'Bucket': BUCKET_NAME, 'Key': s3_key},
             ExpiresIn=expiration
@@ -71,6 +366,41 @@ def create_presigned_url(s3_key: str, expiration: int = 3600) -> str:
         print(f"Erreur de création d'URL pré-signée : {e}")
         return None
 
+# --- Lecture d'un fichier (proxy de téléchargement, requêtes Range) ---
+async def open_file_stream(file_url: str, byte_range: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+    """
+    Ouvre l'objet en lecture (entier ou plage inclusive (début, fin)).
+    Retourne la réponse get_object : Body (flux boto3), ContentLength, ContentRange...
+    Lève FileNotFoundError si l'objet n'existe pas.
+    """
+    from botocore.exceptions import ClientError
+
+    s3_key = get_s3_key_from_url(file_url)
+    if not s3_key:
+        raise FileNotFoundError(file_url)
+
+    params = {"Bucket": BUCKET_NAME, "Key": s3_key}
+    if byte_range is not None:
+        params["Range"] = f"bytes={byte_range[0]}-{byte_range[1]}"
+    try:
+        return await _call_storage(resources.s3_client.get_object, **params)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            raise FileNotFoundError(file_url)
+        raise
+
+
+async def iter_file_chunks(body, chunk_size: int = FILE_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Lit un flux boto3 par blocs hors de la boucle d'événements, puis le ferme."""
+    try:
+        while True:
+            chunk = await asyncio.to_thread(body.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        body.close()
+
 # --- Extraction de la clé S3 à partir de l'URL ---
 def get_s3_key_from_url(file_url: str) -> str:
     """
@@ -93,6 +423,8 @@ async def delete_file_from_s3(file_url: str):
     """
     Supprime un fichier du stockage S3/MinIO à partir de son URL.
     """
+    from botocore.exceptions import ClientError
+
     s3_key = get_s3_key_from_url(file_url)
 
     if not s3_key:
@@ -100,9 +432,11 @@ async def delete_file_from_s3(file_url: str):
         return
 
     try:
-        s3_client.delete_object(Bucket=BUCKET_NAME, Key=s3_key)
+        await _call_storage(resources.s3_client.delete_object, Bucket=BUCKET_NAME, Key=s3_key)
         print(f"Fichier S3/MinIO supprimé : {s3_key}")
         
+    except CircuitOpenError:
+        raise
     except ClientError as e:
         if e.response['Error']['Code'] == 'NoSuchKey':
             print(f"Alerte: Tentative de suppression d'une clé S3/MinIO inexistante : {s3_key}")
@@ -112,3 +446,58 @@ async def delete_file_from_s3(file_url: str):
     except Exception as e:
         print(f"Erreur inattendue lors de la suppression : {e}")
         raise Exception("Échec de la suppression du fichier du stockage.")
+
+
+# --- Suppression groupée de fichiers ---
+class PartialDeleteError(Exception):
+    """Certaines clés n'ont pas pu être supprimées par delete_objects."""
+
+    def __init__(self, keys: List[str]):
+        super().__init__(f"{len(keys)} clé(s) non supprimée(s)")
+        self.keys = keys
+
+
+def _delete_batch(keys: List[str]):
+    """
+    Supprime un lot de clés en un seul appel, sans nouvel essai : chaque appel
+    passe par le disjoncteur, et les échecs sont retentés par la purge
+    (pending_file_deletions). Supprimer une clé déjà absente n'est pas une erreur S3.
+    """
+    response = resources.s3_client.delete_objects(
+        Bucket=BUCKET_NAME,
+        Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+    )
+    failed = [
+        error["Key"] for error in response.get("Errors", [])
+        if error.get("Code") != "NoSuchKey"
+    ]
+    if failed:
+        raise PartialDeleteError(failed)
+
+
+async def delete_files_from_s3(file_urls: Iterable[str]) -> List[str]:
+    """
+    Supprime plusieurs fichiers par lots de DELETE_BATCH_SIZE (tâche de fond).
+    Les appels boto3 bloquants sont exécutés hors de la boucle d'événements.
+    Retourne les URL dont la suppression a échoué (à retenter).
+    """
+    urls_by_key = {}
+    for url in file_urls:
+        key = get_s3_key_from_url(url)
+        if key:
+            urls_by_key[key] = url
+    keys = list(urls_by_key)
+    failed: List[str] = []
+
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        batch = keys[start:start + DELETE_BATCH_SIZE]
+        try:
+            await _call_storage(_delete_batch, batch)
+            print(f"{len(batch)} fichier(s) S3/MinIO supprimé(s).")
+        except PartialDeleteError as e:
+            print(f"Alerte: clés S3/MinIO non supprimées : {e.keys}")
+            failed.extend(urls_by_key[key] for key in e.keys if key in urls_by_key)
+        except Exception as e:
+            print(f"Erreur lors de la suppression groupée S3/MinIO : {e}")
+            failed.extend(urls_by_key[key] for key in batch)
+    return failed
@@ -0,0 +1,559 @@
+import asyncio
+import io
+import os
+import uuid
+from datetime import datetime, timedelta
+from itertools import groupby
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, bindparam, delete, exists, func, insert, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.database import new_session
+from app.core.metrics import ARCHIVE_READS_TOTAL, ARCHIVE_RESTORES_TOTAL
+from app.models.base_models import ArchiveBundle, ArchivedFile, Document
+from app.services.storage_service import (
+    IDENTITY,
+    STORAGE_ARCHIVE_BUCKET,
+    decode_stream,
+    delete_archive_bundle,
+    delete_file_from_s3,
+    delete_files_from_s3,
+    open_archive_member,
+    open_file_stream,
+    put_archive_bundle,
+    read_archive_bundle,
+    read_archive_member,
+    read_stored_object,
+    restore_stored_object,
+)
+
+# --------------------------------------------------
+# Tiers de stockage des originaux (chaud / froid)
+# --------------------------------------------------
+# La plupart des documents ne sont plus ouverts après le premier mois. Les
+# originaux non consultés depuis TIERING_COLD_AFTER_DAYS quittent le bucket
+# chaud : ils sont regroupés par propriétaire dans des paquets (un objet de
+# TIERING_BUNDLE_BYTES au plus) du bucket d'archive, leur position notée dans
+# archived_files. Le bucket chaud ne garde que les documents vivants : moins
+# d'objets à lister, sauvegarder ou répliquer.
+#
+# - Consultations : la fiche et le téléchargement mettent à jour
+#   last_accessed_at (au plus une écriture par TIERING_ACCESS_RESOLUTION_SECONDS).
+# - Lecture d'un original froid : requête Range dans son paquet, sans
+#   attendre ; il est ensuite restauré en tâche de fond à sa clé d'origine
+#   (même URL, même ETag) et redevient chaud.
+# - Les paquets sont immuables : un original restauré ou supprimé y laisse
+#   des octets morts ; le compactage réécrit les paquets dont la part vivante
+#   passe sous TIERING_COMPACT_BELOW et supprime les paquets vides.
+#
+# L'archivage et le compactage sont lancés par app/commands/tier_storage.py.
+
+TIERING_COLD_AFTER_DAYS = int(os.getenv("TIERING_COLD_AFTER_DAYS", 30))
+TIERING_BUNDLE_BYTES = int(os.getenv("TIERING_BUNDLE_BYTES", 64 * 1024 * 1024))
+TIERING_BATCH_SIZE = int(os.getenv("TIERING_BATCH_SIZE", 1000))
+# Lectures simultanées dans le bucket chaud pendant la constitution d'un paquet
+TIERING_CONCURRENCY = int(os.getenv("TIERING_CONCURRENCY", 8))
+TIERING_COMPACT_BELOW = float(os.getenv("TIERING_COMPACT_BELOW", 0.5))
+TIERING_RESTORE_ON_ACCESS = os.getenv("TIERING_RESTORE_ON_ACCESS", "true").lower() in ("1", "true", "yes")
+TIERING_ACCESS_RESOLUTION_SECONDS = int(os.getenv("TIERING_ACCESS_RESOLUTION_SECONDS", 3600))
+
+COLD = "cold"
+
+# Restaurations en cours dans ce worker (la fiche puis le téléchargement la demandent souvent deux fois)
+_restoring: Set[int] = set()
+
+
+def cold_clause(cutoff: datetime):
+    """Originaux chauds non consultés depuis cutoff (à défaut de consultation : depuis le scan)."""
+    return and_(
+        Document.storage_tier.is_(None),
+        Document.file_url.isnot(None),
+        func.coalesce(Document.last_accessed_at, Document.created_at) < cutoff,
+    )
+
+
+# --------------------------------------------------
+# Consultations (fiche et téléchargement)
+# --------------------------------------------------
+
+def access_is_stale(last_accessed_at: Optional[datetime], now: Optional[datetime] = None) -> bool:
+    now = now or datetime.utcnow()
+    return last_accessed_at is None or now - last_accessed_at >= timedelta(seconds=TIERING_ACCESS_RESOLUTION_SECONDS)
+
+
+async def record_access(db: AsyncSession, document_id: int, last_accessed_at: Optional[datetime]):
+    """
+    Note la consultation d'un document. Sans effet si elle est déjà notée
+    à la résolution près : une fiche ouverte en boucle n'écrit pas à chaque fois.
+    Ni la version ni updated_at ne changent (l'ETag de la fiche reste valide).
+    """
+    if not access_is_stale(last_accessed_at):
+        return
+    try:
+        await db.execute(
+            update(Document)
+            .where(Document.id == document_id)
+            .values(last_accessed_at=datetime.utcnow(), updated_at=Document.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        print(f"Consultation du document {document_id} non enregistrée : {e}")
+
+
+# --------------------------------------------------
+# Lecture des originaux, quel que soit leur tier
+# --------------------------------------------------
+
+async def _archived_location(document_id: int):
+    async with new_session() as session:
+        return (
+            await session.execute(
+                select(ArchiveBundle.key, ArchivedFile.byte_offset, ArchivedFile.length, ArchivedFile.file_metadata)
+                .join(ArchiveBundle, ArchiveBundle.id == ArchivedFile.bundle_id)
+                .filter(ArchivedFile.document_id == document_id)
+            )
+        ).first()
+
+
+async def _current_tier(document_id: int) -> Tuple[bool, Optional[str]]:
+    async with new_session() as session:
+        row = (
+            await session.execute(select(Document.storage_tier).filter(Document.id == document_id))
+        ).first()
+    return row is not None, row.storage_tier if row else None
+
+
+async def _open(document_id: int, file_url: str, storage_tier: Optional[str], byte_range, route: str):
+    if storage_tier != COLD:
+        return await open_file_stream(file_url, byte_range)
+    location = await _archived_location(document_id)
+    if location is None:
+        raise FileNotFoundError(file_url)
+    stored = await open_archive_member(
+        location.key, location.byte_offset, location.length, location.file_metadata, byte_range
+    )
+    ARCHIVE_READS_TOTAL.inc(route=route)
+    return stored
+
+
+async def open_document_file(
+    document_id: int, file_url: str, storage_tier: Optional[str],
+    byte_range: Optional[Tuple[int, int]] = None, route: str = "download",
+) -> Dict[str, Any]:
+    """
+    Ouvre l'objet stocké d'un document (même forme que open_file_stream),
+    dans le bucket chaud ou dans son paquet. FileNotFoundError si introuvable.
+    """
+    try:
+        return await _open(document_id, file_url, storage_tier, byte_range, route)
+    except FileNotFoundError:
+        # Déplacé entre la lecture de la fiche et celle de l'objet (archivage,
+        # restauration, compactage) : le tier est relu et la lecture refaite une fois
+        found, current_tier = await _current_tier(document_id)
+        if not found:
+            raise
+        return await _open(document_id, file_url, current_tier, byte_range, route)
+
+
+async def read_document_original(
+    document_id: int, file_url: str, storage_tier: Optional[str], stored_format: Optional[str],
+    route: str = "download",
+) -> bytes:
+    """Original entier, au format d'origine."""
+    stored = await open_document_file(document_id, file_url, storage_tier, route=route)
+    return await decode_stream(stored, stored_format)
+
+
+async def open_document_original(document, route: str = "export") -> Dict[str, Any]:
+    """Comme open_document_file, au format d'origine (export)."""
+    stored = await open_document_file(document.id, document.file_url, document.storage_tier, route=route)
+    if document.stored_format in (None, IDENTITY):
+        return stored
+    data = await decode_stream(stored, document.stored_format)
+    return {"Body": io.BytesIO(data), "ContentLength": len(data)}
+
+
+# --------------------------------------------------
+# Restauration paresseuse (tâche de fond après une consultation)
+# --------------------------------------------------
+
+async def restore_document(document_id: int) -> str:
+    """
+    Remet l'original archivé à sa clé d'origine dans le bucket chaud puis
+    marque le document chaud. Retourne "restored", "skipped" (déjà chaud,
+    supprimé, restauration en cours) ou "failed" (réessayée à la prochaine consultation).
+    """
+    if not TIERING_RESTORE_ON_ACCESS or document_id in _restoring:
+        return "skipped"
+    _restoring.add(document_id)
+    try:
+        outcome = await _restore(document_id)
+    except Exception as e:
+        print(f"Restauration du document {document_id} impossible : {e}")
+        outcome = "failed"
+    finally:
+        _restoring.discard(document_id)
+    ARCHIVE_RESTORES_TOTAL.inc(outcome=outcome)
+    return outcome
+
+
+async def _restore(document_id: int) -> str:
+    async with new_session() as session:
+        row = (
+            await session.execute(
+                select(
+                    Document.file_url, ArchiveBundle.key, ArchivedFile.byte_offset,
+                    ArchivedFile.length, ArchivedFile.file_metadata,
+                )
+                .join(ArchivedFile, ArchivedFile.document_id == Document.id)
+                .join(ArchiveBundle, ArchiveBundle.id == ArchivedFile.bundle_id)
+                .filter(Document.id == document_id, Document.storage_tier == COLD)
+            )
+        ).first()
+    if row is None:
+        return "skipped"
+
+    body = await read_archive_member(row.key, row.byte_offset, row.length)
+    await restore_stored_object(row.file_url, body, row.file_metadata)
+
+    async with new_session() as session:
+        restored = (
+            await session.execute(
+                update(Document)
+                .where(Document.id == document_id, Document.storage_tier == COLD)
+                .values(storage_tier=None, updated_at=Document.updated_at)
+                .returning(Document.id)
+                .execution_options(synchronize_session=False)
+            )
+        ).first()
+        await session.execute(delete(ArchivedFile).where(ArchivedFile.document_id == document_id))
+        await session.commit()
+
+    if restored is None:
+        found, current_tier = await _current_tier(document_id)
+        if not found:
+            # Document supprimé pendant la copie : l'objet recopié serait orphelin
+            await delete_file_from_s3(row.file_url)
+        return "skipped"
+    return "restored"
+
+
+# --------------------------------------------------
+# Archivage (commande tier_storage)
+# --------------------------------------------------
+
+def _chunks(rows: List[Any]) -> List[List[Any]]:
+    """Découpe les originaux d'un propriétaire en paquets de TIERING_BUNDLE_BYTES au plus."""
+    chunks, current, size = [], [], 0
+    for row in rows:
+        if current and size + (row.size or 0) > TIERING_BUNDLE_BYTES:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(row)
+        size += row.size or 0
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _bundle_key(owner_id: str) -> str:
+    return f"bundles/{owner_id}/{datetime.utcnow():%Y/%m}/{uuid.uuid4()}.bundle"
+
+
+async def _archive_bundle(owner_id: str, rows: List[Any], cutoff: datetime) -> Dict[str, int]:
+    semaphore = asyncio.Semaphore(TIERING_CONCURRENCY)
+
+    async def fetch(row):
+        async with semaphore:
+            try:
+                return row, *(await read_stored_object(row.file_url))
+            except FileNotFoundError:
+                return row, b"", {}
+
+    members, parts, offset, missing = [], [], 0, 0
+    for row, body, metadata in await asyncio.gather(*(fetch(row) for row in rows)):
+        if not body:
+            missing += 1  # objet absent (ou vide) : le document reste dans le tier chaud
+            continue
+        members.append({"row": row, "byte_offset": offset, "length": len(body), "file_metadata": metadata})
+        parts.append(body)
+        offset += len(body)
+    if not members:
+        return {"archived": 0, "bundles": 0, "bytes": 0, "missing": missing}
+
+    key = _bundle_key(owner_id)
+    await put_archive_bundle(key, b"".join(parts))
+    try:
+        async with new_session() as session:
+            bundle = ArchiveBundle(owner_id=owner_id, key=key, size=offset, members=len(members))
+            session.add(bundle)
+            await session.flush()
+            # Consulté ou supprimé pendant la copie : ce document-là n'est pas archivé
+            archived = set(
+                (
+                    await session.execute(
+                        update(Document)
+                        .where(Document.id.in_([member["row"].id for member in members]), cold_clause(cutoff))
+                        .values(storage_tier=COLD, updated_at=Document.updated_at)
+                        .returning(Document.id)
+                        .execution_options(synchronize_session=False)
+                    )
+                ).scalars().all()
+            )
+            members = [member for member in members if member["row"].id in archived]
+            if not members:
+                await session.rollback()
+                await delete_archive_bundle(key)
+                return {"archived": 0, "bundles": 0, "bytes": 0, "missing": missing}
+            await session.execute(
+                insert(ArchivedFile),
+                [
+                    {
+                        "document_id": member["row"].id, "bundle_id": bundle.id,
+                        "byte_offset": member["byte_offset"], "length": member["length"],
+                        "file_metadata": member["file_metadata"],
+                    }
+                    for member in members
+                ],
+            )
+            bundle.members = len(members)
+            await session.commit()
+    except BaseException:
+        try:
+            await delete_archive_bundle(key)
+        except Exception as e:
+            print(f"Paquet orphelin {key} : {e}")
+        raise
+
+    # Les copies chaudes ne sont supprimées qu'une fois l'archivage validé en base
+    await delete_files_from_s3([member["row"].file_url for member in members])
+    return {
+        "archived": len(members), "bundles": 1,
+        "bytes": sum(member["length"] for member in members), "missing": missing,
+    }
+
+
+async def archive_cold_documents(
+    max_documents: Optional[int] = None, dry_run: bool = False, now: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """Archive les originaux froids, par lots de TIERING_BATCH_SIZE, propriétaire par propriétaire."""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=TIERING_COLD_AFTER_DAYS)
+    report = {"cutoff": cutoff.isoformat(), "candidates": 0, "archived": 0, "bundles": 0, "bytes": 0, "missing": 0}
+    cursor = None
+    size = func.coalesce(Document.stored_size, Document.file_size, 0).label("size")
+
+    while max_documents is None or report["candidates"] < max_documents:
+        limit = TIERING_BATCH_SIZE if max_documents is None else min(TIERING_BATCH_SIZE, max_documents - report["candidates"])
+        query = select(Document.id, Document.owner_id, Document.file_url, size).filter(cold_clause(cutoff))
+        if cursor is not None:
+            query = query.filter(tuple_(Document.owner_id, Document.id) > tuple_(*cursor))
+        async with new_session() as session:
+            rows = (await session.execute(query.order_by(Document.owner_id, Document.id).limit(limit))).all()
+        if not rows:
+            break
+        cursor = (rows[-1].owner_id, rows[-1].id)
+        report["candidates"] += len(rows)
+        if dry_run:
+            report["bytes"] += sum(row.size for row in rows)
+            continue
+
+        for owner_id, owner_rows in groupby(rows, key=lambda row: row.owner_id):
+            for chunk in _chunks(list(owner_rows)):
+                result = await _archive_bundle(owner_id, chunk, cutoff)
+                for name, value in result.items():
+                    report[name] += value
+        print(
+            f"Tiering : {report['archived']} original(aux) archivé(s) dans {report['bundles']} paquet(s), "
+            f"{report['bytes'] / 1e6:.1f} Mo."
+        )
+    return report
+
+
+# --------------------------------------------------
+# Compactage des paquets
+# --------------------------------------------------
+
+_archived_table = ArchivedFile.__table__
+
+
+async def _sparse_bundles() -> List[Any]:
+    live = (
+        select(
+            ArchivedFile.bundle_id,
+            func.count().label("live_members"),
+            func.sum(ArchivedFile.length).label("live_bytes"),
+        )
+        .group_by(ArchivedFile.bundle_id)
+        .subquery()
+    )
+    live_bytes = func.coalesce(live.c.live_bytes, 0)
+    async with new_session() as session:
+        return (
+            await session.execute(
+                select(
+                    ArchiveBundle.id, ArchiveBundle.owner_id, ArchiveBundle.key, ArchiveBundle.size,
+                    live_bytes.label("live_bytes"), func.coalesce(live.c.live_members, 0).label("live_members"),
+                )
+                .outerjoin(live, live.c.bundle_id == ArchiveBundle.id)
+                .filter(live_bytes < ArchiveBundle.size * TIERING_COMPACT_BELOW)
+                .order_by(ArchiveBundle.owner_id, ArchiveBundle.id)
+            )
+        ).all()
+
+
+async def _drop_bundles(bundles: List[Any]) -> int:
+    """Supprime les paquets qui n'ont plus de membre ; retourne les octets libérés."""
+    async with new_session() as session:
+        dropped = (
+            await session.execute(
+                delete(ArchiveBundle)
+                .where(
+                    ArchiveBundle.id.in_([bundle.id for bundle in bundles]),
+                    ~exists().where(ArchivedFile.bundle_id == ArchiveBundle.id),
+                )
+                .returning(ArchiveBundle.key, ArchiveBundle.size)
+                .execution_options(synchronize_session=False)
+            )
+        ).all()
+        await session.commit()
+    for row in dropped:
+        try:
+            await delete_archive_bundle(row.key)
+        except Exception as e:
+            print(f"Paquet {row.key} non supprimé du stockage : {e}")
+    return sum(row.size for row in dropped)
+
+
+async def _repack(owner_id: str, bundles: List[Any]) -> Dict[str, int]:
+    """Réécrit les membres vivants de paquets clairsemés dans un nouveau paquet."""
+    async with new_session() as session:
+        members = (
+            await session.execute(
+                select(ArchivedFile.document_id, ArchivedFile.bundle_id, ArchivedFile.byte_offset, ArchivedFile.length)
+                .filter(ArchivedFile.bundle_id.in_([bundle.id for bundle in bundles]))
+                .order_by(ArchivedFile.bundle_id, ArchivedFile.byte_offset)
+            )
+        ).all()
+
+    parts, moves, offset = [], [], 0
+    for bundle in bundles:
+        bundle_members = [member for member in members if member.bundle_id == bundle.id]
+        if not bundle_members:
+            continue
+        data = await read_archive_bundle(bundle.key)
+        for member in bundle_members:
+            parts.append(data[member.byte_offset:member.byte_offset + member.length])
+            moves.append({
+                "b_document_id": member.document_id, "b_old_bundle": bundle.id, "b_offset": offset,
+            })
+            offset += member.length
+
+    if moves:
+        key = _bundle_key(owner_id)
+        await put_archive_bundle(key, b"".join(parts))
+        try:
+            async with new_session() as session:
+                new_bundle = ArchiveBundle(owner_id=owner_id, key=key, size=offset, members=len(moves))
+                session.add(new_bundle)
+                await session.flush()
+                # Un membre restauré entre-temps n'a plus de ligne : rien à déplacer
+                await session.execute(
+                    update(_archived_table)
+                    .where(
+                        _archived_table.c.document_id == bindparam("b_document_id"),
+                        _archived_table.c.bundle_id == bindparam("b_old_bundle"),
+                    )
+                    .values(bundle_id=new_bundle.id, byte_offset=bindparam("b_offset")),
+                    moves,
+                )
+                await session.commit()
+        except BaseException:
+            try:
+                await delete_archive_bundle(key)
+            except Exception as e:
+                print(f"Paquet orphelin {key} : {e}")
+            raise
+
+    reclaimed = await _drop_bundles(bundles)
+    return {"bundles_repacked": len(bundles), "bundles_created": 1 if moves else 0, "bytes_reclaimed": reclaimed - offset}
+
+
+async def compact_bundles() -> Dict[str, int]:
+    """
+    Supprime les paquets vides et réécrit, propriétaire par propriétaire, les
+    paquets dont la part vivante est sous TIERING_COMPACT_BELOW (plusieurs
+    paquets clairsemés fusionnent en un seul, dans la limite de TIERING_BUNDLE_BYTES).
+    """
+    report = {"bundles_dropped": 0, "bundles_repacked": 0, "bundles_created": 0, "bytes_reclaimed": 0}
+    for owner_id, owner_bundles in groupby(await _sparse_bundles(), key=lambda bundle: bundle.owner_id):
+        owner_bundles = list(owner_bundles)
+        empty = [bundle for bundle in owner_bundles if not bundle.live_members]
+        if empty:
+            report["bytes_reclaimed"] += await _drop_bundles(empty)
+            report["bundles_dropped"] += len(empty)
+
+        group, live = [], 0
+        for bundle in [bundle for bundle in owner_bundles if bundle.live_members]:
+            if group and live + bundle.live_bytes > TIERING_BUNDLE_BYTES:
+                for name, value in (await _repack(owner_id, group)).items():
+                    report[name] += value
+                group, live = [], 0
+            group.append(bundle)
+            live += bundle.live_bytes
+        if group:
+            for name, value in (await _repack(owner_id, group)).items():
+                report[name] += value
+    return report
+
+
+# --------------------------------------------------
+# Occupation par tier (route /system/storage)
+# --------------------------------------------------
+
+async def get_tier_usage(db_session: AsyncSession) -> Dict[str, Any]:
+    stored_size = func.coalesce(Document.stored_size, Document.file_size, 0)
+    tiers = (
+        await db_session.execute(
+            select(
+                Document.storage_tier,
+                func.count(Document.id).label("documents"),
+                func.coalesce(func.sum(stored_size), 0).label("bytes"),
+            )
+            .filter(Document.file_url.isnot(None))
+            .group_by(Document.storage_tier)
+        )
+    ).all()
+    bundles = (
+        await db_session.execute(
+            select(func.count(ArchiveBundle.id), func.coalesce(func.sum(ArchiveBundle.size), 0))
+        )
+    ).first()
+    live_bytes = (
+        await db_session.execute(select(func.coalesce(func.sum(ArchivedFile.length), 0)))
+    ).scalar()
+
+    usage = {
+        row.storage_tier or "hot": {"documents": row.documents, "bytes": int(row.bytes)}
+        for row in tiers
+    }
+    hot = usage.get("hot", {"documents": 0, "bytes": 0})
+    cold = usage.get(COLD, {"documents": 0, "bytes": 0})
+    return {
+        "policy": {
+            "cold_after_days": TIERING_COLD_AFTER_DAYS,
+            "bundle_bytes": TIERING_BUNDLE_BYTES,
+            "archive_bucket": STORAGE_ARCHIVE_BUCKET,
+            "restore_on_access": TIERING_RESTORE_ON_ACCESS,
+        },
+        "hot": hot,
+        "cold": {
+            **cold,
+            "bundles": bundles[0],
+            "bundle_bytes": int(bundles[1]),
+            "dead_bytes": int(bundles[1]) - int(live_bytes),
+        },
+    }
@@ -0,0 +1,82 @@
+"""
+Rafale de connexions : latence de la boucle d'événements pendant la vérification bcrypt.
+
+Compare la vérification synchrone (ancien comportement des routes) et la version
+déportée dans le pool dédié. Pendant la rafale, une tâche "sonde" se réveille
+toutes les 10 ms et mesure son retard : c'est le temps pendant lequel toutes
+les autres requêtes du worker auraient été bloquées.
+
+    python benchmarks/bench_login_storm.py --logins 50
+    BCRYPT_ROUNDS=12 PASSWORD_HASH_WORKERS=4 python benchmarks/bench_login_storm.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.core import security  # noqa: E402
+
+PROBE_INTERVAL = 0.010
+
+
+async def _probe(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(max(0.0, time.perf_counter() - start - PROBE_INTERVAL))
+
+
+async def _login_sync(password: str, hashed: str):
+    # Reproduit l'ancien code : appel bloquant dans une coroutine
+    security.verify_password(password, hashed)
+
+
+async def _login_async(password: str, hashed: str):
+    await security.verify_password_async(password, hashed)
+
+
+async def storm(mode: str, logins: int, hashed: str) -> dict:
+    login = _login_sync if mode == "sync" else _login_async
+    lags, stop = [], asyncio.Event()
+    probe = asyncio.create_task(_probe(lags, stop))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[login("MotDePasse123", hashed) for _ in range(logins)])
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await probe
+    lags.sort()
+    return {
+        "mode": mode,
+        "logins": logins,
+        "elapsed_s": round(elapsed, 3),
+        "logins_per_second": round(logins / elapsed, 1),
+        "loop_lag_ms": {
+            "max": round(lags[-1] * 1000, 1) if lags else None,
+            "p99": round(lags[int(len(lags) * 0.99) - 1] * 1000, 1) if lags else None,
+            "samples": len(lags),
+        },
+    }
+
+
+async def main(logins: int):
+    hashed = security.get_password_hash("MotDePasse123")
+    # Le pool borne les vérifications en attente : la rafale doit tenir dedans
+    logins = min(logins, security.PASSWORD_HASH_WORKERS + security.PASSWORD_HASH_MAX_PENDING)
+    results = [await storm("sync", logins, hashed), await storm("pool", logins, hashed)]
+    print(json.dumps({
+        "bcrypt_rounds": security.BCRYPT_ROUNDS,
+        "hash_workers": security.PASSWORD_HASH_WORKERS,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=32)
+    asyncio.run(main(parser.parse_args().logins))
@@ -0,0 +1,107 @@
+"""
+Sérialisation des listes de documents : temps et octets transmis.
+
+    python benchmarks/bench_serialization.py --sizes 100 1000 10000
+
+Compare, sur des objets ORM Document synthétiques (raw_text de ~2 Ko) :
+- per_row : model_validate ligne par ligne + jsonable_encoder + json.dumps
+  (ancien chemin de GET /documents/) ;
+- adapter : ModelSerializer (TypeAdapter compilé, encodage pydantic-core) ;
+- adapter_orjson : même validation, encodage par orjson (si installé).
+
+Puis la taille du corps : brut, gzip et brotli (si installé) aux niveaux
+configurés dans app/core/compression.py, avec le temps de compression.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.encoders import jsonable_encoder
+
+from app.core.compression import available_encodings, compress_body
+from app.core.serialization import ModelSerializer
+from app.models.base_models import Document
+from app.models.document_analysis import DocumentResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+RAW_TEXT = (
+    "REPUBLIQUE FRANCAISE - Avis d'imposition 2024. Montant à payer : 1 234,56 EUR. "
+    "Date limite de paiement : 15/09/2024. Référence de l'avis : 24 75 123 456 789. "
+) * 12
+
+
+def make_documents(count: int) -> List[Document]:
+    created = datetime(2024, 1, 1)
+    return [
+        Document(
+            id=i,
+            owner_id="bench-user",
+            file_name=f"scan_{i}.jpg",
+            content_type="image/jpeg",
+            file_url=f"http://minio:9000/aideo-documents/bench-user/{i}.jpg",
+            raw_text=RAW_TEXT,
+            ai_type="Impôts",
+            ai_resume="Avis d'imposition sur le revenu 2024.",
+            ai_actions=["Payer avant le 15/09/2024"],
+            ai_dates=["15/09/2024"],
+            ai_montants=["1 234,56 EUR"],
+            created_at=created + timedelta(minutes=i),
+        )
+        for i in range(count)
+    ]
+
+
+def _timed(func, repeat: int):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        durations.append(time.perf_counter() - start)
+    return result, round(statistics.median(durations) * 1000, 2)
+
+
+def bench(count: int, repeat: int) -> dict:
+    documents = make_documents(count)
+    serializer = ModelSerializer(List[DocumentResponse])
+
+    def per_row():
+        models = [DocumentResponse.model_validate(doc) for doc in documents]
+        return json.dumps(jsonable_encoder(models)).encode()
+
+    methods = {"per_row": per_row, "adapter": lambda: serializer.dump(documents)}
+    if orjson is not None:
+        methods["adapter_orjson"] = lambda: orjson.dumps(
+            serializer.adapter.dump_python(serializer.validate(documents), mode="json")
+        )
+
+    report = {"documents": count, "serialize_ms": {}}
+    body = b""
+    for name, func in methods.items():
+        body, report["serialize_ms"][name] = _timed(func, repeat)
+
+    report["bytes"] = {"identity": len(body)}
+    report["compress_ms"] = {}
+    for encoding in available_encodings():
+        compressed, report["compress_ms"][encoding] = _timed(lambda: compress_body(body, encoding), repeat)
+        report["bytes"][encoding] = len(compressed)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(json.dumps([bench(count, args.repeat) for count in args.sizes], indent=2))
@@ -0,0 +1,101 @@
+"""
+Temps d'import de app.main et temps jusqu'à la première requête servie.
+
+    python benchmarks/bench_startup.py --runs 5
+
+Mesure, dans des processus neufs :
+- import_s : durée de `import app.main` (et modules lourds chargés à l'import) ;
+- first_request_s : lancement d'uvicorn jusqu'au premier 200 sur /health/live ;
+- ready_s : lancement jusqu'au premier 200 sur /health/ready (nécessite BDD et
+  MinIO joignables ; sinon reste à null après --ready-timeout secondes).
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), "..")
+HEAVY_MODULES = ("PIL", "pytesseract", "boto3", "botocore", "httpx")
+
+_IMPORT_SNIPPET = f"""
+import json, sys, time
+start = time.perf_counter()
+import app.main
+print(json.dumps({{
+    "import_s": time.perf_counter() - start,
+    "heavy_modules_loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure_import() -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", _IMPORT_SNIPPET],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(url: str, deadline: float):
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(url, timeout=0.5).status_code == 200:
+                return time.perf_counter()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.02)
+    return None
+
+
+def measure_server(ready_timeout: float) -> dict:
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        live = _wait_for(f"{base_url}/health/live", start + 30)
+        ready = _wait_for(f"{base_url}/health/ready", start + ready_timeout)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    return {
+        "first_request_s": round(live - start, 3) if live else None,
+        "ready_s": round(ready - start, 3) if ready else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ready-timeout", type=float, default=10.0)
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.runs)]
+    servers = [measure_server(args.ready_timeout) for _ in range(args.runs)]
+
+    def _median(values):
+        values = [v for v in values if v is not None]
+        return round(statistics.median(values), 3) if values else None
+
+    print(json.dumps({
+        "runs": args.runs,
+        "import_s_median": _median([r["import_s"] for r in imports]),
+        "heavy_modules_loaded": imports[-1]["heavy_modules_loaded"],
+        "first_request_s_median": _median([r["first_request_s"] for r in servers]),
+        "ready_s_median": _median([r["ready_s"] for r in servers]),
+    }, indent=2))
@@ -0,0 +1,128 @@
+"""
+Politique de stockage des originaux : place gagnée et effet sur les téléchargements.
+
+    python benchmarks/bench_storage.py --client-mbps 20 --storage-mbps 1000
+
+Sur des documents synthétiques (photo de téléphone en JPEG, scans PNG et
+TIFF non compressé, PDF textuel), mesure avec STORAGE_TRANSCODE_IMAGES=webp
+et STORAGE_COMPRESS_OTHER=true (app/services/storage_service.py) :
+- la taille stockée et le temps d'encodage (à l'upload, hors requête) ;
+- le temps de reconstitution au format d'origine ;
+- la latence de téléchargement estimée : lecture depuis MinIO
+  (--storage-mbps), conversion éventuelle, envoi au client (--client-mbps),
+  avant transcodage, avec ?format=stored et avec ?format=original.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.setdefault("STORAGE_TRANSCODE_IMAGES", "webp")
+os.environ.setdefault("STORAGE_COMPRESS_OTHER", "true")
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from app.services.storage_service import decode_original, encode_for_storage
+
+
+def _page(size, seed=0) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    image = Image.new("L", size, 240)
+    draw = ImageDraw.Draw(image)
+    line = max(size[1] // 120, 12)
+    for y in range(size[1] // 12, size[1] - size[1] // 12, line * 2):
+        x = size[0] // 12
+        while x < size[0] - size[0] // 6:
+            width = int(rng.integers(line * 2, line * 8))
+            draw.rectangle((x, y, x + width, y + line), fill=int(rng.integers(0, 60)))
+            x += width + line
+    return image
+
+
+def _photo(size=(3024, 4032)) -> bytes:
+    """Photo d'une page : éclairage non uniforme et bruit du capteur, JPEG qualité 92."""
+    page = np.asarray(_page(size, seed=1), dtype=np.float32)
+    shade = np.linspace(0.75, 1.05, size[0])[None, :] * np.linspace(0.9, 1.0, size[1])[:, None]
+    noise = np.random.default_rng(2).normal(0, 4, page.shape)
+    gray = np.clip(page * shade + noise, 0, 255)
+    rgb = np.stack([gray, gray * 0.97, gray * 0.92], axis=-1).astype(np.uint8)
+    return _save(Image.fromarray(rgb), "JPEG", quality=92)
+
+
+def _save(image: Image.Image, format: str, **options) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **options)
+    return buffer.getvalue()
+
+
+def samples():
+    scan = _page((2480, 3508), seed=3)
+    pdf = b"%PDF-1.4\n" + b"".join(
+        f"BT /F1 11 Tf 72 {700 - i % 60 * 11} Td (Ligne {i} de l'avis d'imposition 2024) Tj ET\n".encode()
+        for i in range(6000)
+    )
+    return {
+        "photo_jpeg": (_photo(), "image/jpeg"),
+        "scan_png": (_save(scan, "PNG"), "image/png"),
+        "scan_tiff": (_save(scan, "TIFF"), "image/tiff"),
+        "pdf": (pdf, "application/pdf"),
+    }
+
+
+def _timed(func, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def bench(name, content, content_type, args):
+    (stored, stored_format, metadata), encode_s = _timed(lambda: encode_for_storage(content, content_type), args.repeat)
+    restored, decode_s = _timed(lambda: decode_original(stored, stored_format, metadata), args.repeat)
+
+    def transfer(size, mbps):
+        return size * 8 / (mbps * 1e6)
+
+    def ms(seconds):
+        return round(seconds * 1000, 1)
+
+    return {
+        "document": name,
+        "stored_format": stored_format,
+        "original_bytes": len(content),
+        "stored_bytes": len(stored),
+        "saved_ratio": round(1 - len(stored) / len(content), 3),
+        "encode_ms": ms(encode_s),
+        "decode_ms": ms(decode_s),
+        "download_ms": {
+            "before": ms(transfer(len(content), args.storage_mbps) + transfer(len(content), args.client_mbps)),
+            "stored": ms(transfer(len(stored), args.storage_mbps) + transfer(len(stored), args.client_mbps)),
+            "original": ms(
+                transfer(len(stored), args.storage_mbps) + decode_s + transfer(len(restored), args.client_mbps)
+            ),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--client-mbps", type=float, default=20, help="Débit du client (Mbit/s)")
+    parser.add_argument("--storage-mbps", type=float, default=1000, help="Débit API <-> MinIO (Mbit/s)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    results = [bench(name, content, content_type, args) for name, (content, content_type) in samples().items()]
+    original = sum(result["original_bytes"] for result in results)
+    stored = sum(result["stored_bytes"] for result in results)
+    print(json.dumps({
+        "documents": results,
+        "total": {"original_bytes": original, "stored_bytes": stored, "saved_ratio": round(1 - stored / original, 3)},
+    }, indent=2))
@@ -0,0 +1,131 @@
+"""
+Tiering chaud/froid : taille et listage du bucket chaud avant/après, coût d'une lecture froide.
+
+    DATABASE_URL=postgresql+asyncpg://... python benchmarks/bench_tiering.py \
+        --documents 10000 --cold-ratio 0.8 --s3-latency-ms 20
+
+Crée un utilisateur jetable et --documents documents (originaux de taille
+--file-kb dans un S3 en mémoire dont chaque appel coûte --s3-latency-ms),
+dont --cold-ratio non consultés depuis plus de TIERING_COLD_AFTER_DAYS.
+Mesure le bucket chaud (objets, octets, pages et durée d'un listage complet),
+lance l'archivage (app/services/tiering_service.py), mesure à nouveau, puis
+compare la lecture d'un original chaud, froid (Range dans son paquet) et
+restauré. L'utilisateur et ses documents sont supprimés à la fin.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import delete, insert
+from sqlalchemy.future import select
+
+from app.core.database import init_db, new_session
+from app.core.resources import resources
+from app.models.base_models import ArchiveBundle, Document, User
+from app.services import tiering_service
+from app.services.storage_service import BUCKET_NAME, STORAGE_ENDPOINT, iter_file_chunks, measure_bucket
+from loadtest.fakes import FakeS3Client
+
+
+async def _populate(user_id: str, count: int, cold_ratio: float, file_kb: int, s3: FakeS3Client):
+    now = datetime.utcnow()
+    old = now - timedelta(days=tiering_service.TIERING_COLD_AFTER_DAYS + 60)
+    body = os.urandom(file_kb * 1024)
+    rows = []
+    for index in range(count):
+        key = f"documents/{user_id}/{uuid.uuid4()}.png"
+        s3.objects[f"{BUCKET_NAME}/{key}"] = body
+        cold = index < count * cold_ratio
+        rows.append({
+            "owner_id": user_id, "file_name": f"scan_{index}.png", "content_type": "image/png",
+            "file_url": f"{STORAGE_ENDPOINT}/{BUCKET_NAME}/{key}", "file_size": len(body),
+            "raw_text": "texte", "created_at": old if cold else now,
+        })
+    async with new_session() as session:
+        session.add(User(id=user_id, email=f"{user_id}@bench.aideo"))
+        await session.flush()
+        for start in range(0, len(rows), 1000):
+            await session.execute(insert(Document), rows[start:start + 1000])
+        await session.commit()
+
+
+async def _read(document_id: int) -> float:
+    async with new_session() as session:
+        row = (
+            await session.execute(
+                select(Document.file_url, Document.storage_tier).filter(Document.id == document_id)
+            )
+        ).first()
+    start = time.perf_counter()
+    stored = await tiering_service.open_document_file(document_id, row.file_url, row.storage_tier)
+    async for _ in iter_file_chunks(stored["Body"]):
+        pass
+    return (time.perf_counter() - start) * 1000
+
+
+async def _read_ms(document_ids) -> float:
+    return round(statistics.median([await _read(document_id) for document_id in document_ids]), 1)
+
+
+async def main(args) -> dict:
+    resources._s3_client = s3 = FakeS3Client(latency_ms=args.s3_latency_ms)
+    await init_db()
+    user_id = f"bench-tiering-{uuid.uuid4().hex[:8]}"
+    try:
+        await _populate(user_id, args.documents, args.cold_ratio, args.file_kb, s3)
+        before = await measure_bucket()
+
+        start = time.perf_counter()
+        archive = await tiering_service.archive_cold_documents()
+        archive_seconds = time.perf_counter() - start
+        after = await measure_bucket()
+
+        async with new_session() as session:
+            ids = (
+                await session.execute(
+                    select(Document.id, Document.storage_tier).filter(Document.owner_id == user_id).order_by(Document.id)
+                )
+            ).all()
+        cold_ids = [row.id for row in ids if row.storage_tier == tiering_service.COLD][:args.samples]
+        hot_ids = [row.id for row in ids if row.storage_tier is None][:args.samples]
+        reads = {"hot_ms": await _read_ms(hot_ids), "cold_ms": await _read_ms(cold_ids)}
+        start = time.perf_counter()
+        outcomes = [await tiering_service.restore_document(document_id) for document_id in cold_ids]
+        reads["restore_ms"] = round((time.perf_counter() - start) * 1000 / max(len(cold_ids), 1), 1)
+        reads["restored"] = outcomes.count("restored")
+        reads["after_restore_ms"] = await _read_ms(cold_ids)
+
+        return {
+            "documents": args.documents,
+            "cold_ratio": args.cold_ratio,
+            "s3_latency_ms": args.s3_latency_ms,
+            "hot_before": before,
+            "hot_after": after,
+            "archive": {**archive, "seconds": round(archive_seconds, 2)},
+            "reads": reads,
+        }
+    finally:
+        async with new_session() as session:
+            await session.execute(delete(Document).where(Document.owner_id == user_id))
+            await session.execute(delete(ArchiveBundle).where(ArchiveBundle.owner_id == user_id))
+            await session.execute(delete(User).where(User.id == user_id))
+            await session.commit()
+        await resources.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=10000)
+    parser.add_argument("--cold-ratio", type=float, default=0.8)
+    parser.add_argument("--file-kb", type=int, default=16)
+    parser.add_argument("--s3-latency-ms", type=float, default=20, help="Latence de chaque appel S3 (page de listage comprise)")
+    parser.add_argument("--samples", type=int, default=20, help="Lectures mesurées par tier")
+    print(json.dumps(asyncio.run(main(parser.parse_args())), indent=2, default=str))
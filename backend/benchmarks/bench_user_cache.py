@@ -0,0 +1,78 @@
+"""
+Mesure le débit (requêtes/s) de GET /documents/{id} avec et sans cache utilisateur.
+
+Lancer l'API deux fois, une fois avec USER_CACHE_TTL=0 (cache désactivé), une fois
+avec la valeur par défaut, puis dans chaque cas :
+
+    python benchmarks/bench_user_cache.py --token <jwt> --document-id 1 \
+        --admin-token <ADMIN_API_TOKEN> --concurrency 32 --duration 20
+
+Le script affiche un résumé JSON (débit, latences, taux de succès du cache côté serveur).
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+
+async def _worker(client: httpx.AsyncClient, url: str, headers: dict, deadline: float, latencies: list, errors: list):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await client.get(url, headers=headers)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(args) -> dict:
+    url = f"{args.base_url}/api/v1/documents/{args.document_id}"
+    headers = {"Authorization": f"Bearer {args.token}"}
+    latencies, errors = [], []
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        # Échauffement : remplit le cache et ouvre les connexions
+        await client.get(url, headers=headers)
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(*[
+            _worker(client, url, headers, deadline, latencies, errors)
+            for _ in range(args.concurrency)
+        ])
+
+        cache_stats = None
+        if args.admin_token:
+            response = await client.get(
+                f"{args.base_url}/api/v1/system/user-cache",
+                headers={"X-Admin-Token": args.admin_token},
+            )
+            cache_stats = response.json() if response.status_code == 200 else None
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_second": round(len(latencies) / args.duration, 1),
+        "latency_ms": {
+            "p50": round(statistics.median(latencies) * 1000, 2),
+            "p95": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+            "p99": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        },
+        "server_user_cache": cache_stats,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--token", required=True, help="JWT d'un utilisateur propriétaire du document")
+    parser.add_argument("--document-id", type=int, required=True)
+    parser.add_argument("--admin-token", help="ADMIN_API_TOKEN pour lire les statistiques du cache")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0)
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
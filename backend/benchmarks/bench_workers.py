@@ -0,0 +1,141 @@
+"""
+Débit en fonction du nombre de workers gunicorn (gunicorn.conf.py).
+
+    python benchmarks/bench_workers.py --workers 1 2 4 8 --duration 15
+    python benchmarks/bench_workers.py --path /api/v1/documents/1 \
+        --header "Authorization: Bearer <jwt>" --workers 1 2 4
+
+Pour chaque nombre de workers : lance gunicorn sur un port libre, attend
+/health/live, puis envoie des requêtes depuis --clients processus (chacun avec
+--concurrency requêtes simultanées) pendant --duration secondes. Le générateur
+de charge tourne dans plusieurs processus pour ne pas être lui-même le goulot.
+Affiche un résumé JSON : débit, latences p50/p95/p99, accélération relative.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), "..")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(int(len(values) * fraction), len(values) - 1)] * 1000, 2)
+
+
+async def _client_loop(url, headers, concurrency, duration):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(headers=headers, limits=limits, timeout=30) as client:
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    if response.status_code >= 400:
+                        errors += 1
+                        continue
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return latencies, errors
+
+
+def _client_process(args):
+    return asyncio.run(_client_loop(*args))
+
+
+def run_load(url, headers, clients, concurrency, duration) -> dict:
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.map(_client_process, [(url, headers, concurrency, duration)] * clients)
+    latencies = [latency for result in results for latency in result[0]]
+    return {
+        "requests": len(latencies),
+        "errors": sum(result[1] for result in results),
+        "rps": round(len(latencies) / duration, 1),
+        "p50_ms": _percentile(latencies, 0.50),
+        "p95_ms": _percentile(latencies, 0.95),
+        "p99_ms": _percentile(latencies, 0.99),
+    }
+
+
+def _wait_live(base_url, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(f"{base_url}/health/live", timeout=0.5).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    return False
+
+
+def bench_workers(workers, args, headers) -> dict:
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(
+        os.environ,
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_BIND=f"127.0.0.1:{port}",
+        GUNICORN_ACCESS_LOG="/dev/null",
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app.main:app"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        if not _wait_live(base_url):
+            return {"workers": workers, "error": "serveur non démarré"}
+        # Échauffement : chaque worker crée ses clients au premier usage
+        run_load(base_url + args.path, headers, args.clients, args.concurrency, 2)
+        result = run_load(base_url + args.path, headers, args.clients, args.concurrency, args.duration)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+    return {"workers": workers, **result}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--path", default="/health/live")
+    parser.add_argument("--header", action="append", default=[], help='"Nom: valeur" (répétable)')
+    parser.add_argument("--clients", type=int, default=4, help="Processus générateurs de charge")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requêtes simultanées par processus")
+    parser.add_argument("--duration", type=float, default=15)
+    args = parser.parse_args()
+
+    headers = dict(header.split(":", 1) for header in args.header)
+    headers = {name.strip(): value.strip() for name, value in headers.items()}
+
+    results = [bench_workers(workers, args, headers) for workers in args.workers]
+    baseline = next((r["rps"] for r in results if r.get("rps")), None)
+    for result in results:
+        if baseline and result.get("rps"):
+            result["speedup"] = round(result["rps"] / baseline, 2)
+    print(json.dumps({"path": args.path, "cpu_count": os.cpu_count(), "results": results}, indent=2))
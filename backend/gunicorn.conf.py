@@ -0,0 +1,41 @@
+# backend/gunicorn.conf.py
+# Point d'entrée de production : plusieurs workers uvicorn sous gunicorn.
+#
+#     gunicorn -c gunicorn.conf.py app.main:app
+#
+# Chaque worker est un processus distinct avec sa propre boucle d'événements,
+# son moteur SQLAlchemy, son client S3 et son client HTTP : ils sont créés au
+# premier usage APRÈS le fork (app/core/resources.py), jamais hérités du maître.
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+# Par défaut, un worker par cœur (l'OCR et la validation sont liés au CPU)
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "app.core.workers.AideoUvicornWorker"
+
+# Arrêt gracieux : un scan (OCR + LLM) peut durer plus d'une minute
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 120))
+# Worker bloqué plus longtemps que cela : redémarré par le maître
+timeout = int(os.getenv("WORKER_TIMEOUT", 180))
+keepalive = int(os.getenv("KEEPALIVE", 5))
+
+# Recyclage périodique des workers (fuites mémoire de Tesseract / PIL)
+max_requests = int(os.getenv("MAX_REQUESTS", 0))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", 0))
+
+# Pas de préchargement : l'application est importée dans chaque worker.
+# Avec GUNICORN_PRELOAD=true l'import est partagé (démarrage plus rapide) et
+# les ressources sont réinitialisées après le fork (os.register_at_fork).
+preload_app = os.getenv("GUNICORN_PRELOAD", "false").lower() in ("1", "true", "yes")
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    server.log.info(f"Worker {worker.pid} démarré")
+
+
+def worker_exit(server, worker):
+    server.log.info(f"Worker {worker.pid} arrêté")
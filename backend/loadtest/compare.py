@@ -0,0 +1,76 @@
+"""
+Compare deux résultats de loadtest.run et signale les régressions.
+
+    python -m loadtest.compare loadtest/results/avant.json loadtest/results/apres.json --threshold 10
+
+Pour chaque route : débit (baisse = régression), latences p50/p95/p99
+(hausse = régression) et taux d'erreur. Code de sortie 1 si une régression
+dépasse --threshold pour cent.
+"""
+import argparse
+import json
+import sys
+
+LATENCY_KEYS = ("p50", "p95", "p99")
+
+
+def _change(before, after):
+    if not before:
+        return None
+    return round((after - before) / before * 100, 1)
+
+
+def compare(before: dict, after: dict, threshold: float) -> list:
+    rows = []
+    for name in sorted(set(before["endpoints"]) & set(after["endpoints"])):
+        old, new = before["endpoints"][name], after["endpoints"][name]
+        metrics = [("rps", old["rps"], new["rps"], -1)]
+        for key in LATENCY_KEYS:
+            if key in old.get("latency_ms", {}) and key in new.get("latency_ms", {}):
+                metrics.append((f"{key}_ms", old["latency_ms"][key], new["latency_ms"][key], 1))
+        old_error_rate = old["errors"] / old["requests"] * 100 if old["requests"] else 0
+        new_error_rate = new["errors"] / new["requests"] * 100 if new["requests"] else 0
+
+        for metric, old_value, new_value, direction in metrics:
+            change = _change(old_value, new_value)
+            regression = change is not None and change * direction > threshold
+            rows.append((name, metric, old_value, new_value, change, regression))
+        rows.append((
+            name, "erreurs_%", round(old_error_rate, 2), round(new_error_rate, 2), None,
+            new_error_rate - old_error_rate > 1,
+        ))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10, help="Écart toléré, en pour cent")
+    parser.add_argument("--json", action="store_true", help="Sortie JSON")
+    args = parser.parse_args()
+
+    with open(args.before) as handle:
+        before = json.load(handle)
+    with open(args.after) as handle:
+        after = json.load(handle)
+
+    rows = compare(before, after, args.threshold)
+    regressions = [row for row in rows if row[-1]]
+    if args.json:
+        print(json.dumps([
+            dict(zip(("route", "metric", "before", "after", "change_pct", "regression"), row))
+            for row in rows
+        ], indent=2))
+    else:
+        print(f"{before['meta']['git_revision']} -> {after['meta']['git_revision']} (seuil {args.threshold}%)")
+        print(f"{'route':<8} {'mesure':<10} {'avant':>10} {'après':>10} {'écart %':>9}")
+        for name, metric, old_value, new_value, change, regression in rows:
+            flag = "  RÉGRESSION" if regression else ""
+            change_text = "-" if change is None else f"{change:+}"
+            print(f"{name:<8} {metric:<10} {old_value:>10} {new_value:>10} {change_text:>9}{flag}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
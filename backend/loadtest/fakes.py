@@ -0,0 +1,179 @@
+"""
+Remplaçants locaux des services externes pour les tests de charge.
+
+- FakeS3Client : stockage S3 en mémoire (sous-ensemble de l'API boto3 utilisé
+  par app/services/storage_service.py), avec une latence optionnelle.
+- FakeOllamaTransport : transport httpx qui répond comme /api/generate
+  d'Ollama, avec une latence de base et un débit de jetons configurables.
+- fake_tesseract : module de remplacement de pytesseract (si Tesseract n'est
+  pas installé), avec un coût CPU configurable.
+
+Ils sont injectés dans le conteneur de ressources (app/core/resources.py) :
+le reste de l'application (routes, services, BDD) est le code réel.
+"""
+import asyncio
+import io
+import json
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+import httpx
+
+
+class _ClientError(Exception):
+    """Équivalent minimal de botocore.exceptions.ClientError."""
+
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": 404}}
+
+
+def _not_found(operation: str) -> Exception:
+    """Erreur « clé absente » telle que la lève boto3 (celle que storage_service intercepte), si botocore est installé."""
+    try:
+        from botocore.exceptions import ClientError
+    except ImportError:
+        return _ClientError("NoSuchKey")
+    return ClientError({"Error": {"Code": "NoSuchKey"}, "ResponseMetadata": {"HTTPStatusCode": 404}}, operation)
+
+
+class FakeS3Client:
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+        self.objects: Dict[str, bytes] = {}
+        self.metadata: Dict[str, Dict[str, str]] = {}
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _call(self, name: str):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def head_bucket(self, Bucket):
+        self._call("head_bucket")
+        return {}
+
+    def create_bucket(self, Bucket):
+        self._call("create_bucket")
+        return {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self._call("put_object")
+        data = Body if isinstance(Body, bytes) else Body.read()
+        with self._lock:
+            self.objects[f"{Bucket}/{Key}"] = data
+            self.metadata[f"{Bucket}/{Key}"] = dict(kwargs.get("Metadata") or {})
+        return {"ETag": '"fake"'}
+
+    def get_object(self, Bucket, Key, Range: Optional[str] = None, **kwargs):
+        self._call("get_object")
+        data = self.objects.get(f"{Bucket}/{Key}")
+        if data is None:
+            raise _not_found("GetObject")
+        response = {"ContentLength": len(data), "Metadata": dict(self.metadata.get(f"{Bucket}/{Key}", {}))}
+        if Range:
+            start, end = (int(value) for value in Range[len("bytes="):].split("-"))
+            end = min(end, len(data) - 1)
+            response["ContentRange"] = f"bytes {start}-{end}/{len(data)}"
+            data = data[start:end + 1]
+            response["ContentLength"] = len(data)
+        response["Body"] = io.BytesIO(data)
+        return response
+
+    def delete_object(self, Bucket, Key):
+        self._call("delete_object")
+        with self._lock:
+            self.objects.pop(f"{Bucket}/{Key}", None)
+            self.metadata.pop(f"{Bucket}/{Key}", None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete):
+        self._call("delete_objects")
+        with self._lock:
+            for item in Delete["Objects"]:
+                self.objects.pop(f"{Bucket}/{item['Key']}", None)
+                self.metadata.pop(f"{Bucket}/{item['Key']}", None)
+        return {"Deleted": Delete["Objects"], "Errors": []}
+
+    def list_objects_v2(self, Bucket, Prefix="", MaxKeys=1000, ContinuationToken=None, **kwargs):
+        """Pages de MaxKeys clés triées ; la latence s'applique à chaque page, comme un aller-retour réel."""
+        self._call("list_objects_v2")
+        prefix = f"{Bucket}/{Prefix}"
+        with self._lock:
+            keys = sorted(key for key in self.objects if key.startswith(prefix))
+            start = int(ContinuationToken or 0)
+            page = [
+                {"Key": key[len(Bucket) + 1:], "Size": len(self.objects[key])}
+                for key in keys[start:start + MaxKeys]
+            ]
+        response = {"Contents": page, "KeyCount": len(page), "IsTruncated": start + MaxKeys < len(keys)}
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = str(start + MaxKeys)
+        return response
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn=3600):
+        return f"http://fake-s3/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+    def close(self):
+        pass
+
+
+FAKE_ANALYSIS = {
+    "type": "facture",
+    "resume": "Facture d'électricité du mois. Paiement par prélèvement.",
+    "actions": ["Vérifier le prélèvement"],
+    "dates": ["2025-01-31"],
+    "montants": ["84,20 EUR"],
+}
+
+
+class FakeOllamaTransport(httpx.AsyncBaseTransport):
+    """
+    Simule POST /api/generate : attend latency_ms + tokens / tokens_per_s,
+    puis renvoie une analyse JSON fixe. Le nombre de jetons générés est
+    options.num_predict (200 par défaut, comme dans ai_service).
+    """
+
+    def __init__(self, latency_ms: float = 200.0, tokens_per_s: float = 50.0, error_rate: float = 0.0):
+        self.latency = latency_ms / 1000
+        self.tokens_per_s = tokens_per_s
+        self.error_rate = error_rate
+        self.requests = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        payload = json.loads(request.content or b"{}")
+        tokens = payload.get("options", {}).get("num_predict", 200)
+        delay = self.latency + (tokens / self.tokens_per_s if self.tokens_per_s > 0 else 0)
+        await asyncio.sleep(delay)
+
+        if self.error_rate and (self.requests % max(int(1 / self.error_rate), 1) == 0):
+            return httpx.Response(500, json={"error": "erreur simulée"}, request=request)
+        return httpx.Response(
+            200,
+            json={"model": payload.get("model"), "response": json.dumps(FAKE_ANALYSIS), "done": True},
+            request=request,
+        )
+
+
+def fake_tesseract(cpu_ms: float = 50.0):
+    """Module imitant pytesseract : occupe le CPU cpu_ms puis renvoie un texte fixe."""
+
+    class TesseractNotFoundError(Exception):
+        pass
+
+    def image_to_string(image, lang=None):
+        deadline = time.perf_counter() + cpu_ms / 1000
+        while time.perf_counter() < deadline:
+            sum(range(1000))
+        return "FACTURE\nMontant TTC : 84,20 EUR\nDate limite : 31/01/2025\n"
+
+    return SimpleNamespace(
+        image_to_string=image_to_string,
+        TesseractNotFoundError=TesseractNotFoundError,
+        pytesseract=SimpleNamespace(tesseract_cmd=None),
+    )
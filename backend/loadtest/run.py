@@ -0,0 +1,366 @@
+"""
+Test de charge de bout en bout : l'application réelle (uvicorn, routes,
+services, Postgres) face à des remplaçants locaux de S3, d'Ollama et, si
+Tesseract est absent, de l'OCR (voir loadtest/fakes.py).
+
+    cd backend
+    python -m loadtest.run --duration 60 --concurrency 32 \
+        --mix scan=1,list=3,detail=5,login=1 --llm-latency-ms 300 --llm-tokens-per-s 40
+
+Déroulé : Postgres jetable (loadtest/postgres.py), démarrage d'uvicorn dans
+ce processus, création des utilisateurs et des documents de départ, période
+d'échauffement, puis charge mixte pendant --duration secondes.
+
+Le résultat (JSON) donne, par route : débit, erreurs, latences p50/p90/p95/p99,
+ainsi que la durée moyenne de chaque étape du scan côté serveur. Il est écrit
+dans --out (par défaut loadtest/results/<date>.json) ; deux résultats se
+comparent avec `python -m loadtest.compare`.
+
+Le générateur de charge partage le processus (et le CPU) du serveur : les
+chiffres servent à comparer deux versions sur la même machine, pas à
+dimensionner la production.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+OPERATIONS = ("scan", "list", "detail", "login")
+LOADTEST_PASSWORD = "ChargeTest123!"
+
+SEED_TEXT = (
+    "REPUBLIQUE FRANCAISE - Avis d'imposition. Montant à payer : 1 234,56 EUR. "
+    "Date limite de paiement : 15/09/2025. "
+) * 20
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Opération inconnue : {name} (attendu : {OPERATIONS})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "inconnue"
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(int(len(sorted_values) * fraction), len(sorted_values) - 1)
+    return round(sorted_values[index] * 1000, 2)
+
+
+def summarize(latencies: List[float], statuses: Dict[str, int], errors: int, duration: float) -> dict:
+    values = sorted(latencies)
+    summary = {
+        "requests": len(values) + errors,
+        "ok": len(values),
+        "errors": errors,
+        "statuses": statuses,
+        "rps": round(len(values) / duration, 2),
+    }
+    if values:
+        summary["latency_ms"] = {
+            "mean": round(sum(values) / len(values) * 1000, 2),
+            "p50": _percentile(values, 0.50),
+            "p90": _percentile(values, 0.90),
+            "p95": _percentile(values, 0.95),
+            "p99": _percentile(values, 0.99),
+            "max": round(values[-1] * 1000, 2),
+        }
+    return summary
+
+
+def make_scan_image(width: int, height: int) -> bytes:
+    """Image PNG d'un faux document (texte noir sur fond blanc)."""
+    from PIL import Image, ImageDraw
+
+    image = Image.new("L", (width, height), color=255)
+    draw = ImageDraw.Draw(image)
+    for line, y in enumerate(range(40, height - 40, 30)):
+        draw.text((40, y), f"Ligne {line} - Facture EDF - Montant : 84,20 EUR - Echeance 31/01/2025", fill=0)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {name: [] for name in OPERATIONS}
+        self.statuses: Dict[str, Dict[str, int]] = {name: {} for name in OPERATIONS}
+        self.errors: Dict[str, int] = {name: 0 for name in OPERATIONS}
+        self.recording = False
+
+    def record(self, operation: str, status: str, latency: float, ok: bool):
+        if not self.recording:
+            return
+        self.statuses[operation][status] = self.statuses[operation].get(status, 0) + 1
+        if ok:
+            self.latencies[operation].append(latency)
+        else:
+            self.errors[operation] += 1
+
+
+async def _setup_users(client, count: int) -> List[dict]:
+    users = []
+    for index in range(count):
+        email = f"charge_{index}_{int(time.time())}@aideo.com"
+        response = await client.post("/api/v1/auth/register", json={"email": email, "password": LOADTEST_PASSWORD})
+        response.raise_for_status()
+        response = await client.post("/api/v1/auth/login", data={"username": email, "password": LOADTEST_PASSWORD})
+        response.raise_for_status()
+        users.append({
+            "id": None,
+            "email": email,
+            "headers": {"Authorization": f"Bearer {response.json()['access_token']}"},
+        })
+    return users
+
+
+async def _seed_documents(users: List[dict], per_user: int):
+    """Documents de départ insérés directement en base (listes et détails non vides)."""
+    from sqlalchemy.future import select
+
+    from app.core.database import new_session
+    from app.models.base_models import Document, User
+
+    async with new_session() as session:
+        for user in users:
+            user["id"] = (
+                await session.execute(select(User.id).filter(User.email == user["email"]))
+            ).scalar_one()
+            documents = [
+                Document(
+                    owner_id=user["id"],
+                    file_name=f"seed_{index}.png",
+                    content_type="image/png",
+                    raw_text=SEED_TEXT,
+                    ai_type="impôts",
+                    ai_resume="Avis d'imposition.",
+                    ai_actions=["Payer"],
+                    ai_dates=["2025-09-15"],
+                    ai_montants=["1 234,56 EUR"],
+                )
+                for index in range(per_user)
+            ]
+            session.add_all(documents)
+            await session.flush()
+            user["document_ids"] = [document.id for document in documents]
+        await session.commit()
+
+
+async def _virtual_user(client, user: dict, mix: Dict[str, float], image: bytes, recorder: Recorder, stop: asyncio.Event):
+    operations, weights = zip(*mix.items())
+    while not stop.is_set():
+        operation = random.choices(operations, weights)[0]
+        start = time.perf_counter()
+        try:
+            if operation == "scan":
+                response = await client.post(
+                    "/api/v1/documents/scan", headers=user["headers"],
+                    files={"file": ("charge.png", image, "image/png")},
+                )
+            elif operation == "list":
+                response = await client.get("/api/v1/documents/", headers=user["headers"])
+            elif operation == "detail":
+                document_id = random.choice(user["document_ids"])
+                response = await client.get(f"/api/v1/documents/{document_id}", headers=user["headers"])
+            else:
+                response = await client.post(
+                    "/api/v1/auth/login", data={"username": user["email"], "password": LOADTEST_PASSWORD},
+                )
+        except Exception as e:
+            recorder.record(operation, type(e).__name__, time.perf_counter() - start, ok=False)
+            continue
+        recorder.record(operation, str(response.status_code), time.perf_counter() - start, ok=response.status_code < 400)
+
+
+def _stage_means() -> Dict[str, float]:
+    from app.core.metrics import PIPELINE_STAGE_SECONDS
+
+    totals: Dict[str, List[float]] = {}
+    with PIPELINE_STAGE_SECONDS._lock:
+        items = [(key, list(state)) for key, state in PIPELINE_STAGE_SECONDS._values.items()]
+    for key, state in items:
+        stage = key[PIPELINE_STAGE_SECONDS.labelnames.index("stage")]
+        total = totals.setdefault(stage, [0.0, 0.0])
+        total[0] += state[-2]
+        total[1] += state[-1]
+    return {stage: round(seconds / count * 1000, 2) for stage, (seconds, count) in totals.items() if count}
+
+
+async def run_load(args) -> dict:
+    import httpx
+    import uvicorn
+
+    from app.core.resources import resources
+    from app.main import app
+    from app.services import ai_service, ocr_service
+    from loadtest.fakes import FakeOllamaTransport, FakeS3Client, fake_tesseract
+
+    # Remplaçants injectés avant le démarrage (le conteneur ne les recrée pas)
+    fake_s3 = FakeS3Client(latency_ms=args.s3_latency_ms)
+    fake_ollama = FakeOllamaTransport(
+        latency_ms=args.llm_latency_ms, tokens_per_s=args.llm_tokens_per_s, error_rate=args.llm_error_rate,
+    )
+    resources._s3_client = fake_s3
+    resources._http_client = httpx.AsyncClient(transport=fake_ollama, timeout=ai_service.AI_TIMEOUT)
+    ocr_mode = args.ocr
+    if ocr_mode == "auto":
+        ocr_mode = "real" if os.path.exists("/usr/bin/tesseract") else "fake"
+    if ocr_mode == "fake":
+        ocr_service._pytesseract = fake_tesseract(cpu_ms=args.ocr_cpu_ms)
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    base_url = f"http://127.0.0.1:{port}"
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    try:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.request_timeout) as client:
+            deadline = time.monotonic() + 60
+            while True:
+                try:
+                    if (await client.get("/health/ready")).status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                if time.monotonic() > deadline or server_task.done():
+                    raise RuntimeError("L'application n'est pas prête (voir /health/ready).")
+                await asyncio.sleep(0.2)
+
+            users = await _setup_users(client, args.users)
+            await _seed_documents(users, args.seed_documents)
+            image = make_scan_image(args.image_width, args.image_height)
+
+            recorder = Recorder()
+            stop = asyncio.Event()
+            virtual_users = [
+                asyncio.create_task(
+                    _virtual_user(client, users[index % len(users)], args.mix, image, recorder, stop)
+                )
+                for index in range(args.concurrency)
+            ]
+            print(f"Échauffement {args.warmup}s, puis charge {args.duration}s ({args.concurrency} utilisateurs virtuels)...")
+            await asyncio.sleep(args.warmup)
+            recorder.recording = True
+            started = time.perf_counter()
+            await asyncio.sleep(args.duration)
+            recorder.recording = False
+            elapsed = time.perf_counter() - started
+            stop.set()
+            await asyncio.gather(*virtual_users)
+    finally:
+        server.should_exit = True
+        await server_task
+
+    endpoints = {
+        operation: summarize(recorder.latencies[operation], recorder.statuses[operation], recorder.errors[operation], elapsed)
+        for operation in args.mix
+    }
+    all_latencies = [latency for operation in args.mix for latency in recorder.latencies[operation]]
+    return {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "ocr": ocr_mode,
+            "config": {key: value for key, value in vars(args).items() if key not in ("out", "database_url")},
+        },
+        "duration_s": round(elapsed, 2),
+        "total": summarize(all_latencies, {}, sum(recorder.errors[op] for op in args.mix), elapsed),
+        "endpoints": endpoints,
+        "scan_stages_mean_ms": _stage_means(),
+        "stand_ins": {"llm_requests": fake_ollama.requests, "s3_calls": fake_s3.calls},
+    }
+
+
+def print_summary(result: dict):
+    print(f"\n{'route':<8} {'req/s':>8} {'erreurs':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, endpoint in list(result["endpoints"].items()) + [("total", result["total"])]:
+        latency = endpoint.get("latency_ms", {})
+        print(
+            f"{name:<8} {endpoint['rps']:>8} {endpoint['errors']:>8} "
+            f"{latency.get('p50', '-'):>9} {latency.get('p95', '-'):>9} {latency.get('p99', '-'):>9}"
+        )
+    if result["scan_stages_mean_ms"]:
+        print("Étapes du scan (moyenne, ms) :", result["scan_stages_mean_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=16, help="Utilisateurs virtuels")
+    parser.add_argument("--users", type=int, default=4, help="Comptes créés (partagés par les utilisateurs virtuels)")
+    parser.add_argument("--seed-documents", type=int, default=50, help="Documents de départ par compte")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("scan=1,list=3,detail=5,login=1"))
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--llm-tokens-per-s", type=float, default=50)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--s3-latency-ms", type=float, default=5)
+    parser.add_argument("--ocr", choices=("auto", "real", "fake"), default="auto",
+                        help="fake : pas de Tesseract, coût CPU simulé (--ocr-cpu-ms)")
+    parser.add_argument("--ocr-cpu-ms", type=float, default=50)
+    parser.add_argument("--image-width", type=int, default=1240)
+    parser.add_argument("--image-height", type=int, default=1754)
+    parser.add_argument("--request-timeout", type=float, default=120)
+    parser.add_argument("--rate-limit", action="store_true", help="Garder les quotas par utilisateur actifs")
+    parser.add_argument("--database-url", help="Postgres existant (sinon base jetable)")
+    parser.add_argument("--out", help="Fichier de résultat JSON")
+    args = parser.parse_args()
+
+    from loadtest.postgres import disposable_postgres
+
+    with disposable_postgres(args.database_url) as database_url:
+        # Configuration lue à l'import de l'application : à poser avant
+        os.environ["DATABASE_URL"] = database_url
+        os.environ.pop("TESTING", None)
+        if not args.rate_limit:
+            os.environ["RATE_LIMIT_ENABLED"] = "false"
+        # La réanalyse de fond consommerait le faux LLM entre deux scans
+        os.environ.setdefault("REANALYSIS_ENABLED", "false")
+        result = asyncio.run(run_load(args))
+
+    out = args.out or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as handle:
+        json.dump(result, handle, indent=2, ensure_ascii=False)
+    print_summary(result)
+    print(f"\nRésultat : {out}")
+    failed = result["total"]["requests"] and result["total"]["errors"] / result["total"]["requests"] > 0.5
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, BACKEND_DIR)
+    main()
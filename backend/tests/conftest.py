@@ -2,11 +2,17 @@
 
 import os
 import asyncio
+import uuid
 import pytest
+from types import SimpleNamespace
 from httpx import AsyncClient
 from app.main import app
-from app.core.database import get_db_session, engine, AsyncSessionLocal
-from app.models.base_models import Base
+from app.core.database import create_engine_from_env, get_db_session, get_engine, new_session
+from app.core.resources import resources
+from app.core.security import get_current_user_from_token
+from app.models.base_models import Base, Document, PendingFileDeletion, User
+from loadtest.fakes import FakeS3Client
+from sqlalchemy import delete
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import AsyncGenerator
 
@@ -20,7 +26,7 @@ async def db_test_session() -> AsyncGenerator[AsyncSession, None]:
     """
     Crée une session de base de données de test asynchrone pour les tests.
     """
-    async with AsyncSessionLocal() as session:
+    async with new_session() as session:
         yield session
 
 # Fixture de connexion au client API
@@ -52,13 +58,13 @@ async def setup_database(override_get_db_session):
     Crée et détruit la base de données de test et ses tables.
     """
     # SETUP: Création des tables dans la BDD de test
-    async with engine.begin() as conn:
+    async with get_engine().begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
     yield # Exécute les tests
 
     # TEARDOWN: Suppression des tables après les tests
-    async with engine.begin() as conn:
+    async with get_engine().begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
 
 # Fixture pour l'event loop (requis par pytest-asyncio)
@@ -68,4 +74,55 @@ def event_loop():
     policy = asyncio.get_event_loop_policy()
     loop = policy.new_event_loop()
     yield loop
-    loop.close()
\ No newline at end of file
+    loop.close()
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "db_pool(**options): options du pool du moteur de db_engine (pool_size...)")
+
+
+# Fixture de moteur propre au test : pytest-asyncio ouvre une boucle par test,
+# et les connexions d'un moteur ne peuvent pas changer de boucle
+@pytest.fixture
+async def db_engine(request, monkeypatch):
+    """
+    Moteur propre au test, utilisé par new_session() et par les routes (la
+    session partagée de override_get_db_session est retirée). Options du pool
+    par le marqueur : @pytest.mark.db_pool(pool_size=2, max_overflow=0).
+    """
+    marker = request.node.get_closest_marker("db_pool")
+    engine = create_engine_from_env(**(marker.kwargs if marker else {}))
+    monkeypatch.setattr(resources, "_engine", engine)
+    monkeypatch.setattr(resources, "_session_factory", None)
+    monkeypatch.delitem(app.dependency_overrides, get_db_session, raising=False)
+    yield engine
+    await engine.dispose()
+
+
+# Fixture de stockage S3 en mémoire
+@pytest.fixture
+def fake_s3(monkeypatch) -> FakeS3Client:
+    client = FakeS3Client()
+    monkeypatch.setattr(resources, "_s3_client", client)
+    return client
+
+
+# Fixture d'utilisateur jetable, authentifié pour les routes
+@pytest.fixture
+async def test_user(db_engine, monkeypatch) -> AsyncGenerator[str, None]:
+    """
+    Crée un utilisateur (id retourné) et le renvoie comme utilisateur courant
+    des routes. Ses documents et ses fichiers en attente de suppression sont
+    effacés à la fin du test.
+    """
+    user_id = f"test-{uuid.uuid4().hex[:8]}"
+    async with new_session() as session:
+        session.add(User(id=user_id, email=f"{user_id}@test.aideo"))
+        await session.commit()
+    monkeypatch.setitem(app.dependency_overrides, get_current_user_from_token, lambda: SimpleNamespace(id=user_id))
+    yield user_id
+    async with new_session() as session:
+        await session.execute(delete(PendingFileDeletion).where(PendingFileDeletion.file_url.contains(f"/{user_id}/")))
+        await session.execute(delete(Document).where(Document.owner_id == user_id))
+        await session.execute(delete(User).where(User.id == user_id))
+        await session.commit()
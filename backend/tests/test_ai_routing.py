@@ -0,0 +1,72 @@
+# aideo/backend/tests/test_ai_routing.py
+
+import json
+
+import httpx
+import pytest
+
+from app.core.resources import resources
+from app.services import ai_service
+
+VALID = {"type": "facture", "resume": "Facture d'eau.", "actions": [], "dates": [], "montants": ["30 EUR"]}
+
+
+@pytest.fixture
+def router(monkeypatch):
+    """Routage petit/grand modèle avec un Ollama simulé ; réponses réglables par modèle."""
+    small = ai_service.ModelTier("small", "petit", 4)
+    large = ai_service.ModelTier("large", "grand", 2)
+    monkeypatch.setattr(ai_service, "SMALL_TIER", small)
+    monkeypatch.setattr(ai_service, "LARGE_TIER", large)
+    monkeypatch.setattr(ai_service, "TIERS", [small, large])
+    monkeypatch.setattr(ai_service, "_analyses", 0)
+    monkeypatch.setattr(ai_service, "_escalations", ai_service.Counter())
+    replies = {"petit": VALID, "grand": {**VALID, "resume": "Résumé du grand modèle."}}
+
+    def handler(request):
+        reply = replies[json.loads(request.content)["model"]]
+        if isinstance(reply, int):
+            return httpx.Response(reply, json={"error": "panne"})
+        return httpx.Response(200, json={"response": reply if isinstance(reply, str) else json.dumps(reply)})
+
+    monkeypatch.setattr(resources, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return replies
+
+
+# Test du cas nominal : le petit modèle suffit
+async def test_small_model_answers_simple_documents(router):
+    analysis = await ai_service.run_analysis("Facture d'eau : 30 EUR")
+    assert analysis.model == "petit" and analysis.data["type"] == "facture"
+    stats = ai_service.routing_stats()
+    assert stats["tiers"]["large"]["calls"] == 0
+    assert stats["escalation_rate"] == 0
+
+
+# Test des règles d'escalade vers le grand modèle
+async def test_escalation_rules(router, monkeypatch):
+    """Teste les escalades : sortie non conforme, texte long, type sensible."""
+    router["petit"] = '{"type": "facture"}'  # champs manquants
+    assert (await ai_service.run_analysis("Facture")).model == "grand"
+
+    router["petit"] = VALID
+    monkeypatch.setattr(ai_service, "AI_SMALL_MAX_CHARS", 10)
+    assert (await ai_service.run_analysis("Avis d'imposition sur le revenu 2024")).model == "grand"
+    monkeypatch.setattr(ai_service, "AI_SMALL_MAX_CHARS", 4000)
+
+    router["petit"] = {**VALID, "type": "Impôts"}
+    assert (await ai_service.run_analysis("Avis d'imposition")).model == "grand"
+
+    stats = ai_service.routing_stats()
+    assert stats["escalations"] == {"invalid": 1, "long": 1, "type": 1}
+    assert stats["tiers"]["small"]["calls"] == 2  # le texte long ne passe pas par le petit modèle
+
+
+# Test du repli quand le grand modèle est indisponible
+async def test_small_answer_kept_when_large_model_fails(router):
+    router["petit"] = {**VALID, "type": "santé"}
+    router["grand"] = 500
+    analysis = await ai_service.run_analysis("Remboursement de soins")
+    assert analysis.model == "petit" and not analysis.fallback
+
+    router["petit"] = "pas du JSON"
+    assert (await ai_service.run_analysis("Remboursement de soins")).fallback
@@ -0,0 +1,43 @@
+# aideo/backend/tests/test_analytics.py
+
+from datetime import date, timedelta
+
+from app.core.database import new_session
+from app.models.base_models import Document
+from app.services.analytics_service import get_amounts_by_type, get_upcoming_deadlines
+
+
+# Test des échéances : seules les dates ISO valides et à venir sont retenues,
+# les valeurs hétérogènes de l'IA ne font jamais échouer les CAST
+async def test_upcoming_deadlines_skip_invalid_dates(test_user):
+    soon, later = date.today() + timedelta(days=3), date.today() + timedelta(days=10)
+    async with new_session() as session:
+        session.add(Document(
+            owner_id=test_user, file_name="facture.pdf", ai_type="Facture", raw_text="texte",
+            ai_dates=[
+                "pas une date", "2025-02-30", "9999-99-99", "20xx-01-01", 42,
+                later.isoformat(), {"date": soon.isoformat(), "label": "Paiement"},
+                (date.today() - timedelta(days=1)).isoformat(),
+            ],
+            ai_montants=[],
+        ))
+        await session.commit()
+
+        deadlines = await get_upcoming_deadlines(session, test_user, days=30)
+
+    assert [(row["due_date"], row["label"]) for row in deadlines] == [(soon, "Paiement"), (later, None)]
+
+
+# Test des montants : les valeurs non numériques sont ignorées dans la somme
+async def test_amounts_by_type_skip_invalid_values(test_user):
+    async with new_session() as session:
+        session.add(Document(
+            owner_id=test_user, file_name="facture.pdf", ai_type="Facture", raw_text="texte",
+            ai_dates=[], ai_montants=["120,50 €", 10, {"montant": "1.234,50"}, "gratuit", "1-2"],
+        ))
+        await session.commit()
+
+        totals = await get_amounts_by_type(session, test_user)
+
+    assert len(totals) == 1
+    assert totals[0]["ai_type"] == "Facture" and float(totals[0]["total"]) == 1365.0
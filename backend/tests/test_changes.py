@@ -0,0 +1,94 @@
+# aideo/backend/tests/test_changes.py
+
+import asyncio
+import random
+import time
+
+import pytest
+
+from app.core.database import new_session
+from app.models.base_models import Document
+from app.services import change_service
+from app.services.change_service import UPSERT, encode_token, list_changes, record_changes
+
+
+async def _insert(owner_id: str, name: str, pause: float = 0.0) -> int:
+    """Insère un document comme le scan ; pause : transaction gardée ouverte après le journal."""
+    async with new_session() as session:
+        document = Document(owner_id=owner_id, file_name=name, content_type="image/png", raw_text="texte")
+        session.add(document)
+        await session.flush()
+        await record_changes(session, owner_id, [document.id], UPSERT)
+        await asyncio.sleep(pause)
+        await session.commit()
+    return document.id
+
+
+# Test des jetons : illisibles (400) ou antérieurs à la conservation des tombstones (410)
+def test_sync_tokens():
+    now = time.time()
+    assert change_service.decode_token(encode_token(42, now), now) == 42
+    expired = encode_token(42, now - (change_service.CHANGES_TOMBSTONE_DAYS + 1) * 86400)
+    with pytest.raises(change_service.ExpiredSyncToken):
+        change_service.decode_token(expired, now)
+    for token in ("abc", "12", "-1-5", "1-2-3"):
+        with pytest.raises(ValueError):
+            change_service.decode_token(token, now)
+
+
+# Test du flux de modifications : création, PATCH, suppression (tombstone), jetons
+async def test_change_feed_routes(client, test_user):
+    kept = await _insert(test_user, "a.png")
+    renamed = await _insert(test_user, "b.png")
+    removed = await _insert(test_user, "c.png")
+
+    response = await client.get("/api/v1/documents/changes", params={"limit": 2})
+    page = response.json()
+    assert [change["id"] for change in page["changes"]] == [kept, renamed] and page["has_more"]
+    page = (await client.get("/api/v1/documents/changes", params={"since": page["next_token"]})).json()
+    assert [change["id"] for change in page["changes"]] == [removed] and not page["has_more"]
+    token = page["next_token"]
+
+    assert (await client.patch(f"/api/v1/documents/{renamed}", json={"file_name": "b2.png"})).status_code == 200
+    assert (await client.delete(f"/api/v1/documents/{removed}")).status_code == 204
+
+    page = (await client.get("/api/v1/documents/changes", params={"since": token})).json()
+    assert [(change["id"], change["op"]) for change in page["changes"]] == [(renamed, "upsert"), (removed, "delete")]
+    assert page["changes"][0]["document"]["file_name"] == "b2.png"
+    assert page["changes"][1]["document"] is None
+
+    # Rien de neuf : même position, nouveau jeton
+    again = (await client.get("/api/v1/documents/changes", params={"since": page["next_token"]})).json()
+    assert again["changes"] == [] and not again["has_more"]
+
+    # Synchronisation complète : documents vivants seulement
+    full = (await client.get("/api/v1/documents/changes")).json()
+    assert sorted(change["id"] for change in full["changes"]) == [kept, renamed]
+
+    assert (await client.get("/api/v1/documents/changes", params={"since": "x"})).status_code == 400
+    expired = encode_token(0, time.time() - (change_service.CHANGES_TOMBSTONE_DAYS + 1) * 86400)
+    assert (await client.get("/api/v1/documents/changes", params={"since": expired})).status_code == 410
+
+
+# Test de la synchronisation pendant des écritures concurrentes : un client qui
+# relit en boucle depuis son dernier jeton finit par voir chaque document
+async def test_concurrent_writers_are_never_skipped(test_user):
+    async def writer(index: int):
+        return [
+            await _insert(test_user, f"{index}-{n}.png", pause=random.uniform(0, 0.02))
+            for n in range(3)
+        ]
+
+    writers = asyncio.gather(*[writer(index) for index in range(8)])
+    seen, since = set(), 0
+    while True:
+        done = writers.done()
+        async with new_session() as session:
+            changes, since, _ = await list_changes(session, test_user, since, limit=5)
+        seen.update(change["id"] for change in changes)
+        if done and not changes:
+            break
+        await asyncio.sleep(0.005)
+
+    written = {document_id for ids in await writers for document_id in ids}
+    assert seen == written
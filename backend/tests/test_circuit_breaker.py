@@ -0,0 +1,143 @@
+# aideo/backend/tests/test_circuit_breaker.py
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.core.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from app.core.resources import resources
+from app.services import ai_service
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _breaker(clock, **kwargs):
+    options = dict(failure_rate=0.5, min_calls=4, window_seconds=60, open_seconds=30, half_open_probes=1)
+    options.update(kwargs)
+    return CircuitBreaker("test", clock=clock, **options)
+
+
+async def _call(breaker, error=None):
+    async with breaker.guard():
+        if error is not None:
+            raise error
+
+
+# Test de l'ouverture au-delà du taux d'échec, puis du refus immédiat
+async def test_opens_on_failure_rate_and_rejects():
+    clock = FakeClock()
+    breaker = _breaker(clock)
+    await _call(breaker)
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            await _call(breaker, ValueError("panne"))
+    assert breaker.state == CLOSED  # 3 appels < min_calls
+
+    with pytest.raises(ValueError):
+        await _call(breaker, ValueError("panne"))
+    assert breaker.state == OPEN
+
+    with pytest.raises(CircuitOpenError) as error:
+        await _call(breaker)
+    assert error.value.retry_after == 30
+    assert breaker.snapshot()["rejected"] == 1
+
+
+# Test des échecs anciens sortis de la fenêtre glissante
+async def test_old_failures_leave_the_window():
+    clock = FakeClock()
+    breaker = _breaker(clock)
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            await _call(breaker, ValueError())
+    clock.now += 61
+    await _call(breaker)
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["calls_in_window"] == 1
+
+
+# Test du semi-ouvert : un seul appel d'essai, succès -> fermé, échec -> rouvert
+async def test_half_open_probe():
+    clock = FakeClock()
+    breaker = _breaker(clock, min_calls=1)
+    with pytest.raises(ValueError):
+        await _call(breaker, ValueError())
+    assert breaker.state == OPEN
+
+    clock.now += 30
+    breaker.acquire()  # appel d'essai en cours
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+    breaker.record(False, "toujours en panne")
+    assert breaker.state == OPEN and breaker.retry_after() == 30
+
+    clock.now += 30
+    await _call(breaker)
+    assert breaker.state == CLOSED
+
+
+# Test d'un appel d'essai annulé : le créneau est rendu
+async def test_cancelled_probe_is_released():
+    clock = FakeClock()
+    breaker = _breaker(clock, min_calls=1)
+    with pytest.raises(ValueError):
+        await _call(breaker, ValueError())
+    clock.now += 30
+
+    async def slow_call():
+        async with breaker.guard():
+            await asyncio.sleep(10)
+
+    task = asyncio.create_task(slow_call())
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert breaker.state == HALF_OPEN
+    await _call(breaker)
+    assert breaker.state == CLOSED
+
+
+# Test des erreurs qui ne prouvent pas une panne (ex : fichier absent)
+async def test_non_failures_count_as_successes():
+    breaker = _breaker(FakeClock(), min_calls=1, is_failure=lambda error: not isinstance(error, KeyError))
+    for _ in range(5):
+        with pytest.raises(KeyError):
+            await _call(breaker, KeyError("absent"))
+    assert breaker.state == CLOSED
+
+
+# Test d'un Ollama en panne : repli immédiat une fois le disjoncteur ouvert
+async def test_ollama_outage_falls_back_fast(monkeypatch):
+    large = ai_service.ModelTier("large", "grand", 2)
+    large.breaker.min_calls = 3
+    monkeypatch.setattr(ai_service, "SMALL_TIER", None)
+    monkeypatch.setattr(ai_service, "LARGE_TIER", large)
+    monkeypatch.setattr(ai_service, "TIERS", [large])
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503, json={"error": "surcharge"})
+
+    monkeypatch.setattr(resources, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    for _ in range(3):
+        assert (await ai_service.run_analysis("Facture")).fallback
+    assert large.breaker.state == OPEN and ai_service.llm_unavailable()
+
+    start = time.perf_counter()
+    for _ in range(20):
+        assert (await ai_service.run_analysis("Facture")).fallback
+    assert time.perf_counter() - start < 0.5
+    assert len(calls) == 3
+    assert large.stats()["circuit"] == OPEN
@@ -0,0 +1,111 @@
+# aideo/backend/tests/test_compression.py
+
+import gzip
+import json
+import zlib
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+
+from app.core.compression import CompressionMiddleware, _CompressionResponder, negotiate_encoding
+
+PAYLOAD = json.dumps([{"raw_text": "texte OCR " * 50, "id": i} for i in range(50)]).encode()
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware)
+
+
+@app.get("/json")
+async def large_json():
+    return Response(PAYLOAD, media_type="application/json")
+
+
+@app.get("/small")
+async def small_json():
+    return {"ok": True}
+
+
+@app.get("/text")
+async def plain_text():
+    return PlainTextResponse("x" * 5000)
+
+
+@app.get("/partial")
+async def partial_content():
+    return Response(PAYLOAD[:4000], status_code=206, media_type="application/json")
+
+
+@app.get("/stream")
+async def streamed_json():
+    async def lines():
+        for i in range(200):
+            yield json.dumps({"id": i, "raw_text": "ligne " * 20}).encode() + b"\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def _client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+# Test de la négociation Accept-Encoding
+def test_negotiate_encoding():
+    """Teste le choix de l'encodage selon les préférences du client."""
+    assert negotiate_encoding(None) is None
+    assert negotiate_encoding("gzip") == "gzip"
+    assert negotiate_encoding("gzip;q=0, identity") is None
+    assert negotiate_encoding("deflate, *;q=0.5") in ("br", "gzip")
+    assert negotiate_encoding("br;q=0.1, gzip;q=0.9") == "gzip"
+
+
+# Test de la compression d'une réponse JSON volumineuse
+async def test_large_json_is_compressed():
+    """Teste que le JSON volumineux est compressé et que le reste passe tel quel."""
+    async with _client() as client:
+        response = await client.get("/json", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert int(response.headers["content-length"]) < len(PAYLOAD)
+        assert response.content == PAYLOAD  # décompressé par httpx
+
+        for path in ("/small", "/text", "/partial"):
+            response = await client.get(path, headers={"Accept-Encoding": "gzip"})
+            assert "content-encoding" not in response.headers, path
+
+        response = await client.get("/json", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in response.headers
+
+
+# Test de la compression au fil de l'eau d'une réponse en flux
+async def test_streaming_json_is_compressed():
+    """Teste qu'une réponse NDJSON en flux est compressée sans Content-Length."""
+    async with _client() as client:
+        async with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+            raw = b"".join([chunk async for chunk in response.aiter_raw()])
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        lines = gzip.decompress(raw).splitlines()
+        assert len(lines) == 200 and json.loads(lines[-1])["id"] == 199
+
+
+# Test du vidage de chaque bloc : une ligne envoyée est décompressable sans attendre la suite
+async def test_streamed_chunks_are_flushed():
+    """Teste que chaque bloc compressé redonne la ligne entière dès sa réception."""
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    responder = _CompressionResponder(send, "gzip", minimum_size=0)
+    await responder.send({
+        "type": "http.response.start", "status": 200,
+        "headers": [(b"content-type", b"application/x-ndjson")],
+    })
+    decompressor = zlib.decompressobj(31)
+    for i in range(3):
+        line = json.dumps({"id": i}).encode() + b"\n"
+        await responder.send({"type": "http.response.body", "body": line, "more_body": True})
+        assert decompressor.decompress(sent[-1]["body"]) == line
+    await responder.send({"type": "http.response.body", "body": b"", "more_body": False})
+    decompressor.decompress(sent[-1]["body"])
+    assert decompressor.eof
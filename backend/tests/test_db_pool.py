@@ -0,0 +1,99 @@
+# aideo/backend/tests/test_db_pool.py
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.api import documents
+from app.core.metrics import DB_POOL_TIMEOUTS_TOTAL
+from app.core.security import get_current_user_from_token
+from app.main import app
+from app.services import ocr_service
+
+# Pool volontairement petit : deux connexions pour six scans concurrents
+POOL_SIZE = 2
+CONCURRENT_SCANS = 6
+LLM_SECONDS = 1.0
+# Délai maximal d'attente des scans (le test échoue au lieu de bloquer)
+SCAN_WAIT_SECONDS = 10
+
+
+@pytest.fixture
+async def small_pool(db_engine, fake_s3, monkeypatch):
+    """Moteur à petit pool (marqueur db_pool), S3 en mémoire, OCR immédiat et IA lente (LLM_SECONDS)."""
+    monkeypatch.setitem(app.dependency_overrides, get_current_user_from_token, lambda: SimpleNamespace(id="1"))
+
+    async def no_budget(user_id):
+        return None
+
+    async def instant_ocr(file_content, content_type):
+        return "Facture EDF, montant 42,00 EUR"
+
+    in_llm = []
+
+    async def slow_analysis(raw_text):
+        in_llm.append(raw_text)
+        await asyncio.sleep(LLM_SECONDS)
+        return SimpleNamespace(columns=lambda: {"ai_type": "facture"})
+
+    monkeypatch.setattr(documents, "check_scan_budgets", no_budget)
+    monkeypatch.setattr(ocr_service, "perform_ocr", instant_ocr)
+    monkeypatch.setattr(ocr_service, "run_analysis", slow_analysis)
+    return in_llm
+
+
+async def _scan(client):
+    response = await client.post(
+        "/api/v1/documents/scan?on_duplicate=off",
+        files={"file": ("facture.png", b"\x89PNG pas vraiment une image", "image/png")},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["document_id"]
+
+
+async def _all_in_llm(in_llm, scans):
+    """Attend que tous les scans soient dans l'IA ; un scan terminé avant lève son erreur."""
+    while len(in_llm) < len(scans):
+        for scan in scans:
+            if scan.done():
+                scan.result()  # exception du scan, ou scan sorti avant l'IA
+                raise AssertionError("scan terminé avant l'appel à l'IA")
+        await asyncio.sleep(0.01)
+
+
+async def _fast_requests(client, document_id: int, rounds: int = 5):
+    """Latences (s) de la liste et du détail, en alternance."""
+    latencies = []
+    for _ in range(rounds):
+        for url in ("/api/v1/documents/", f"/api/v1/documents/{document_id}"):
+            start = time.perf_counter()
+            response = await client.get(url)
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.text
+    return latencies
+
+
+# Test de la latence de la liste et du détail pendant des scans concurrents :
+# l'OCR et l'IA ne gardent aucune connexion du pool
+@pytest.mark.db_pool(pool_size=POOL_SIZE, max_overflow=0, pool_timeout=10)
+async def test_fast_routes_stay_flat_under_scan_load(client, small_pool):
+    document_id = await _scan(client)
+    idle = await _fast_requests(client, document_id)
+    timeouts_before = DB_POOL_TIMEOUTS_TOTAL._values.get((), 0.0)
+
+    small_pool.clear()
+    scans = [asyncio.create_task(_scan(client)) for _ in range(CONCURRENT_SCANS)]
+    try:
+        # Tous les scans sont dans l'appel à l'IA : avant, chacun gardait sa connexion
+        await asyncio.wait_for(_all_in_llm(small_pool, scans), timeout=SCAN_WAIT_SECONDS)
+        loaded = await _fast_requests(client, document_id)
+        assert max(loaded) < LLM_SECONDS / 4
+        assert max(loaded) < max(idle) + 0.2
+        assert all(not scan.done() for scan in scans)
+        assert len(set(await asyncio.wait_for(asyncio.gather(*scans), timeout=SCAN_WAIT_SECONDS))) == CONCURRENT_SCANS
+    finally:
+        for scan in scans:
+            scan.cancel()
+    assert DB_POOL_TIMEOUTS_TOTAL._values.get((), 0.0) == timeouts_before
@@ -0,0 +1,87 @@
+# aideo/backend/tests/test_dedup.py
+
+import io
+import os
+import random
+import subprocess
+import sys
+
+from PIL import Image, ImageDraw, ImageEnhance
+
+from app.services.dedup_service import compute_phash, hamming_distance, original_of, reused_columns
+from app.models.base_models import Document
+
+
+def _page(seed: int) -> Image.Image:
+    """Fausse page : lignes de « texte » à des positions dépendant de la graine."""
+    rng = random.Random(seed)
+    image = Image.new("L", (600, 800), 235)
+    draw = ImageDraw.Draw(image)
+    for _ in range(25):
+        x, y = rng.randrange(20, 400), rng.randrange(20, 760)
+        draw.rectangle((x, y, x + rng.randrange(60, 180), y + 10), fill=rng.randrange(0, 80))
+    return image
+
+
+def _encode(image: Image.Image, format: str = "PNG", **options) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **options)
+    return buffer.getvalue()
+
+
+# Test de la stabilité du pHash pour un re-scan (autre éclairage, compression, cadrage)
+def test_rescan_of_same_page_is_close():
+    page = _page(1)
+    original = compute_phash(_encode(page))
+
+    relit = ImageEnhance.Brightness(page).enhance(1.15)
+    rescan = relit.crop((6, 8, 596, 794)).resize((900, 1200)).convert("RGB")
+
+    assert hamming_distance(original, compute_phash(_encode(rescan, "JPEG", quality=70))) <= 6
+
+
+# Test de la distance entre deux pages différentes
+def test_different_pages_are_far():
+    assert hamming_distance(compute_phash(_encode(_page(1))), compute_phash(_encode(_page(2)))) > 12
+
+
+# Test du format de l'empreinte (BIGINT signé) et d'un fichier illisible
+def test_phash_fits_bigint_and_rejects_garbage():
+    for seed in range(5):
+        value = compute_phash(_encode(_page(seed)))
+        assert -(1 << 63) <= value < (1 << 63)
+    assert compute_phash(b"pas une image") is None
+
+
+# Test de la distance de Hamming sur des entiers signés
+def test_hamming_distance_signed():
+    assert hamming_distance(-1, 0) == 64
+    assert hamming_distance(5, 4) == 1
+
+
+# Test du renvoi vers l'original et de la reprise de l'analyse
+def test_original_and_reused_columns():
+    original = Document(id=10, ai_type="facture", ai_resume="r", ai_actions=["payer"], ai_model="mistral")
+    rescan = Document(id=11, duplicate_of=10)
+    assert original_of(original) == 10
+    assert original_of(rescan) == 10
+
+    columns = reused_columns(original)
+    assert columns["ai_type"] == "facture"
+    assert columns["ai_dates"] == []
+    assert columns["ai_model"] == "mistral"
+    assert columns["ai_edited"] is False
+
+    # Les corrections de l'utilisateur suivent le re-scan (protégées de la réanalyse)
+    edited = Document(id=12, ai_type="impôts", ai_resume="corrigé", ai_edited=True)
+    assert reused_columns(edited)["ai_edited"] is True
+
+
+# Test du refus d'une politique inconnue au chargement du module
+def test_unknown_duplicate_policy_is_rejected():
+    env = dict(os.environ, PHASH_DUPLICATE_POLICY="reuses")
+    result = subprocess.run(
+        [sys.executable, "-c", "import app.services.dedup_service"],
+        env=env, capture_output=True, text=True,
+    )
+    assert result.returncode != 0 and "PHASH_DUPLICATE_POLICY" in result.stderr
@@ -0,0 +1,117 @@
+# aideo/backend/tests/test_deletions.py
+
+import uuid
+
+from sqlalchemy.future import select
+
+from app.api import documents
+from app.core import circuit_breaker
+from app.core.database import new_session
+from app.core.resources import resources
+from app.models.base_models import Document, PendingFileDeletion
+from app.services import deletion_service, storage_service
+from app.services.storage_service import BUCKET_NAME, STORAGE_ENDPOINT
+from loadtest.fakes import FakeS3Client
+
+
+async def _insert(owner_id: str, count: int):
+    """Documents avec leur original dans le S3 en mémoire ; retourne (ids, clés)."""
+    keys = [f"{owner_id}/{uuid.uuid4().hex}.png" for _ in range(count)]
+    async with new_session() as session:
+        rows = [
+            Document(
+                owner_id=owner_id, file_name=key, content_type="image/png", raw_text="texte",
+                file_url=f"{STORAGE_ENDPOINT}/{BUCKET_NAME}/{key}",
+            )
+            for key in keys
+        ]
+        session.add_all(rows)
+        await session.commit()
+    for key in keys:
+        resources.s3_client.put_object(Bucket=BUCKET_NAME, Key=key, Body=b"original")
+    return [row.id for row in rows], keys
+
+
+async def _pending():
+    async with new_session() as session:
+        return (await session.execute(select(PendingFileDeletion).order_by(PendingFileDeletion.id))).scalars().all()
+
+
+def _stored(key: str) -> bool:
+    return f"{BUCKET_NAME}/{key}" in resources.s3_client.objects
+
+
+# Test de la suppression nominale : les originaux partent après le commit, sans reste en attente
+async def test_deleted_documents_lose_their_files(client, test_user, fake_s3):
+    ids, keys = await _insert(test_user, 3)
+
+    response = await client.request("DELETE", "/api/v1/documents/", json={"ids": ids[:2]})
+    assert response.status_code == 200 and sorted(response.json()["ids"]) == ids[:2]
+    assert (await client.delete(f"/api/v1/documents/{ids[2]}")).status_code == 204
+
+    assert not any(_stored(key) for key in keys)
+    assert await _pending() == []
+
+
+# Test d'un worker arrêté entre le commit et la suppression : la purge reprend les fichiers
+async def test_lost_background_task_is_recovered_by_purge(client, test_user, fake_s3, monkeypatch):
+    ids, keys = await _insert(test_user, 2)
+
+    async def lost(pending_ids):
+        return 0
+
+    monkeypatch.setattr(documents, "purge_files", lost)
+    assert (await client.request("DELETE", "/api/v1/documents/", json={"ids": ids[:1]})).status_code == 200
+    assert (await client.delete(f"/api/v1/documents/{ids[1]}")).status_code == 204
+
+    assert all(_stored(key) for key in keys)
+    assert sorted(row.file_url for row in await _pending()) == sorted(f"{STORAGE_ENDPOINT}/{BUCKET_NAME}/{key}" for key in keys)
+
+    assert await deletion_service.purge_files() == 2
+    assert not any(_stored(key) for key in keys)
+    assert await _pending() == []
+
+
+# Test d'un échec du stockage : la ligne reste en attente (attempts) jusqu'à la purge suivante
+async def test_failed_storage_delete_stays_pending(test_user, fake_s3, monkeypatch):
+    _, keys = await _insert(test_user, 2)
+    urls = [f"{STORAGE_ENDPOINT}/{BUCKET_NAME}/{key}" for key in keys]
+    async with new_session() as session:
+        await deletion_service.schedule_file_deletions(session, urls)
+        await session.commit()
+
+    real_delete = deletion_service.delete_files_from_s3
+
+    async def first_fails(file_urls):
+        failed = [url for url in file_urls if url == urls[0]]
+        await real_delete([url for url in file_urls if url not in failed])
+        return failed
+
+    monkeypatch.setattr(deletion_service, "delete_files_from_s3", first_fails)
+    assert await deletion_service.purge_files() == 1
+    pending = await _pending()
+    assert [(row.file_url, row.attempts) for row in pending] == [(urls[0], 1)]
+    assert _stored(keys[0]) and not _stored(keys[1])
+
+    monkeypatch.setattr(deletion_service, "delete_files_from_s3", real_delete)
+    assert await deletion_service.purge_files() == 1
+    assert await _pending() == [] and not _stored(keys[0])
+
+
+# Test d'une panne du stockage : un seul appel par lot, compté par le disjoncteur,
+# sans nouvel essai bloquant (la purge s'en charge)
+async def test_batch_delete_is_not_retried_inside_the_breaker(monkeypatch):
+    class DownS3Client(FakeS3Client):
+        def delete_objects(self, Bucket, Delete):
+            self._call("delete_objects")
+            raise ConnectionError("stockage injoignable")
+
+    monkeypatch.setattr(resources, "_s3_client", DownS3Client())
+    monkeypatch.setitem(circuit_breaker.BREAKERS, "storage", storage_service.STORAGE_BREAKER)
+    breaker = circuit_breaker.CircuitBreaker("storage")
+    monkeypatch.setattr(storage_service, "STORAGE_BREAKER", breaker)
+
+    urls = [f"{STORAGE_ENDPOINT}/{BUCKET_NAME}/a.png", f"{STORAGE_ENDPOINT}/{BUCKET_NAME}/b.png"]
+    assert sorted(await storage_service.delete_files_from_s3(urls)) == urls
+    assert resources.s3_client.calls["delete_objects"] == 1
+    assert [failed for _, failed in breaker._calls] == [True]
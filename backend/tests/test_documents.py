@@ -190,4 +190,189 @@ async def test_6_unauthorized_access(client: AsyncClient):
     
     # L'authentification par dépendance doit renvoyer 401 Unauthorized
     assert response.status_code == 401
-    assert "Jeton invalide" in response.json()["detail"] or "Not authenticated" in response.json()["detail"]
\ No newline at end of file
+    assert "Jeton invalide" in response.json()["detail"] or "Not authenticated" in response.json()["detail"]
+
+# ----------------------------------------------------------------------
+# C. TESTS DES REQUÊTES ANALYTIQUES (JSONB)
+# ----------------------------------------------------------------------
+
+# Test 7 : GET /deadlines et /amounts-by-type (calculés en SQL)
+async def test_7_deadlines_and_amounts(
+    client: AsyncClient, db_test_session: AsyncSession, authenticated_user_token: Dict[str, Any]
+):
+    """Teste l'extraction SQL des échéances et des montants depuis les colonnes JSONB."""
+    from datetime import date, timedelta
+    from app.models.base_models import Document
+
+    soon = (date.today() + timedelta(days=10)).isoformat()
+    later = (date.today() + timedelta(days=90)).isoformat()
+    document = Document(
+        owner_id=authenticated_user_token["user_id"],
+        file_name="avis_impot.png",
+        content_type="image/png",
+        raw_text="Avis d'imposition",
+        ai_type="impôts",
+        ai_dates=[soon, {"date": later, "label": "Solde"}, "2025-02-30", "pas une date"],
+        ai_montants=["1.234,56 €", 100, {"montant": "15.50"}, "inconnu"],
+    )
+    db_test_session.add(document)
+    await db_test_session.commit()
+
+    response = await client.get(
+        "/api/v1/documents/deadlines?days=30",
+        headers=authenticated_user_token["headers"],
+    )
+    assert response.status_code == 200
+    deadlines = [d for d in response.json() if d["document_id"] == document.id]
+    assert [d["due_date"] for d in deadlines] == [soon]
+
+    response = await client.get(
+        "/api/v1/documents/amounts-by-type",
+        headers=authenticated_user_token["headers"],
+    )
+    assert response.status_code == 200
+    by_type = {row["ai_type"]: row for row in response.json()}
+    assert float(by_type["impôts"]["total"]) == 1350.06
+    assert by_type["impôts"]["amounts"] == 3
+
+
+# ----------------------------------------------------------------------
+# D. TESTS DES OPÉRATIONS GROUPÉES
+# ----------------------------------------------------------------------
+
+# Test 8 : PATCH / puis DELETE / (un seul UPDATE/DELETE ... RETURNING)
+async def test_8_bulk_update_and_delete(
+    client: AsyncClient, db_test_session: AsyncSession, authenticated_user_token: Dict[str, Any]
+):
+    """Teste le re-typage puis la suppression groupée, restreints au propriétaire."""
+    from app.models.base_models import Document
+
+    documents = [
+        Document(
+            owner_id=authenticated_user_token["user_id"],
+            file_name=f"lot_{i}.png",
+            content_type="image/png",
+            raw_text="Lot",
+        )
+        for i in range(3)
+    ]
+    db_test_session.add_all(documents)
+    await db_test_session.commit()
+    ids = [document.id for document in documents]
+
+    response = await client.patch(
+        "/api/v1/documents/",
+        headers=authenticated_user_token["headers"],
+        json={"ids": ids, "update": {"ai_type": "archive"}},
+    )
+    assert response.status_code == 200
+    assert sorted(response.json()["ids"]) == sorted(ids)
+
+    response = await client.request(
+        "DELETE",
+        "/api/v1/documents/",
+        headers=authenticated_user_token["headers"],
+        json={"filter": {"ai_type": "archive"}},
+    )
+    assert response.status_code == 200
+    assert set(ids) <= set(response.json()["ids"])
+
+    # Une sélection vide est refusée (garde-fou)
+    response = await client.request(
+        "DELETE",
+        "/api/v1/documents/",
+        headers=authenticated_user_token["headers"],
+        json={},
+    )
+    assert response.status_code == 422
+
+
+# ----------------------------------------------------------------------
+# E. TESTS DES STATISTIQUES DU TABLEAU DE BORD
+# ----------------------------------------------------------------------
+
+# Test 9 : recalcul complet puis mise à jour incrémentale de user_stats
+async def test_9_dashboard_stats(
+    client: AsyncClient, db_test_session: AsyncSession, authenticated_user_token: Dict[str, Any]
+):
+    """Teste la cohérence entre le recalcul (rebuild) et les mises à jour incrémentales."""
+    from app.commands.rebuild_stats import rebuild_user
+    from app.models.base_models import Document
+
+    user_id = authenticated_user_token["user_id"]
+    document = Document(
+        owner_id=user_id,
+        file_name="facture_stats.png",
+        content_type="image/png",
+        file_size=2048,
+        raw_text="Facture",
+        ai_type="facture",
+        ai_actions=["Payer avant la fin du mois"],
+        ai_montants=["42,00 €"],
+    )
+    db_test_session.add(document)
+    await db_test_session.commit()
+
+    # Le document a été inséré hors API : le recalcul détecte et corrige l'écart
+    assert await rebuild_user(user_id, check_only=False)
+    assert await rebuild_user(user_id, check_only=True) == []
+
+    response = await client.get("/api/v1/documents/stats", headers=authenticated_user_token["headers"])
+    assert response.status_code == 200
+    before = response.json()
+    assert before["type_counts"]["facture"] >= 1
+
+    # La suppression via l'API met à jour les agrégats de façon incrémentale
+    response = await client.delete(
+        f"/api/v1/documents/{document.id}",
+        headers=authenticated_user_token["headers"],
+    )
+    assert response.status_code == 204
+
+    response = await client.get("/api/v1/documents/stats", headers=authenticated_user_token["headers"])
+    after = response.json()
+    assert after["documents_count"] == before["documents_count"] - 1
+    assert after["storage_bytes"] == before["storage_bytes"] - 2048
+    assert after["pending_actions"] == before["pending_actions"] - 1
+    assert await rebuild_user(user_id, check_only=True) == []
+
+
+# ----------------------------------------------------------------------
+# F. TESTS DES REQUÊTES CONDITIONNELLES
+# ----------------------------------------------------------------------
+
+# Test 10 : ETag / If-None-Match sur le détail, version incrémentée par PATCH
+async def test_10_document_etag(
+    client: AsyncClient, db_test_session: AsyncSession, authenticated_user_token: Dict[str, Any]
+):
+    """Teste le 304 tant que le document est inchangé, puis un nouvel ETag après PATCH."""
+    from app.models.base_models import Document
+
+    document = Document(
+        owner_id=authenticated_user_token["user_id"],
+        file_name="etag.png",
+        content_type="image/png",
+        raw_text="ETag",
+    )
+    db_test_session.add(document)
+    await db_test_session.commit()
+    url = f"/api/v1/documents/{document.id}"
+    headers = authenticated_user_token["headers"]
+
+    response = await client.get(url, headers=headers)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert response.json()["version"] == 1
+
+    response = await client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = await client.patch(url, headers=headers, json={"ai_resume": "Modifié"})
+    assert response.status_code == 200
+    assert response.json()["version"] == 2
+    assert response.headers["etag"] != etag
+
+    response = await client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["ai_resume"] == "Modifié"
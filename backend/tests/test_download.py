@@ -0,0 +1,90 @@
+# aideo/backend/tests/test_download.py
+
+import pytest
+
+from app.core.database import new_session
+from app.core.resources import resources
+from app.models.base_models import Document
+from app.services.storage_service import BUCKET_NAME, STORAGE_ENDPOINT
+
+ORIGINAL = bytes(range(256)) * 40  # 10 240 octets
+
+
+@pytest.fixture
+async def stored_document(test_user, fake_s3):
+    """Document dont l'original est dans le S3 en mémoire ; retourne (id, clé de l'original)."""
+    key = f"{test_user}/scan.png"
+    fake_s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=ORIGINAL)
+    async with new_session() as session:
+        document = Document(
+            owner_id=test_user, file_name="scan.png", content_type="image/png", raw_text="texte",
+            file_url=f"{STORAGE_ENDPOINT}/{BUCKET_NAME}/{key}", file_size=len(ORIGINAL),
+        )
+        session.add(document)
+        await session.commit()
+    return document.id, key
+
+
+def _url(document_id: int) -> str:
+    return f"/api/v1/documents/{document_id}/download"
+
+
+# Test du téléchargement complet puis d'une plage (206, Content-Range)
+async def test_full_and_partial_download(client, stored_document):
+    document_id, _ = stored_document
+    response = await client.get(_url(document_id))
+    assert response.status_code == 200 and response.content == ORIGINAL
+    assert response.headers["accept-ranges"] == "bytes" and response.headers["etag"]
+
+    response = await client.get(_url(document_id), headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 100-199/{len(ORIGINAL)}"
+    assert response.content == ORIGINAL[100:200]
+
+    # Reprise : plage ouverte jusqu'à la fin
+    response = await client.get(_url(document_id), headers={"Range": f"bytes={len(ORIGINAL) - 10}-"})
+    assert response.status_code == 206 and response.content == ORIGINAL[-10:]
+
+
+# Test d'une plage hors du fichier (416)
+async def test_unsatisfiable_range(client, stored_document):
+    document_id, _ = stored_document
+    response = await client.get(_url(document_id), headers={"Range": f"bytes={len(ORIGINAL)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(ORIGINAL)}"
+
+
+# Test de If-Range : la plage n'est servie que si l'ETag correspond
+async def test_if_range(client, stored_document):
+    document_id, _ = stored_document
+    etag = (await client.get(_url(document_id))).headers["etag"]
+
+    response = await client.get(_url(document_id), headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert response.status_code == 206 and response.content == ORIGINAL[:10]
+
+    response = await client.get(_url(document_id), headers={"Range": "bytes=0-9", "If-Range": '"autre-version"'})
+    assert response.status_code == 200 and response.content == ORIGINAL
+
+
+# Test de If-None-Match (304 sans corps)
+async def test_not_modified(client, stored_document):
+    document_id, _ = stored_document
+    etag = (await client.get(_url(document_id))).headers["etag"]
+
+    response = await client.get(_url(document_id), headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.content == b""
+    assert response.headers["etag"] == etag
+
+    response = await client.get(_url(document_id), headers={"If-None-Match": '"autre-version"'})
+    assert response.status_code == 200
+
+
+# Test des documents introuvables : fiche absente, ou objet absent du stockage (404)
+async def test_missing_document_or_file(client, stored_document):
+    document_id, key = stored_document
+    assert (await client.get(_url(document_id + 1_000_000))).status_code == 404
+
+    resources.s3_client.delete_object(Bucket=BUCKET_NAME, Key=key)
+    response = await client.get(_url(document_id))
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Fichier introuvable dans le stockage"
@@ -0,0 +1,121 @@
+# aideo/backend/tests/test_export.py
+
+import asyncio
+import base64
+import io
+import json
+import zipfile
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.base_models import Document
+from app.models.document_analysis import DocumentResponse
+from app.services import export_service
+
+ORIGINAL = bytes(range(256)) * 700  # ~175 Ko : plusieurs blocs de lecture
+
+
+def _document(document_id: int, file_url=None):
+    return SimpleNamespace(
+        id=document_id, owner_id="1", file_name=f"scan_{document_id}.png", content_type="image/png",
+        file_url=file_url, file_size=len(ORIGINAL) if file_url else None, stored_format=None, storage_tier=None,
+        raw_text=f"texte OCR {document_id}", ai_type="facture", ai_resume=None,
+        ai_actions=[], ai_dates=[], ai_montants=[],
+        created_at=datetime(2025, 1, 31, 12, 0), updated_at=None, version=1,
+    )
+
+
+async def _documents(*documents):
+    for document in documents:
+        yield document
+
+
+@pytest.fixture
+def fake_storage(monkeypatch):
+    """open_document_original sur un stockage en mémoire : "absent" n'existe pas."""
+    async def fake_open(document, route="export"):
+        if document.file_url == "absent":
+            raise FileNotFoundError(document.file_url)
+        return {"Body": io.BytesIO(ORIGINAL), "ContentLength": len(ORIGINAL)}
+
+    monkeypatch.setattr(export_service, "open_document_original", fake_open)
+
+
+async def _collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+# Test de l'export ZIP en flux
+async def test_zip_export(fake_storage):
+    """Teste le contenu de l'archive, les fichiers manquants et le manifeste de reprise."""
+    chunks = await _collect(export_service.zip_chunks(
+        _documents(_document(3, "present"), _document(5, "absent")), after_id=2, include_files=True,
+    ))
+    assert len(chunks) > 3  # produit au fil de l'eau, pas en un seul bloc
+
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert archive.read("documents/3/scan_3.png") == ORIGINAL
+    assert archive.getinfo("documents/3/scan_3.png").compress_type == zipfile.ZIP_STORED
+    assert archive.read("documents/5/texte.txt") == "texte OCR 5".encode()
+    assert json.loads(archive.read("documents/3/metadata.json"))["ai_type"] == "facture"
+    assert "documents/5/scan_5.png" not in archive.namelist()
+
+    manifest = json.loads(archive.read("export.json"))
+    assert manifest["documents"] == 2
+    assert (manifest["after_id"], manifest["last_id"]) == (2, 5)
+    assert manifest["missing_files"] == [5]
+
+
+# Test de l'export NDJSON en flux
+async def test_ndjson_export(fake_storage):
+    """Teste une ligne par document, l'original en base64 et la ligne de fin."""
+    chunks = await _collect(export_service.ndjson_chunks(
+        _documents(_document(1, "present"), _document(2)), after_id=0, include_files=True,
+    ))
+    lines = [json.loads(line) for line in b"".join(chunks).splitlines()]
+    assert [line["type"] for line in lines] == ["document", "document", "end"]
+    assert base64.b64decode(lines[0]["file_base64"]) == ORIGINAL
+    assert lines[1]["raw_text"] == "texte OCR 2" and "file_base64" not in lines[1]
+    assert lines[2]["last_id"] == 2 and lines[2]["missing_files"] == []
+
+
+# Test des créneaux d'export : pris avant la réponse, rendus à la fin du flux
+# ou si le client part avant le premier bloc
+async def test_export_slots(monkeypatch):
+    monkeypatch.setattr(export_service, "_export_slots", export_service._ExportSlots(2))
+    monkeypatch.setattr(export_service, "iter_user_documents", lambda owner_id, after_id: _documents(_document(1)))
+
+    def export():
+        return export_service.export_response("1", "ndjson", 0, include_files=False)
+
+    streamed, never_started = export(), export()
+    with pytest.raises(HTTPException) as refused:
+        export()
+    assert refused.value.status_code == 503
+
+    # Flux lu jusqu'au bout : créneau rendu
+    await _collect(streamed.body_iterator)
+    assert export_service._export_slots.active == 1
+
+    # Client parti avant le premier bloc : le flux n'est jamais lu, le créneau est rendu quand même
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        await asyncio.Event().wait()  # l'en-tête de réponse ne part jamais
+
+    await never_started({"type": "http"}, receive, send)
+    assert export_service._export_slots.active == 0
+
+
+# Test d'un document pas encore inséré (version NULL avant le flush) : version 1
+def test_transient_document_metadata():
+    document = Document(
+        id=1, owner_id="1", file_name="scan.png", content_type="image/png",
+        ai_actions=[], ai_dates=[], ai_montants=[], created_at=datetime(2025, 1, 31, 12, 0),
+    )
+    assert document.version is None
+    assert DocumentResponse.model_validate(document).version == 1
@@ -0,0 +1,34 @@
+# aideo/backend/tests/test_http_cache.py
+
+import pytest
+
+from app.core.http_cache import RangeNotSatisfiable, document_etag, etag_matches, parse_range
+
+
+# Test de la comparaison faible des ETags
+def test_etag_matches():
+    """Teste If-None-Match : liste, joker et ETag faible."""
+    etag = document_etag(7, 3)
+    assert etag_matches(etag, etag)
+    assert etag_matches('"autre", W/"doc-7-v3"', etag)
+    assert etag_matches('"doc-7-v3"', etag)  # comparaison faible
+    assert etag_matches("*", etag)
+    assert not etag_matches(document_etag(7, 2), etag)
+    assert not etag_matches(None, etag)
+
+
+# Test de l'analyse de l'en-tête Range
+def test_parse_range():
+    """Teste les plages simples, suffixes, ouvertes et hors du fichier."""
+    assert parse_range("bytes=0-499", 1000) == (0, 499)
+    assert parse_range("bytes=500-", 1000) == (500, 999)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=900-5000", 1000) == (900, 999)
+    # Ignorés : fichier entier
+    assert parse_range(None, 1000) is None
+    assert parse_range("bytes=0-10,20-30", 1000) is None
+    assert parse_range("items=0-10", 1000) is None
+    assert parse_range("bytes=0-10", None) is None
+
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=1000-", 1000)
@@ -0,0 +1,57 @@
+# aideo/backend/tests/test_ingest.py
+
+from types import SimpleNamespace
+
+import pytest
+
+from app.commands import ingest
+from app.commands.ingest import Checkpoint, LocalSource, Progress
+
+
+# Test du journal de reprise
+def test_checkpoint_resume(tmp_path):
+    """Teste les fichiers écartés, les lots commités ou non, et une ligne tronquée."""
+    path = str(tmp_path / "ingest.checkpoint.jsonl")
+    checkpoint = Checkpoint(path)
+    checkpoint.record_skipped("vide.png", "OCR vide")
+    checkpoint.record_batch("a", [("1.png", "url-1"), ("2.png", "url-2")])
+    checkpoint.record_committed("a", ["1.png", "2.png"])
+    checkpoint.record_batch("b", [("3.png", "url-3")])  # arrêt avant le commit
+    checkpoint.close()
+    with open(path, "a") as handle:
+        handle.write('{"committed": "b"')  # écriture interrompue
+
+    resumed = Checkpoint(path)
+    resumed.load()
+    assert resumed.done == {"vide.png", "1.png", "2.png"}
+    assert resumed.uncommitted == {"b": [("3.png", "url-3")]}
+
+
+# Test du parcours d'un dossier local
+def test_local_source_lists_supported_files(tmp_path):
+    """Teste le filtrage par extension et l'ordre stable des clés."""
+    (tmp_path / "2024").mkdir()
+    for name in ("b.png", "a.JPG", "2024/c.pdf", "notes.txt"):
+        (tmp_path / name).write_bytes(b"x")
+    # Les PDF sont écartés : leur OCR n'est pas implémenté
+    assert LocalSource(str(tmp_path)).list_keys() == ["a.JPG", "b.png"]
+
+
+# Test d'un lot dont l'insertion échoue : ses originaux envoyés sont supprimés
+async def test_failed_batch_deletes_uploads(tmp_path, monkeypatch):
+    deleted = []
+
+    async def delete_files(file_urls):
+        deleted.extend(file_urls)
+
+    def broken_session():
+        raise ConnectionError("base indisponible")
+
+    monkeypatch.setattr(ingest, "delete_files_from_s3", delete_files)
+    monkeypatch.setattr(ingest, "new_session", broken_session)
+    checkpoint = Checkpoint(str(tmp_path / "ingest.checkpoint.jsonl"))
+    batch = [(f"{i}.png", SimpleNamespace(file_url=f"url-{i}"), None) for i in range(3)]
+    with pytest.raises(ConnectionError):
+        await ingest._insert_batch("u1", batch, checkpoint, Progress(3, 0))
+    checkpoint.close()
+    assert deleted == ["url-0", "url-1", "url-2"]
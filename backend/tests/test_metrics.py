@@ -0,0 +1,102 @@
+# aideo/backend/tests/test_metrics.py
+
+import re
+
+import pytest
+
+from app.core.metrics import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, Registry
+
+# Ligne d'échantillon du format texte Prometheus : nom{étiquettes} valeur
+_SAMPLE = re.compile(
+    r'^[a-zA-Z_:][a-zA-Z0-9_:]*'
+    r'(\{[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\[\\"n])*"(,[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\[\\"n])*")*\})?'
+    r' (-?[0-9.e+-]+|\+Inf|-Inf|NaN)$'
+)
+
+
+# Test du format texte : HELP, TYPE et échantillons des compteurs et jauges
+def test_counter_and_gauge_exposition():
+    registry = Registry()
+    scans = registry.register(Counter("aideo_test_scans_total", "Scans traités.", ("status",)))
+    depth = registry.register(Gauge("aideo_test_depth", "Profondeur.\nSur deux lignes \\ échappées."))
+    registry.register(Gauge(
+        "aideo_test_computed", "Valeur calculée à la collecte.", ("stat",),
+        callback=lambda: [(("hits",), 3.0)],
+    ))
+
+    scans.inc(status="success")
+    scans.inc(2, status="success")
+    scans.inc(0.5, status="error")
+    depth.inc(5)
+    depth.dec(2)
+
+    assert registry.render() == "\n".join([
+        "# HELP aideo_test_scans_total Scans traités.",
+        "# TYPE aideo_test_scans_total counter",
+        'aideo_test_scans_total{status="success"} 3',
+        'aideo_test_scans_total{status="error"} 0.5',
+        "# HELP aideo_test_depth Profondeur.\\nSur deux lignes \\\\ échappées.",
+        "# TYPE aideo_test_depth gauge",
+        "aideo_test_depth 3",
+        "# HELP aideo_test_computed Valeur calculée à la collecte.",
+        "# TYPE aideo_test_computed gauge",
+        'aideo_test_computed{stat="hits"} 3',
+    ]) + "\n"
+
+    with pytest.raises(ValueError):
+        scans.inc(statut="success")
+
+
+# Test de l'échappement des valeurs d'étiquettes (barre oblique inverse, guillemet, saut de ligne)
+def test_label_escaping():
+    counter = Counter("aideo_test_escape_total", "Échappement.", ("value",))
+    counter.inc(value='a"b\\c\nd')
+    sample = counter.render()[-1]
+    assert sample == 'aideo_test_escape_total{value="a\\"b\\\\c\\nd"} 1'
+    assert _SAMPLE.match(sample)
+
+
+# Test des histogrammes : compteurs cumulés par borne (inclusive), +Inf, somme et total
+def test_histogram_buckets():
+    histogram = Histogram("aideo_test_seconds", "Durées.", ("stage",), buckets=(0.1, 1, 0.5))
+    for value in (0.05, 0.1, 0.3, 2.0):
+        histogram.observe(value, stage="ocr")
+
+    assert histogram.buckets == (0.1, 0.5, 1, float("inf"))
+    assert histogram.render()[2:] == [
+        'aideo_test_seconds_bucket{stage="ocr",le="0.1"} 2',
+        'aideo_test_seconds_bucket{stage="ocr",le="0.5"} 3',
+        'aideo_test_seconds_bucket{stage="ocr",le="1"} 3',
+        'aideo_test_seconds_bucket{stage="ocr",le="+Inf"} 4',
+        'aideo_test_seconds_sum{stage="ocr"} 2.45',
+        'aideo_test_seconds_count{stage="ocr"} 4',
+    ]
+
+    with histogram.time(stage="llm"):
+        pass
+    assert 'aideo_test_seconds_count{stage="llm"} 1' in histogram.render()
+
+
+# Test de GET /metrics : type MIME, lignes valides, et étiquette de route du
+# middleware (nom de la fonction, "unmatched" pour une URL inconnue)
+async def test_metrics_endpoint_and_route_labels(client):
+    assert (await client.get("/health/live")).status_code == 200
+    assert (await client.get("/api/v1/inexistant/42")).status_code == 404
+
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == CONTENT_TYPE_LATEST
+
+    lines = response.text.splitlines()
+    for line in lines:
+        assert line.startswith("# HELP ") or line.startswith("# TYPE ") or _SAMPLE.match(line), line
+    assert any(
+        line.startswith('aideo_http_request_seconds_count{method="GET",route="liveness",status="200"} ')
+        for line in lines
+    )
+    assert any(
+        line.startswith('aideo_http_request_seconds_count{method="GET",route="unmatched",status="404"} ')
+        for line in lines
+    )
+    # Aucune étiquette de route ne reprend l'URL (cardinalité bornée)
+    assert not any("/api/v1/inexistant" in line for line in lines)
@@ -0,0 +1,92 @@
+# aideo/backend/tests/test_password_hashing.py
+
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from app.core import security
+
+
+def _context(rounds: int) -> CryptContext:
+    """Même configuration que security.password_context, à coût réduit (tests rapides)."""
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+
+@pytest.fixture
+def fast_bcrypt(monkeypatch):
+    monkeypatch.setattr(security, "password_context", _context(4))
+    # Sémaphore propre à la boucle du test
+    monkeypatch.setattr(
+        security, "_hash_slots",
+        asyncio.Semaphore(security.PASSWORD_HASH_WORKERS + security.PASSWORD_HASH_MAX_PENDING),
+    )
+
+
+# Test du hachage et de la vérification dans le pool dédié, hors de la boucle d'événements
+async def test_hash_and_verify_run_in_pool(fast_bcrypt, monkeypatch):
+    hashed = await security.hash_password_async("motdepasse")
+    assert hashed.startswith("$2b$04$")
+    assert await security.verify_password_async("motdepasse", hashed) == (True, None)
+    assert await security.verify_password_async("autre", hashed) == (False, None)
+    # Empreinte non reconnue (utilisateur stub) : refus, sans erreur
+    assert await security.verify_password_async("motdepasse", "stub") == (False, None)
+
+    threads = []
+    real_hash = security.password_context.hash
+
+    def spy(password):
+        threads.append(threading.current_thread().name)
+        return real_hash(password)
+
+    monkeypatch.setattr(security.password_context, "hash", spy)
+    await security.hash_password_async("motdepasse")
+    assert threads and threads[0].startswith("password-hash")
+
+
+# Test du refus (503) quand tous les créneaux de calcul sont pris
+async def test_saturated_pool_is_refused(fast_bcrypt, monkeypatch):
+    monkeypatch.setattr(security, "_hash_slots", asyncio.Semaphore(1))
+    started, release = threading.Event(), threading.Event()
+    real_hash = security.password_context.hash
+
+    def slow_hash(password):
+        started.set()
+        release.wait(timeout=5)
+        return real_hash(password)
+
+    monkeypatch.setattr(security.password_context, "hash", slow_hash)
+    busy = asyncio.create_task(security.hash_password_async("premier"))
+    try:
+        await asyncio.wait_for(asyncio.to_thread(started.wait, 5), timeout=5)
+        with pytest.raises(HTTPException) as refused:
+            await security.verify_password_async("second", "$2b$04$" + "a" * 53)
+        assert refused.value.status_code == 503
+        assert refused.value.headers["Retry-After"] == "1"
+    finally:
+        release.set()
+    assert (await busy).startswith("$2b$04$")
+
+    # Créneau rendu : les appels suivants passent
+    assert (await security.hash_password_async("troisième")).startswith("$2b$04$")
+
+
+# Test du ré-hachage après un changement de BCRYPT_ROUNDS : la nouvelle
+# empreinte est fournie une fois, puis l'empreinte à jour n'est plus signalée
+async def test_rehash_after_rounds_change(fast_bcrypt, monkeypatch):
+    old_hash = await security.hash_password_async("motdepasse")
+
+    monkeypatch.setattr(security, "password_context", _context(5))
+    valid, new_hash = await security.verify_password_async("motdepasse", old_hash)
+    assert valid and new_hash is not None and new_hash.startswith("$2b$05$")
+    assert await security.verify_password_async("motdepasse", new_hash) == (True, None)
+    # Mot de passe faux : pas de nouvelle empreinte
+    assert await security.verify_password_async("autre", old_hash) == (False, None)
@@ -0,0 +1,47 @@
+# aideo/backend/tests/test_profiling.py
+
+import asyncio
+import time
+
+from app.core import profiling
+from app.core.profiling import RequestProfile
+
+
+def _busy_loop(seconds: float):
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        sum(range(1000))
+
+
+async def _profiled_work():
+    _busy_loop(0.05)
+    await asyncio.sleep(0.05)
+    await profiling.to_thread(_busy_loop, 0.05)
+
+
+# Test de l'échantillonnage : calcul sur la boucle, attente et thread de travail
+async def test_profile_records_wall_and_cpu(tmp_path):
+    """Teste que le profil contient les piles en exécution, en attente et dans un thread."""
+    profile = RequestProfile(asyncio.current_task(), "GET /test", interval=0.001)
+    token = profiling._active_profile.set(profile)
+    profile.start()
+    try:
+        await _profiled_work()
+    finally:
+        profiling._active_profile.reset(token)
+        profile.stop()
+
+    wall = profile.folded("wall")
+    cpu = profile.folded("cpu")
+    assert "_busy_loop" in wall and "_busy_loop" in cpu
+    assert "[attente]" in wall and "sleep" in wall
+    assert "[thread]" in wall
+    assert all(line.startswith("GET /test;") for line in wall.splitlines())
+
+    # Enregistrement puis relecture
+    profile.save(str(tmp_path))
+    assert profiling.profile_path(profile.id, "cpu", str(tmp_path)) is not None
+    assert profiling.profile_path("../../etc/passwd", "cpu", str(tmp_path)) is None
+    listed = profiling.list_profiles(str(tmp_path))
+    assert [item["id"] for item in listed] == [profile.id]
+    assert listed[0]["samples"] > 0
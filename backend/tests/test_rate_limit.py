@@ -0,0 +1,105 @@
+# aideo/backend/tests/test_rate_limit.py
+
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import delete
+
+from app.api import documents
+from app.core.database import new_session
+from app.core.rate_limit import (
+    InMemoryBackend,
+    PostgresBackend,
+    RateLimiter,
+    RateLimitExceeded,
+    caller_key,
+)
+from app.core.security import get_optional_user
+from app.main import app
+from app.models.base_models import RateLimitBucket
+
+
+# Test de la rafale puis du refus avec Retry-After
+async def test_rate_limit_burst_then_429():
+    """Teste que le seau autorise la rafale puis refuse avec un délai de réessai."""
+    limiter = RateLimiter(backend=InMemoryBackend(), enabled=True)
+    for _ in range(10):  # capacité par défaut du budget "uploads"
+        await limiter.acquire("user-1", "uploads")
+
+    with pytest.raises(RateLimitExceeded) as exc_info:
+        await limiter.acquire("user-1", "uploads")
+    assert exc_info.value.budget == "uploads"
+    assert exc_info.value.retry_after > 0
+
+    # Les budgets sont indépendants par utilisateur
+    await limiter.acquire("user-2", "uploads")
+
+
+# Test du débit a posteriori (dette sur les secondes d'OCR)
+async def test_rate_limit_charge_creates_debt():
+    """Teste qu'un débit a posteriori peut rendre le solde négatif et bloquer l'admission."""
+    limiter = RateLimiter(backend=InMemoryBackend(), enabled=True)
+    await limiter.acquire("user-1", "ocr_seconds", cost=0, require=1)
+    await limiter.charge("user-1", "ocr_seconds", 500)
+
+    with pytest.raises(RateLimitExceeded):
+        await limiter.acquire("user-1", "ocr_seconds", cost=0, require=1)
+
+
+# Test de l'identité débitée : l'utilisateur du jeton, sinon l'adresse du client
+def test_caller_key():
+    request = SimpleNamespace(client=SimpleNamespace(host="10.0.0.7"))
+    assert caller_key(SimpleNamespace(id="u-1"), request) == "u-1"
+    assert caller_key(None, request) == "client:10.0.0.7"
+    assert caller_key(None, SimpleNamespace(client=None)) == "client:inconnu"
+
+
+# Test du scan : les budgets ne sont plus ceux du propriétaire provisoire "1"
+async def test_scan_budgets_are_keyed_by_caller(client, monkeypatch):
+    keys = []
+
+    async def refuse(key):
+        keys.append(key)
+        raise RateLimitExceeded("uploads", 3)
+
+    monkeypatch.setattr(documents, "check_scan_budgets", refuse)
+    files = {"file": ("page.png", b"x", "image/png")}
+    response = await client.post("/api/v1/documents/scan", files=files)
+    assert response.status_code == 429 and response.headers["Retry-After"] == "3"
+
+    monkeypatch.setitem(app.dependency_overrides, get_optional_user, lambda: SimpleNamespace(id="u-9"))
+    await client.post("/api/v1/documents/scan", files=files)
+    assert keys == ["client:127.0.0.1", "u-9"]
+
+
+@pytest.fixture
+async def postgres_backend(db_engine):
+    """Backend partagé sur la base de test (moteur propre au test)."""
+    prefix = f"pg-{uuid.uuid4().hex[:8]}"
+    yield prefix, PostgresBackend()
+    async with new_session() as session:
+        await session.execute(delete(RateLimitBucket).where(RateLimitBucket.key.like(f"%:{prefix}%")))
+        await session.commit()
+
+
+# Test du backend PostgreSQL : rafale concurrente sans double débit, puis dette
+async def test_postgres_backend(postgres_backend):
+    prefix, backend = postgres_backend
+    limiter = RateLimiter(backend=backend, enabled=True)
+
+    # 15 demandes simultanées pour une capacité de 10 : la ligne verrouillée sérialise les débits
+    results = await asyncio.gather(
+        *[limiter.acquire(f"{prefix}-a", "uploads") for _ in range(15)], return_exceptions=True
+    )
+    assert sum(result is None for result in results) == 10
+    refused = [result for result in results if isinstance(result, RateLimitExceeded)]
+    assert len(refused) == 5 and all(error.retry_after > 0 for error in refused)
+    # Seau propre à chaque identité
+    await limiter.acquire(f"{prefix}-b", "uploads")
+
+    await limiter.acquire(f"{prefix}-a", "ocr_seconds", cost=0, require=1)
+    await limiter.charge(f"{prefix}-a", "ocr_seconds", 500)
+    with pytest.raises(RateLimitExceeded):
+        await limiter.acquire(f"{prefix}-a", "ocr_seconds", cost=0, require=1)
@@ -0,0 +1,50 @@
+# aideo/backend/tests/test_reanalysis.py
+
+import json
+
+import httpx
+import pytest
+
+from app.core.resources import resources
+from app.services import ai_service, reanalysis_service
+
+
+@pytest.fixture
+def ollama(monkeypatch):
+    """Ollama simulé : réponse fixe, ou erreur 500 si status vaut 500."""
+    behaviour = {"status": 200}
+
+    def handler(request):
+        if behaviour["status"] != 200:
+            return httpx.Response(behaviour["status"], json={"error": "panne"})
+        analysis = {"type": "facture", "resume": "Facture.", "actions": [], "dates": [], "montants": ["12 EUR"]}
+        return httpx.Response(200, json={"response": json.dumps(analysis)})
+
+    monkeypatch.setattr(resources, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return behaviour
+
+
+# Test de la provenance d'une analyse
+async def test_analysis_records_model_prompt_and_fallback(ollama):
+    """Teste les colonnes ai_model / ai_prompt_version / ai_fallback."""
+    columns = (await ai_service.run_analysis("FACTURE 12 EUR")).columns()
+    assert columns["ai_type"] == "facture"
+    assert columns["ai_model"] == ai_service.AI_MODEL
+    assert columns["ai_prompt_version"] == ai_service.PROMPT_VERSION
+    assert columns["ai_fallback"] is False
+
+    ollama["status"] = 500
+    analysis = await ai_service.run_analysis("FACTURE 12 EUR")
+    assert analysis.fallback is True
+    assert analysis.data == ai_service._get_fallback_data()
+
+
+# Test de la priorité des scans sur la réanalyse
+def test_reanalysis_waits_for_idle_worker(monkeypatch):
+    """Teste qu'aucune réanalyse ne démarre pendant un scan ou si le LLM est saturé."""
+    assert reanalysis_service.is_idle()
+    monkeypatch.setattr(resources, "inflight_scans", 1)
+    assert not reanalysis_service.is_idle()
+    monkeypatch.setattr(resources, "inflight_scans", 0)
+    monkeypatch.setattr(ai_service, "llm_saturated", lambda: True)
+    assert not reanalysis_service.is_idle()
@@ -0,0 +1,44 @@
+# aideo/backend/tests/test_resources.py
+
+import asyncio
+import os
+
+from app.core.resources import ResourceContainer, resources
+
+
+# Test de l'attente des scans en cours à l'arrêt
+async def test_drain_waits_for_inflight_scans():
+    """Teste que l'arrêt attend la fin des scans, dans la limite du délai."""
+    container = ResourceContainer()
+
+    async def scan(duration):
+        async with container.track_scan():
+            await asyncio.sleep(duration)
+
+    task = asyncio.create_task(scan(0.05))
+    await asyncio.sleep(0)
+    assert container.inflight_scans == 1
+    assert await container.drain_scans(timeout=1) == 0
+    await task
+
+    slow = asyncio.create_task(scan(1))
+    await asyncio.sleep(0)
+    assert await container.drain_scans(timeout=0.05) == 1
+    slow.cancel()
+
+
+# Test de la réinitialisation des clients dans le processus enfant
+def test_resources_are_reset_after_fork():
+    """Teste qu'un worker forké ne réutilise pas les clients du processus parent."""
+    resources._http_client = sentinel = object()
+    try:
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:  # processus enfant
+            os.write(write_end, b"1" if resources._http_client is None else b"0")
+            os._exit(0)
+        os.waitpid(pid, 0)
+        assert os.read(read_end, 1) == b"1"
+        assert resources._http_client is sentinel
+    finally:
+        resources._http_client = None
@@ -0,0 +1,193 @@
+# aideo/backend/tests/test_stage_graph.py
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.stage_graph import StageGraph, StageTimeoutError
+from app.services import ocr_service
+
+LABELS = {"content_type": "image/png", "size_bucket": "lt_100k"}
+
+
+def _sleeper(seconds, value=None, log=None, name=None):
+    async def run():
+        if log is not None:
+            log.append(f"début {name}")
+        await asyncio.sleep(seconds)
+        if log is not None:
+            log.append(f"fin {name}")
+        return value
+    return run
+
+
+# Test du parallélisme des étapes indépendantes et de l'ordre des dépendances
+async def test_independent_stages_run_concurrently():
+    graph = StageGraph(LABELS)
+    graph.add("upload", _sleeper(0.2, "url"))
+    graph.add("ocr", _sleeper(0.2, "texte"))
+    graph.add("llm", lambda: _sleeper(0.05, graph.results["ocr"].upper())(), after=("ocr",))
+    graph.add("insert", _sleeper(0, "ok"), after=("upload", "llm"))
+
+    start = time.perf_counter()
+    results = await graph.run()
+    elapsed = time.perf_counter() - start
+
+    assert results["llm"] == "TEXTE" and results["insert"] == "ok"
+    assert elapsed < 0.4  # séquentiel : 0,45 s
+    assert set(graph.timings_ms) == {"upload", "ocr", "llm", "insert"}
+    assert graph.timings_ms["upload"] >= 190
+
+
+# Test du nettoyage : l'upload en cours est attendu puis défait, les autres étapes annulées
+async def test_failure_waits_for_and_cleans_up_upload():
+    cleaned, log = [], []
+
+    async def failing_ocr():
+        await asyncio.sleep(0.01)
+        raise ValueError("OCR impossible")
+
+    async def cleanup(url):
+        cleaned.append(url)
+
+    graph = StageGraph(LABELS)
+    graph.add("upload", _sleeper(0.1, "url"), cleanup=cleanup)
+    graph.add("ocr", failing_ocr)
+    graph.add("other", _sleeper(5, log=log, name="other"))
+    graph.add("llm", _sleeper(0, "analyse"), after=("ocr",))
+
+    with pytest.raises(ValueError):
+        await graph.run()
+    assert cleaned == ["url"]
+    assert log == ["début other"]  # annulée
+    assert "llm" not in graph.results
+
+
+# Test du délai maximal par étape
+async def test_stage_timeout():
+    cleaned = []
+
+    async def cleanup(url):
+        cleaned.append(url)
+
+    graph = StageGraph(LABELS)
+    graph.add("upload", _sleeper(0, "url"), cleanup=cleanup)
+    graph.add("ocr", _sleeper(5), timeout=0.05)
+    graph.add("insert", _sleeper(0), after=("upload", "ocr"))
+
+    with pytest.raises(StageTimeoutError) as error:
+        await graph.run()
+    assert error.value.stage == "ocr"
+    assert cleaned == ["url"]
+
+
+# Test des étapes sautées et des valeurs connues d'avance
+async def test_skip_and_initial_results():
+    graph = StageGraph(LABELS, {"duplicate": "doc-1"})
+    graph.add("ocr", _sleeper(0, "texte"), after=("duplicate",), skip=lambda: graph.results["duplicate"] is not None)
+    results = await graph.run()
+    assert results["ocr"] is None
+    assert "ocr" not in graph.timings_ms
+
+
+# Test des graphes invalides
+async def test_invalid_graphs():
+    graph = StageGraph(LABELS)
+    graph.add("a", _sleeper(0), after=("inconnue",))
+    with pytest.raises(ValueError):
+        await graph.run()
+
+    graph = StageGraph(LABELS)
+    graph.add("a", _sleeper(0), after=("b",))
+    graph.add("b", _sleeper(0), after=("a",))
+    with pytest.raises(ValueError):
+        await graph.run()
+
+
+class _FakeSession:
+    """Session minimale : flush lent (délai) ou commit en échec."""
+
+    def __init__(self, flush_seconds: float = 0.0, commit_error: Exception = None):
+        self.flush_seconds = flush_seconds
+        self.commit_error = commit_error
+        self.committed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def add(self, obj):
+        pass
+
+    async def flush(self):
+        await asyncio.sleep(self.flush_seconds)
+
+    async def commit(self):
+        if self.commit_error is not None:
+            raise self.commit_error
+        self.committed = True
+
+
+@pytest.fixture
+def insert_env(monkeypatch):
+    deleted = []
+
+    async def delete_file(url):
+        deleted.append(url)
+
+    async def no_op(*args):
+        return None
+
+    async def schedule(session, file_urls):
+        deleted.extend(f"purge:{url}" for url in file_urls)
+
+    monkeypatch.setattr(ocr_service, "delete_file_from_s3", delete_file)
+    monkeypatch.setattr(ocr_service, "schedule_file_deletions", schedule)
+    monkeypatch.setattr(ocr_service, "apply_stats_delta", no_op)
+    monkeypatch.setattr(ocr_service, "record_changes", no_op)
+    monkeypatch.setitem(ocr_service.STAGE_TIMEOUTS, "db", 0.05)
+    return deleted
+
+
+# Test de l'insertion hors du graphe : l'original n'est supprimé que si l'échec précède le commit
+async def test_insert_keeps_original_once_commit_started(insert_env, monkeypatch):
+    stored = SimpleNamespace(url="url-1")
+    document = SimpleNamespace(id=1)
+
+    # Requêtes trop lentes avant le commit : 504 et original supprimé
+    monkeypatch.setattr(ocr_service, "new_session", lambda: _FakeSession(flush_seconds=1))
+    with pytest.raises(HTTPException) as error:
+        await ocr_service._insert_document(document, stored, None, "u1", LABELS)
+    assert error.value.status_code == 504 and insert_env == ["url-1"]
+
+    # Échec pendant le commit (issue inconnue) : l'original est conservé
+    insert_env.clear()
+    monkeypatch.setattr(ocr_service, "new_session", lambda: _FakeSession(commit_error=ConnectionError()))
+    with pytest.raises(ConnectionError):
+        await ocr_service._insert_document(document, stored, None, "u1", LABELS)
+    assert insert_env == []
+
+    session = _FakeSession()
+    monkeypatch.setattr(ocr_service, "new_session", lambda: session)
+    assert await ocr_service._insert_document(document, stored, None, "u1", LABELS) is document
+    assert session.committed and insert_env == []
+
+
+# Test d'un échec d'insertion pendant une panne du stockage : l'erreur d'origine
+# est conservée et l'original est noté pour la purge
+async def test_insert_failure_with_storage_down(insert_env, monkeypatch):
+    async def storage_down(url):
+        raise CircuitOpenError("storage", 30)
+
+    monkeypatch.setattr(ocr_service, "delete_file_from_s3", storage_down)
+    monkeypatch.setattr(ocr_service, "new_session", lambda: _FakeSession(flush_seconds=1))
+    with pytest.raises(HTTPException) as error:
+        await ocr_service._insert_document(SimpleNamespace(id=1), SimpleNamespace(url="url-1"), None, "u1", LABELS)
+    assert error.value.status_code == 504
+    assert insert_env == ["purge:url-1"]
@@ -0,0 +1,87 @@
+# aideo/backend/tests/test_storage_policy.py
+
+import io
+import os
+import random
+
+import pytest
+from PIL import Image, ImageDraw, ImageFilter
+
+from app.services import storage_service
+from app.services.storage_service import GZIP, IDENTITY, WEBP, decode_original, encode_for_storage
+
+
+def _scan(mode="L", size=(1240, 1754)) -> Image.Image:
+    """Page scannée : fond clair, lignes de « texte »."""
+    rng = random.Random(3)
+    image = Image.new("L", size, 245)
+    draw = ImageDraw.Draw(image)
+    for y in range(80, size[1] - 80, 28):
+        x = 80
+        while x < size[0] - 200:
+            width = rng.randrange(20, 90)
+            draw.rectangle((x, y, x + width, y + 12), fill=rng.randrange(0, 60))
+            x += width + 12
+    return image.convert(mode)
+
+
+def _encode(image: Image.Image, format: str, **options) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **options)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def webp_policy(monkeypatch):
+    monkeypatch.setattr(storage_service, "STORAGE_TRANSCODE_IMAGES", "webp")
+    monkeypatch.setattr(storage_service, "STORAGE_COMPRESS_OTHER", True)
+
+
+# Test d'un scan PNG : WebP sans perte, pixels restitués à l'identique
+def test_png_scan_is_lossless(webp_policy):
+    image = _scan("L")
+    original = _encode(image, "PNG", compress_level=0)
+    stored, stored_format, metadata = encode_for_storage(original, "image/png")
+
+    assert stored_format == WEBP and len(stored) < len(original) / 5
+    assert metadata["original-mode"] == "L"
+    with Image.open(io.BytesIO(decode_original(stored, WEBP, metadata))) as restored:
+        assert restored.format == "PNG" and restored.mode == "L"
+        assert restored.tobytes() == image.tobytes()
+
+
+# Test d'une photo JPEG : WebP avec perte, restituée en JPEG de mêmes dimensions
+def test_jpeg_photo_is_transcoded(webp_policy):
+    photo = _scan("RGB").filter(ImageFilter.GaussianBlur(1))
+    original = _encode(photo, "JPEG", quality=95)
+    stored, stored_format, metadata = encode_for_storage(original, "image/jpeg")
+
+    assert stored_format == WEBP and len(stored) < len(original)
+    with Image.open(io.BytesIO(decode_original(stored, WEBP, metadata))) as restored:
+        assert restored.format == "JPEG" and restored.size == photo.size
+
+
+# Test des cas conservés tels quels (TIFF multipage, CMYK, gain insuffisant, politique désactivée)
+def test_identity_cases(webp_policy, monkeypatch):
+    # CMYK : ni les pixels ni le profil ICC ne survivent au passage en RGB
+    assert encode_for_storage(_encode(_scan("CMYK"), "TIFF"), "image/tiff")[1] == IDENTITY
+
+    pages = [_scan("L", (300, 400)), _scan("L", (300, 400))]
+    buffer = io.BytesIO()
+    pages[0].save(buffer, format="TIFF", save_all=True, append_images=pages[1:])
+    assert encode_for_storage(buffer.getvalue(), "image/tiff")[1] == IDENTITY
+
+    noise = os.urandom(50_000)
+    assert encode_for_storage(noise, "application/pdf")[1] == IDENTITY
+    assert encode_for_storage(b"pas une image", "image/png")[1] == IDENTITY
+
+    monkeypatch.setattr(storage_service, "STORAGE_TRANSCODE_IMAGES", "off")
+    assert encode_for_storage(_encode(_scan(), "PNG"), "image/png")[1] == IDENTITY
+
+
+# Test de la compression gzip des autres types : restitution à l'octet près
+def test_gzip_round_trip(webp_policy):
+    pdf = b"%PDF-1.4\n" + b"BT /F1 12 Tf (Avis d'imposition) Tj ET\n" * 2000
+    stored, stored_format, metadata = encode_for_storage(pdf, "application/pdf")
+    assert stored_format == GZIP and len(stored) < len(pdf) / 10
+    assert decode_original(stored, GZIP, metadata) == pdf
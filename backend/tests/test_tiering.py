@@ -0,0 +1,101 @@
+# aideo/backend/tests/test_tiering.py
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.resources import resources
+from app.services import storage_service, tiering_service
+from app.services.storage_service import (
+    BUCKET_NAME,
+    STORAGE_ARCHIVE_BUCKET,
+    STORAGE_ENDPOINT,
+    iter_file_chunks,
+    measure_bucket,
+    open_archive_member,
+)
+from loadtest.fakes import FakeS3Client
+
+MEMBERS = [b"a" * 100, b"b" * 250, b"c" * 40]
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    client = FakeS3Client()
+    monkeypatch.setattr(resources, "_s3_client", client)
+    client.put_object(Bucket=STORAGE_ARCHIVE_BUCKET, Key="bundles/1/paquet.bundle", Body=b"".join(MEMBERS))
+    return client
+
+
+async def _read(stored) -> bytes:
+    return b"".join([chunk async for chunk in iter_file_chunks(stored["Body"])])
+
+
+# Test de la lecture d'un original dans son paquet (entier et par plage)
+async def test_archive_member_ranges(s3):
+    stored = await open_archive_member("bundles/1/paquet.bundle", 100, 250, {"stored-format": "identity"})
+    assert await _read(stored) == MEMBERS[1]
+    assert stored["ContentLength"] == 250 and "ContentRange" not in stored
+    assert stored["Metadata"] == {"stored-format": "identity"}
+
+    # La plage est relative à l'original, pas au paquet
+    stored = await open_archive_member("bundles/1/paquet.bundle", 350, 40, {}, byte_range=(10, 19))
+    assert await _read(stored) == b"c" * 10
+    assert stored["ContentRange"] == "bytes 10-19/40"
+
+    with pytest.raises(FileNotFoundError):
+        await open_archive_member("bundles/1/absent.bundle", 0, 10, {})
+
+
+# Test d'un original déplacé entre la lecture de la fiche et celle de l'objet
+async def test_open_document_file_follows_moves(s3, monkeypatch):
+    location = SimpleNamespace(key="bundles/1/paquet.bundle", byte_offset=0, length=100, file_metadata={})
+
+    async def archived_location(document_id):
+        return location
+
+    async def current_tier(document_id):
+        return True, tiering_service.COLD
+
+    monkeypatch.setattr(tiering_service, "_archived_location", archived_location)
+    monkeypatch.setattr(tiering_service, "_current_tier", current_tier)
+
+    # Lu chaud, archivé entre-temps : la copie chaude n'existe plus
+    file_url = f"{STORAGE_ENDPOINT}/{BUCKET_NAME}/documents/1/archive.png"
+    stored = await tiering_service.open_document_file(7, file_url, None)
+    assert await _read(stored) == MEMBERS[0]
+
+    # Lu froid, restauré entre-temps : l'original est de nouveau dans le bucket chaud
+    async def restored(document_id):
+        return None
+
+    async def hot(document_id):
+        return True, None
+
+    monkeypatch.setattr(tiering_service, "_archived_location", restored)
+    monkeypatch.setattr(tiering_service, "_current_tier", hot)
+    s3.put_object(Bucket=BUCKET_NAME, Key="documents/1/archive.png", Body=b"chaud")
+    stored = await tiering_service.open_document_file(7, file_url, tiering_service.COLD)
+    assert await _read(stored) == b"chaud"
+
+
+# Test du découpage en paquets et de la résolution des consultations
+def test_chunks_and_access_resolution(monkeypatch):
+    monkeypatch.setattr(tiering_service, "TIERING_BUNDLE_BYTES", 1000)
+    rows = [SimpleNamespace(id=i, size=size) for i, size in enumerate([400, 500, 300, 2000, 10])]
+    assert [[row.id for row in chunk] for chunk in tiering_service._chunks(rows)] == [[0, 1], [2], [3], [4]]
+
+    now = datetime(2025, 6, 1, 12, 0)
+    resolution = timedelta(seconds=tiering_service.TIERING_ACCESS_RESOLUTION_SECONDS)
+    assert tiering_service.access_is_stale(None, now)
+    assert not tiering_service.access_is_stale(now - resolution / 2, now)
+    assert tiering_service.access_is_stale(now - resolution, now)
+
+
+# Test de la mesure du bucket chaud (listage par pages de 1000 clés)
+async def test_measure_bucket(s3):
+    for index in range(2500):
+        s3.put_object(Bucket=BUCKET_NAME, Key=f"documents/1/{index}.png", Body=b"x" * 10)
+    report = await measure_bucket()
+    assert report["objects"] == 2500 and report["bytes"] == 25000 and report["pages"] == 3
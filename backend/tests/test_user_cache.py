@@ -0,0 +1,65 @@
+# aideo/backend/tests/test_user_cache.py
+
+import time
+
+from app.core.database import new_session
+from app.core.user_cache import CachedUser, UserCache, user_cache
+from app.models.base_models import User
+
+
+def _user(user_id: str, is_active: bool = True) -> CachedUser:
+    return CachedUser(id=user_id, email=f"{user_id}@aideo.com", is_active=is_active)
+
+
+# Test de l'éviction LRU (taille bornée)
+def test_user_cache_lru_eviction():
+    """Teste que l'entrée la moins récemment utilisée est évincée."""
+    cache = UserCache(maxsize=2, ttl=60)
+    cache.set(_user("a"))
+    cache.set(_user("b"))
+    assert cache.get("a") is not None  # "a" devient la plus récente
+    cache.set(_user("c"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+# Test de l'expiration (TTL) et de l'invalidation
+def test_user_cache_ttl_and_invalidation():
+    """Teste l'expiration des entrées et l'invalidation explicite."""
+    cache = UserCache(maxsize=10, ttl=0.05)
+    cache.set(_user("a"))
+    cache.set(_user("b"))
+    cache.invalidate("b")
+    assert cache.get("b") is None
+
+    time.sleep(0.06)
+    assert cache.get("a") is None
+
+    stats = cache.stats()
+    assert stats["expirations"] == 1
+    assert stats["hits"] == 0
+    assert stats["hit_rate"] == 0.0
+
+
+# Test du cache désactivé (TTL = 0)
+def test_user_cache_disabled():
+    """Teste qu'un TTL nul désactive complètement le cache."""
+    cache = UserCache(maxsize=10, ttl=0)
+    cache.set(_user("a"))
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+# Test de l'invalidation au commit : une entrée remise en cache entre le flush
+# et le commit (lecture concurrente de l'ancienne ligne) est retirée
+async def test_user_cache_invalidated_on_commit(test_user):
+    async with new_session() as session:
+        user = await session.get(User, test_user)
+        user.is_active = False
+        await session.flush()
+        # Une autre requête relit la ligne encore validée et la remet en cache
+        user_cache.set(_user(test_user, is_active=True))
+        await session.commit()
+    assert user_cache.get(test_user) is None